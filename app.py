@@ -1,7 +1,12 @@
 
-from flask import Flask, request, abort
-import json
+from flask import Flask, Response, request, abort
 from modules.config_manager import config
+from modules.flex_renderer import FlexRenderer
+from modules.idempotency import EventDeduplicator
+from modules.line_client import LineMessagingClient
+from modules.metrics import metrics
+from modules.query_filters import parse_query
+from modules.webhook_queue import EventDispatcher
 
 from linebot.v3 import (
     WebhookHandler
@@ -10,13 +15,8 @@ from linebot.v3.exceptions import (
     InvalidSignatureError
 )
 from linebot.v3.messaging import (
-    Configuration,
-    ApiClient,
-    MessagingApi,
-    ReplyMessageRequest,
     TextMessage,
-    FlexMessage,
-    FlexContainer
+    FlexMessage
 )
 from linebot.v3.webhooks import (
     MessageEvent,
@@ -25,289 +25,119 @@ from linebot.v3.webhooks import (
 
 app = Flask(__name__)
 
-configuration = Configuration(access_token=config.linebot_access_token)
+line_client = LineMessagingClient(config.linebot_access_token,
+                                  host=config.line_api_host,
+                                  pool_size=config.line_pool_size,
+                                  timeout=config.line_timeout)
 handler = WebhookHandler(config.linebot_access_secret)
 
-def get_carousel_template(results):
-    contents = []
-    for result in results.values():
-        content_bubble = get_bubble_item(result)
-        contents.append(content_bubble)
-    
-    return {
-        "type": "carousel",
-        "contents": contents
-    }
+def dispatch_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
+        handle_message(event)
+    else:
+        app.logger.info(f"未處理的事件類型: {event.type}")
 
-def get_rate_contents(rate):
-    if isinstance(rate, str):
-        rate = round(float(rate), 1)
-    
-    rate_list = []
-    
-    for idx in range(1, 6):
-        url = "https://developers-resource.landpress.line.me/fx/img/"
-        url = url + "review_gold_star_28.png" if idx <= rate else url + "review_gray_star_28.png"
-        rate_list.append({
-            "type": "icon",
-            "size": "sm",
-            "url": url
-        })
-    
-    rate_list.append({
-            "type": "text",
-            "text": f"{rate}",
-            "size": "sm",
-            "color": "#999999",
-            "margin": "md",
-            "flex": 0
-    })
-    
-    return rate_list
-    
+dispatcher = EventDispatcher(dispatch_event,
+                             workers=config.webhook_workers,
+                             max_queue_size=config.webhook_queue_size)
+metrics.register_stats("webhook", dispatcher.stats)
 
-def get_bubble_item(cource_data):
-    relative = cource_data['relative']
-    if isinstance(relative, str):
-        relative = round(float(relative), 1)
-    
-    return {
-        "type": "bubble",
-        "hero": {
-            "type": "image",
-            "url": cource_data.get('image', "https://developers-resource.landpress.line.me/fx/img/01_1_cafe.png"),
-            "size": "full",
-            "size": "full",
-            "aspectRatio": "20:13",
-            "aspectMode": "cover",
-            "action": {
-                "type": "uri",
-                "uri": cource_data['link']
-            }
-        },
-        "body": {
-            "type": "box",
-            "layout": "vertical",
-            "contents": [
-                {
-                    "type": "text",
-                    "text": cource_data['cource'],
-                    "weight": "bold",
-                    "size": "md"
-                },
-                {
-                    "type": "box",
-                    "layout": "baseline",
-                    "margin": "md",
-                    "contents": get_rate_contents(cource_data['rate'])
-                },
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "margin": "lg",
-                    "spacing": "sm",
-                    "contents": [
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "sm",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "相似距離",
-                                    "color": "#AAAAAA",
-                                    "size": "xs",
-                                    "flex": 2
-                                },
-                                {
-                                    "type": "text",
-                                    "text": f"{relative}",
-                                    "wrap": True,
-                                    "color": "#666666",
-                                    "size": "sm",
-                                    "flex": 5
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "sm",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "分類",
-                                    "color": "#AAAAAA",
-                                    "size": "sm",
-                                    "flex": 1
-                                },
-                                {
-                                    "type": "text",
-                                    "text": cource_data['category'],
-                                    "wrap": True,
-                                    "color": "#666666",
-                                    "size": "sm",
-                                    "flex": 5
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "sm",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "老師",
-                                    "color": "#AAAAAA",
-                                    "size": "sm",
-                                    "flex": 1
-                                },
-                                {
-                                    "type": "text",
-                                    "text": cource_data['teacher'],
-                                    "wrap": True,
-                                    "color": "#666666",
-                                    "size": "sm",
-                                    "flex": 5
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "sm",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "總時長",
-                                    "color": "#AAAAAA",
-                                    "size": "sm",
-                                    "flex": 1
-                                },
-                                {
-                                    "type": "text",
-                                    "text": cource_data['duration'],
-                                    "wrap": True,
-                                    "color": "#666666",
-                                    "size": "sm",
-                                    "flex": 5
-                                }
-                            ]
-                        },
-                        {
-                            "type": "box",
-                            "layout": "baseline",
-                            "spacing": "sm",
-                            "contents": [
-                                {
-                                    "type": "text",
-                                    "text": "價格",
-                                    "color": "#aaaaaa",
-                                    "size": "sm",
-                                    "flex": 1
-                                },
-                                {
-                                    "type": "text",
-                                    "text": f"$ {cource_data['price']}",
-                                    "wrap": True,
-                                    "color": "#FFDD00",
-                                    "size": "sm",
-                                    "flex": 5,
-                                    "weight": "bold"
-                                }
-                            ]
-                        }
-                    ]
-                }
-            ]
-        },
-        "footer": {
-            "type": "box",
-            "layout": "vertical",
-            "spacing": "sm",
-            "contents": [
-                {
-                    "type": "button",
-                    "style": "link",
-                    "height": "sm",
-                    "action": {
-                    "type": "uri",
-                    "label": "COURCE",
-                    "uri": cource_data['link']
-                    }
-                },
-                {
-                    "type": "box",
-                    "layout": "vertical",
-                    "contents": [],
-                    "margin": "sm"
-                }
-            ],
-            "flex": 0
-        }
-    }
+deduplicator = EventDeduplicator(ttl=config.webhook_dedup_ttl,
+                                 max_size=config.webhook_dedup_size,
+                                 path=config.webhook_dedup_path)
+metrics.register_stats("webhook_dedup", deduplicator.stats)
+
+flex_renderer = FlexRenderer()
+
+#* WARMUP=1 時在啟動階段載入索引；搭配 gunicorn --preload 可讓 worker 以 copy-on-write 共用索引記憶體
+if config.warmup_on_start:
+    config.warmup()
 
 @app.route("/callback", methods=['POST'])
 def callback():
-    # get X-Line-Signature header value
-    signature = request.headers['X-Line-Signature']
+    with metrics.timer("callback"):
+        # get X-Line-Signature header value
+        signature = request.headers['X-Line-Signature']
 
-    # get request body as text
-    body = request.get_data(as_text=True)
-    app.logger.info("Request body: " + body)
+        # get request body as text
+        body = request.get_data(as_text=True)
+        app.logger.info("Request body: " + body)
 
-    # handle webhook body
-    try:
-        handler.handle(body, signature)
-    except InvalidSignatureError:
-        app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
-        abort(400)
+        # handle webhook body
+        overflow = False
+        try:
+            with metrics.timer("webhook_parse"):
+                events = handler.parser.parse(body, signature)
+            
+            for event in events:
+                #* LINE 重送的事件 (相同 webhookEventId) 在 embedding / 檢索 / 回覆之前就丟棄
+                if deduplicator.is_duplicate(event):
+                    if isinstance(event, MessageEvent):
+                        metrics.inc("webhook_duplicate_messages")      #? 省下的推薦處理次數
+                    continue
+                
+                if config.webhook_workers > 0:
+                    #* 驗簽後只入列，立即回 200，事件交由背景 worker 處理；被丟棄的事件讓重送的那一份可以處理
+                    if not dispatcher.submit(event):
+                        deduplicator.release(event)
+                        overflow = True
+                else:
+                    #* 處理失敗時回 500 讓 LINE 重送，先釋放去重紀錄，重送的那一份才不會被當成重複事件丟棄
+                    try:
+                        dispatch_event(event)
+                    except Exception:
+                        deduplicator.release(event)
+                        raise
+        except InvalidSignatureError:
+            app.logger.info("Invalid signature. Please check your channel access token/channel secret.")
+            abort(400)
+
+    #* 佇列已滿時回 503，LINE 才會重送 (需在 LINE Developers 開啟 webhook redelivery)；已入列的事件重送時會被去重
+    if overflow:
+        metrics.inc("webhook_overflow")
+        return Response("Webhook queue is full", status=503, headers={"Retry-After": "1"})
 
     return 'OK'
 
 
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
 @handler.add(MessageEvent, message=TextMessageContent)
 def handle_message(event):
-    with ApiClient(configuration) as api_client:
-        line_bot_api = MessagingApi(api_client)
-        
+    with metrics.timer("handle_message"):
         text = event.message.text.strip()
         
         #* 根據回覆內容作條件判斷
         if text == "功能":
-            reply_text = "請輸入你遇到的困難，我可以幫你做課程推薦，提問格式如下:\n請推薦 __你的問題__"
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=reply_text)]
-                )
-            )
+            reply_text = ("請輸入你遇到的困難，我可以幫你做課程推薦，提問格式如下:\n請推薦 __你的問題__\n"
+                          "可加上篩選條件，例如: 請推薦 理財 <1000元 評分>4 分類:職場技能")
+            messages = [TextMessage(text=reply_text)]
         
         elif text.startswith("請推薦") or text.startswith("Please recommand"):
             question = text.split("請推薦")[-1].strip() or text.split("Please recommand")[-1].strip()
             reply_text = f"你輸入的問題是: {question}"
             
-            result_dict = config.recommendation(question)
-            carousel_json = get_carousel_template(result_dict)
-            carousel_str = json.dumps(carousel_json)
-            
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[FlexMessage(alt_text="推薦課程",
-                                          contents=FlexContainer.from_json(carousel_str))]
-                )
-            )
+            #* 解析篩選語法 (例: 請推薦 理財 <1000元 分類:投資理財)；只有條件時以原句當作問題
+            query, filters = parse_query(question)
+            #* 時間預算從 LINE 送出事件起算 (含排隊時間)；相依服務來不及回應時改回降級結果，不會錯過 reply token
+            deadline = config.new_deadline(event.timestamp)
+            result_dict = config.recommendation(query or question, filters, deadline=deadline)
+            if result_dict:
+                with metrics.timer("flex_render"):
+                    carousel = flex_renderer.render_carousel(result_dict)
+                messages = [FlexMessage(alt_text="推薦課程", contents=carousel)]
+            else:
+                messages = [TextMessage(text="找不到符合條件的課程，請放寬價格、評分或分類條件")]
             
         else:
             reply_text = "輸入格式不符，格式如下\n請推薦 __你的問題__"
-            line_bot_api.reply_message_with_http_info(
-                ReplyMessageRequest(
-                    reply_token=event.reply_token,
-                    messages=[TextMessage(text=reply_text)]
-                )
-            )
+            messages = [TextMessage(text=reply_text)]
+        
+        with metrics.timer("line_reply"):
+            line_client.reply(event.reply_token, messages)
             
 
 if __name__ == "__main__":
@@ -0,0 +1,14 @@
+import os
+
+# === gunicorn 設定 ===
+#* 啟動: gunicorn app:app  (會自動讀取此檔)
+#* PRELOAD=1 時在 master 載入 app (搭配 WARMUP=1 預先載入索引)，fork 出的 worker 以 copy-on-write 共用唯讀索引
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+preload_app = os.getenv("PRELOAD", "0") == "1"
+
+def post_fork(server, worker):
+    from modules.config_manager import config
+    config.after_fork()
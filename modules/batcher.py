@@ -0,0 +1,105 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    # === 微批次處理：把短時間內的並發請求合併成一次批次呼叫 ===
+    #* process_batch(items) 需回傳與 items 等長、順序相同的結果 list；某筆結果為 Exception 時只有該筆失敗
+    #* workers 個執行緒各自收集並處理批次，單一批次卡住 (例如 embedding 很慢) 不會擋住後面的批次
+
+    def __init__(self, process_batch, max_batch_size=32, max_wait=0.005, workers=2):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait            #? 秒，收集批次的最長等待時間
+        self.workers = workers
+
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.abandoned = 0
+        self.failed = 0
+
+    def _ensure_started(self):
+        #* 延遲到第一次送出才啟動；fork 之後執行緒不存在，依存活數補齊
+        if len(self._threads) >= self.workers and all(t.is_alive() for t in self._threads):
+            return
+
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._run, name=f"micro-batcher-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, item, timeout=None):
+        #* timeout 秒內沒有結果時拋出 concurrent.futures.TimeoutError；尚未開始處理的請求會被取消，不再佔用批次
+        future = Future()
+        self._ensure_started()
+        self._queue.put((item, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            collected = self._collect()
+
+            #* 呼叫端已放棄 (逾時取消) 的請求直接略過
+            batch = [(item, future) for item, future in collected if future.set_running_or_notify_cancel()]
+            self.abandoned += len(collected) - len(batch)
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                logger.warning("批次處理失敗 (%d 筆): %s", len(items), e)
+                self.failed += len(items)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.failed += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "workers": len(self._threads),
+            "batches": self.batches,
+            "items": self.items,
+            "abandoned": self.abandoned,
+            "failed": self.failed,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0
+        }
@@ -0,0 +1,103 @@
+from concurrent.futures import ThreadPoolExecutor
+from modules.batcher import MicroBatcher
+from modules.build.compare_engine import FakeEmbedder
+from modules.vector_index import NumpyIndex
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+# === 微批次基準測試 (假 embedding 延遲 + NumPy 多向量檢索，不呼叫 OpenAI) ===
+#* 假 embedding 每次呼叫花 base + per_item × 筆數，模擬 embeddings API 一次送多筆的成本結構
+#* 比較關閉批次 (每個請求各自呼叫) 與不同 batch size / 等待時間 / worker 數，在各並行度下的吞吐量、p50 / p95 延遲與 embedding API 呼叫次數
+#* --slow-ratio 讓部分 embedding 呼叫額外變慢，觀察單一慢批次是否擋住其他請求 (head-of-line blocking)
+
+
+class SlowEmbedder:
+
+    def __init__(self, dim, base_ms, per_item_ms, slow_ratio=0.0, slow_ms=0.0):
+        self.embed = FakeEmbedder(dim)
+        self.base = base_ms / 1000
+        self.per_item = per_item_ms / 1000
+        self.slow_ratio = slow_ratio
+        self.slow = slow_ms / 1000
+        self.random = random.Random(0)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, texts):
+        with self.lock:
+            self.calls += 1
+            slow = self.random.random() < self.slow_ratio
+        time.sleep(self.base + self.per_item * len(texts) + (self.slow if slow else 0.0))
+        return self.embed(texts)
+
+
+def build_index(n_courses, dim):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((n_courses, dim)).astype(np.float32)
+    ids = [str(i) for i in range(n_courses)]
+    metadatas = [{"cource": f"課程 {i}"} for i in range(n_courses)]
+    return NumpyIndex(ids, embeddings, [""] * n_courses, metadatas)
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] * 1000 if values else 0.0
+
+
+def run(label, recommend, questions, concurrency, embed):
+    latencies = []
+    embed.calls = 0
+
+    def timed(question):
+        start = time.perf_counter()
+        recommend(question)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, questions))
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<26}{concurrency:>6}{len(questions) / elapsed:>10.1f}"
+          f"{percentile(latencies, 0.5):>10.1f}{percentile(latencies, 0.95):>10.1f}{percentile(latencies, 0.99):>10.1f}"
+          f"{embed.calls:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="微批次吞吐量 / 延遲基準測試")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", default="1,8,32,64")
+    parser.add_argument("--batch-sizes", default="8,32")
+    parser.add_argument("--waits-ms", default="2,5,10")
+    parser.add_argument("--workers", default="1,2,4", help="MicroBatcher 的 worker 數")
+    parser.add_argument("--courses", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--base-ms", type=float, default=40, help="每次 embedding 呼叫的固定延遲 (網路往返)")
+    parser.add_argument("--per-item-ms", type=float, default=1, help="每多一筆輸入增加的延遲")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="額外變慢的 embedding 呼叫比例")
+    parser.add_argument("--slow-ms", type=float, default=1000)
+    args = parser.parse_args()
+
+    embed = SlowEmbedder(args.dim, args.base_ms, args.per_item_ms, args.slow_ratio, args.slow_ms)
+    index = build_index(args.courses, args.dim)
+    questions = [f"我想學第 {i} 種技能" for i in range(args.requests)]
+
+    def process_batch(items):
+        return index.query(embed(items), n_results=3)["ids"]
+
+    print(f"🔄 {args.requests} 個請求，embedding {args.base_ms:.0f} ms + {args.per_item_ms:.1f} ms/筆，"
+          f"{args.courses} 門課程 ({args.dim} 維)，慢呼叫比例 {args.slow_ratio:.0%} (+{args.slow_ms:.0f} ms)\n")
+    print(f"{'模式':<24}{'並行':>5}{'req/s':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'API呼叫':>6}")
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        run("關閉批次", lambda question: process_batch([question])[0], questions, concurrency, embed)
+
+        for size in [int(s) for s in args.batch_sizes.split(",")]:
+            for wait in [float(w) for w in args.waits_ms.split(",")]:
+                for workers in [int(w) for w in args.workers.split(",")]:
+                    batcher = MicroBatcher(process_batch, max_batch_size=size, max_wait=wait / 1000, workers=workers)
+                    run(f"size={size} wait={wait:g}ms w={workers}", batcher.submit, questions, concurrency, embed)
+        print()
@@ -0,0 +1,81 @@
+from modules.build import crawler
+from modules.build.stub_sat_api import StubSatServer
+import argparse
+import time
+
+import requests
+
+# === 爬蟲基準測試 (本機 SAT API stub，不連線到 api.sat.cool) ===
+#* legacy：舊版逐門課程抓取，每門課程後 sleep(0.5)，不重用連線、不重試
+#* 新版：共用 Session + token bucket 限速 + 重試退避，依 --rates / --concurrency 組合量測
+#* 每組回報耗時、平均 / 尖峰請求速率 (stub 端實際收到)、重試次數，並確認故障注入下每門課程都有完整抓到
+
+
+def legacy_crawl(total):
+    #* 與改版前的主程式相同的請求順序與間隔
+    course_data_list, page = [], 1
+    while len(course_data_list) < total:
+        url = f"{crawler.COURSE_LIST_URL}?page={page}&limit={crawler.COURSE_PAGE_LIMIT}"
+        courses = requests.get(url, headers=crawler.HEADERS).json().get("data", {}).get("courses", [])
+        if not courses:
+            break
+        for course in courses:
+            course_id = course.get("id")
+            detail = requests.get(crawler.COURSE_DETAIL_URL.format(course_id), headers=crawler.HEADERS).json()
+            bundles = requests.get(crawler.BUNDLE_URL.format(course_id), headers=crawler.HEADERS).json()
+            course_data_list.append(crawler.build_course_data(course_id, detail.get("data", {}),
+                                                              crawler.parse_bundles(bundles.get("data", {}))))
+            if len(course_data_list) >= total:
+                break
+            time.sleep(0.5)
+        page += 1
+    return course_data_list, {"request_count": 0, "retry_count": 0}
+
+def new_crawl(total, concurrency, rate):
+    crawler.client = crawler.CrawlerClient(concurrency=concurrency, rate=rate)
+    course_data_list = crawler.crawl(total, concurrency)
+    return course_data_list, {"request_count": crawler.client.request_count, "retry_count": crawler.client.retry_count}
+
+def run(label, stub, crawl, total):
+    stub.reset()
+    start = time.perf_counter()
+    course_data_list, counts = crawl()
+    elapsed = time.perf_counter() - start
+
+    complete = len(course_data_list) == total and all(course["title"] for course in course_data_list)
+    print(f"{label:<22}{elapsed:>8.2f}{stub.requests / elapsed:>9.1f}{stub.peak_rate():>9.1f}"
+          f"{counts['retry_count']:>7}{stub.faults:>7}{'✅' if complete else '❌':>6}")
+    return complete
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="爬蟲限速 / 重試基準測試 (本機 stub)")
+    parser.add_argument("--courses", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=50, help="stub 每個請求的回應時間")
+    parser.add_argument("--rates", default=f"2,{crawler.DEFAULT_RATE:g},10", help="token bucket 速率 (req/s)，逗號分隔")
+    parser.add_argument("--concurrency", default="1,4", help="同時抓取的課程數，逗號分隔")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="新版測試時 stub 隨機失敗的比例")
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+
+    crawler.BACKOFF_BASE = 0.05             #? 縮短退避等待，讓重試次數而不是等待時間主導結果
+    stub = StubSatServer(course_count=args.courses, latency=args.latency_ms / 1000).start()
+    crawler.set_api_base(stub.url)
+    crawler.print = lambda *a, **k: None    #? 關閉逐門課程的輸出
+
+    print(f"🔄 {args.courses} 門課程，stub 延遲 {args.latency_ms:.0f} ms，新版故障率 {args.failure_rate:.0%}\n")
+    print(f"{'模式':<20}{'耗時(s)':>8}{'req/s':>9}{'尖峰':>7}{'重試':>5}{'故障':>5}{'完整':>5}")
+
+    ok = True
+    if not args.skip_legacy:
+        ok &= run("legacy sleep(0.5)", stub, lambda: legacy_crawl(args.courses), args.courses)
+
+    stub.server.failure_rate = args.failure_rate
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for rate in [float(r) for r in args.rates.split(",")]:
+            ok &= run(f"rate={rate:g} c={concurrency}", stub,
+                      lambda: new_crawl(args.courses, concurrency, rate), args.courses)
+
+    stub.stop()
+    if not ok:
+        raise SystemExit("❌ 有課程沒有完整抓到")
@@ -0,0 +1,65 @@
+from linebot.v3.messaging import FlexContainer, FlexMessage
+from modules.flex_renderer import FlexRenderer
+import argparse
+import json
+import time
+
+# === 回覆訊息建構微基準測試 (Flex carousel) ===
+#* legacy：改版前的做法，每次回覆組出 carousel dict → json.dumps → FlexContainer.from_json
+#* cold：FlexRenderer 填入預先編譯的樣板，但每次都清空卡片快取 (每門課都是第一次出現)
+#* warm：FlexRenderer 卡片快取命中 (熱門課程重複出現)
+#* send：SDK 送出前的 to_dict 序列化，三種做法都一樣，列出來對照
+
+ALT_TEXT = "推薦課程"
+
+
+def sample_results(n_courses, offset=0):
+    return {i: {"cource": f"測試課程 {offset + i}", "teacher": f"講師 {i}", "category": "投資理財",
+                "link": f"https://sat.cool/course/{offset + i}", "rate": "4.6", "duration": "3 小時 20 分鐘",
+                "price": "1200", "image": "", "relative": f"{0.3 + i / 10:.4f}"}
+            for i in range(n_courses)}
+
+def legacy_message(renderer, results):
+    carousel = {"type": "carousel", "contents": [renderer.render_bubble_dict(r) for r in results.values()]}
+    return FlexMessage(alt_text=ALT_TEXT, contents=FlexContainer.from_json(json.dumps(carousel)))
+
+def renderer_message(renderer, results):
+    return FlexMessage(alt_text=ALT_TEXT, contents=renderer.render_carousel(results))
+
+def bench(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flex 回覆訊息建構微基準測試")
+    parser.add_argument("--courses", type=int, default=3, help="每則回覆的課程數")
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    renderer = FlexRenderer()
+    results = sample_results(args.courses)
+
+    legacy, rendered = legacy_message(renderer, results), renderer_message(renderer, results)
+    if legacy.to_dict() != rendered.to_dict():
+        raise SystemExit("❌ FlexRenderer 的輸出與 legacy 不同")
+    print("✅ FlexRenderer 的輸出與 legacy 相同\n")
+
+    def cold():
+        renderer.bubbles.clear()
+        return renderer_message(renderer, results)
+
+    timings = [
+        ("legacy", bench(lambda: legacy_message(renderer, results), args.repeat)),
+        ("cold", bench(cold, args.repeat)),
+        ("warm", bench(lambda: renderer_message(renderer, results), args.repeat)),
+        ("send (to_dict)", bench(lambda: rendered.to_dict(), args.repeat)),
+    ]
+
+    print(f"{args.courses} 門課程，每種做法 {args.repeat} 次\n")
+    print(f"{'做法':<14}{'us / 則':>12}{'相對 legacy':>12}")
+    for name, us in timings:
+        print(f"{name:<16}{us:>12.1f}{timings[0][1] / us:>13.1f}x")
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from linebot.v3.messaging import ApiClient, Configuration, MessagingApi, ReplyMessageRequest, TextMessage
+from modules.build.stub_line_api import StubLineServer
+from modules.line_client import LineMessagingClient
+import argparse
+import logging
+import time
+
+# === LINE 回覆基準測試：每則訊息新建 ApiClient vs 共用連線池 (本機 LINE Messaging API stub) ===
+#* per-message：改版前的做法，每次回覆都 with ApiClient(...) 建立新的 urllib3 連線池
+#* pooled：LineMessagingClient，整個行程共用一個 ApiClient
+#* stub 以 --connect-ms 模擬每條新連線的 TCP + TLS handshake (本機沒有 TLS)，回報延遲分位數、吞吐量與每 1,000 則回覆開啟的連線數
+
+TOKEN = "bench-line-client"
+
+
+def per_message_reply(host, timeout):
+    configuration = Configuration(access_token=TOKEN, host=host)
+
+    def reply(reply_token, messages):
+        with ApiClient(configuration) as api_client:
+            MessagingApi(api_client).reply_message_with_http_info(
+                ReplyMessageRequest(reply_token=reply_token, messages=messages), _request_timeout=timeout)
+    return reply
+
+def pooled_reply(host, timeout, pool_size):
+    client = LineMessagingClient(TOKEN, host=host, pool_size=pool_size, timeout=timeout)
+    return client.reply
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] * 1000 if values else 0.0
+
+def run(label, reply, stub, replies, concurrency):
+    stub.reset()
+    messages = [TextMessage(text="推薦課程")]
+    latencies = []
+
+    def timed(i):
+        start = time.perf_counter()
+        reply(f"token-{i}", messages)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(replies)))
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<14}{concurrency:>6}{percentile(latencies, 0.5):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+          f"{percentile(latencies, 0.99):>10.1f}{replies / elapsed:>10.1f}{stub.connections * 1000 / replies:>12.0f}")
+    if stub.replies != replies:
+        raise SystemExit(f"❌ stub 只收到 {stub.replies} / {replies} 則回覆")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較每則訊息新建 ApiClient 與共用連線池的回覆延遲與連線數")
+    parser.add_argument("--replies", type=int, default=1000)
+    parser.add_argument("--concurrency", default="1,8")
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument("--reply-ms", type=float, default=5, help="stub 處理每則回覆的時間")
+    parser.add_argument("--connect-ms", type=float, default=30, help="stub 每條新連線的建立成本 (模擬 TLS handshake)")
+    parser.add_argument("--timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    logging.getLogger("urllib3").setLevel(logging.ERROR)       #? 連線池已滿時丟棄連線的警告
+    stub = StubLineServer(latency=args.reply_ms / 1000, connect_latency=args.connect_ms / 1000).start()
+
+    print(f"🔄 每種做法 {args.replies} 則回覆，stub 回覆 {args.reply_ms:.0f} ms、新連線 {args.connect_ms:.0f} ms\n")
+    print(f"{'做法':<12}{'並行':>5}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'replies/s':>10}{'連線/1000則':>9}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        run("per-message", per_message_reply(stub.url, args.timeout), stub, args.replies, concurrency)
+        run("pooled", pooled_reply(stub.url, args.timeout, max(args.pool_size, concurrency)), stub,
+            args.replies, concurrency)
+
+    stub.stop()
@@ -0,0 +1,122 @@
+from modules.build.load_test_webhook import SECRET, signature, webhook_body
+from modules.build.stub_line_api import StubLineServer
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# === 啟動基準測試：import 時間與第一則回覆的時間 ===
+#* 每次在新的子行程中 import app，再以簽章正確的 webhook 走完整流程 (同步處理) 直到本機 LINE API stub 收到回覆
+#* OpenAI embedding 以假向量取代 (固定延遲)，Chroma / NumPy 索引使用本機 chroma_db，量到的是載入與初始化成本
+#* 關閉 embedding 磁碟快取，避免前一次執行的結果讓第一則回覆偏快
+#* 模式：lazy (預設，第一則訊息才載入索引) / warmup (WARMUP=1，啟動時載入並預熱)
+#* 子行程總時間包含直譯器啟動與結束；--importtime 另外以 python -X importtime 列出 app 直接 import 中累計最久的模組
+
+MODES = {"lazy": {"WARMUP": "0"}, "warmup": {"WARMUP": "1"}}
+QUESTIONS = ["請推薦 想學習如何經營自媒體與行銷", "請推薦 有沒有適合初學者的 Python 資料分析課程"]
+
+
+def post_webhook(client, event_id, text):
+    body = webhook_body(event_id, text=text)
+    response = client.post("/callback", data=body,
+                           headers={"X-Line-Signature": signature(body), "Content-Type": "application/json"})
+    return response.status_code
+
+def run_child(embedding_ms):
+    #* 在子行程內執行：回報 import、第一則與第二則回覆的耗時
+    start = time.perf_counter()
+    import app as app_module
+    imported = time.perf_counter()
+
+    from modules.build.fault_injection import Fault, FaultyEmbeddings
+    config = app_module.config
+
+    class LazyEmbeddings:
+        #* 向量維度在索引載入後才知道，第一次呼叫時再建立假 embedding
+        def __init__(self):
+            self.embeddings = self
+
+        def create(self, model, input, **kwargs):
+            if not hasattr(self, "client"):
+                if config.index is not None:
+                    dim = config.index.matrix.shape[1]
+                else:
+                    dim = len(config.collections.get(limit=1, include=["embeddings"])["embeddings"][0])
+                self.client = FaultyEmbeddings(dim, Fault(embedding_ms / 1000, 0))
+            return self.client.create(model, input, **kwargs)
+
+    config.openai = LazyEmbeddings()
+    client = app_module.app.test_client()
+
+    first_start = time.perf_counter()
+    status = post_webhook(client, "startup-1", QUESTIONS[0])
+    first = time.perf_counter() - first_start
+
+    second_start = time.perf_counter()
+    post_webhook(client, "startup-2", QUESTIONS[1])    #? 不同問句，避免命中推薦快取
+    second = time.perf_counter() - second_start
+
+    print(json.dumps({"import": imported - start, "first": first, "second": second, "status": status}))
+
+def importtime(top):
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True, text=True)
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        if len(name) - len(name.lstrip()) == 3:     #? 只列 app 直接 import 的模組 (每層縮排 2 格)
+            rows.append((int(cumulative_us), name.strip()))
+    print(f"\n📦 累計 import 最久的模組 (python -X importtime)")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:>9.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="量測 import 時間與第一則回覆的時間")
+    parser.add_argument("--modes", default="lazy,warmup")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--embedding-ms", type=float, default=150, help="假 embedding 的延遲")
+    parser.add_argument("--importtime", type=int, default=0, help="列出累計 import 最久的前 N 個模組")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.embedding_ms)
+        sys.exit(0)
+
+    stub = StubLineServer().start()
+    #* 子行程 import app 時讀取這些設定
+    env = dict(os.environ, CHANNEL_SECRET=SECRET, CHANNEL_ACCESS_TOKEN="startup-bench", LINE_API_HOST=stub.url,
+               WEBHOOK_WORKERS="0", EMBEDDING_CACHE_PATH="", PYTHONWARNINGS="ignore")
+
+    print(f"🔄 每個模式 {args.runs} 次 (中位數)，假 embedding {args.embedding_ms:.0f} ms\n")
+    print(f"{'模式':<8}{'子行程總時間(s)':>16}{'import(s)':>12}{'第一則(ms)':>12}{'第二則(ms)':>12}")
+    for mode in args.modes.split(","):
+        runs = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-m", "modules.build.bench_startup", "--child",
+                                     "--embedding-ms", str(args.embedding_ms)],
+                                    env=dict(env, **MODES[mode]), capture_output=True, text=True)
+            total = time.perf_counter() - start
+            if output.returncode != 0:
+                raise SystemExit(f"❌ {mode} 子行程失敗: {output.stderr.strip()[-500:]}")
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            if result["status"] != 200:
+                raise SystemExit(f"❌ {mode} webhook 回應 {result['status']}")
+            runs.append(dict(result, total=total))
+
+        median = {key: statistics.median(run[key] for run in runs) for key in ("total", "import", "first", "second")}
+        print(f"{mode:<10}{median['total']:>20.2f}{median['import']:>12.2f}"
+              f"{median['first'] * 1000:>14.1f}{median['second'] * 1000:>14.1f}")
+
+    if stub.replies != 2 * args.runs * len(args.modes.split(",")):
+        raise SystemExit(f"❌ stub 只收到 {stub.replies} 則回覆")
+    stub.stop()
+
+    if args.importtime:
+        importtime(args.importtime)
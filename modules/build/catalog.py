@@ -0,0 +1,117 @@
+from urllib.parse import urlsplit
+import hashlib
+import json
+
+READ_CHUNK_SIZE = 1 << 16               #? 64 KB
+
+
+# === 串流讀取課程目錄 ===
+def is_ndjson(path: str) -> bool:
+    return path.endswith((".ndjson", ".jsonl"))
+
+def iter_courses(path: str):
+    #* 逐筆產生課程資料，不需一次把整份目錄載入記憶體
+    #* 支援 NDJSON (一行一筆) 以及一般 JSON 陣列 (增量解析)
+    with open(path, "r", encoding="utf-8") as f:
+        if is_ndjson(path):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        pos = 0
+        started = False
+        eof = False
+
+        while True:
+            #* 跳過空白、逗號與陣列起訖符號
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in ",]"
+                                         or (not started and buffer[pos] == "[")):
+                started = started or buffer[pos] == "["
+                pos += 1
+
+            if pos < len(buffer):
+                try:
+                    course, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield course
+                    pos = end
+                    continue
+
+            if eof:
+                return
+
+            chunk = f.read(READ_CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+def write_courses(path: str, courses):
+    #* 依副檔名寫成 NDJSON 或 JSON 陣列
+    with open(path, "w", encoding="utf-8") as f:
+        if is_ndjson(path):
+            for course in courses:
+                f.write(json.dumps(course, ensure_ascii=False) + "\n")
+        else:
+            json.dump(list(courses), f, ensure_ascii=False, indent=2)
+
+
+# === Chroma 分頁讀取 ===
+def iter_collection(collection, include=None, page_size: int = 5000):
+    #* 分頁讀取 collection，避免一次取回全部 metadata
+    offset = 0
+    while True:
+        page = collection.get(include=include or [], limit=page_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+# === 課程資料 → 向量資料庫文件 ===
+def course_doc_id(course: dict) -> str:
+    #* 以課程連結產生穩定 id (例: sat.cool/course/140)，不受課程在檔案中的順序影響
+    parts = urlsplit(course['link'])
+    return f"{parts.netloc}{parts.path}".rstrip("/")
+
+def build_document(course: dict) -> str:
+    #* 文字內容會拿來當作語意向量 embedding
+    return (
+        f"可成名稱: {course['title']}\n"
+        f"講師: {course['teacher']['name']}\n"
+        f"分類: {course['category']['name']}\n"
+        f"簡介: {course['intro']}"
+    )
+
+def build_lexical_fields(course: dict) -> dict:
+    #* 詞彙索引 (BM25) 的各欄位原文，欄位權重見 modules.lexical_index
+    return {
+        'title': course['title'],
+        'teacher': course['teacher']['name'],
+        'category': course['category']['name'],
+        'intro': course['intro']
+    }
+
+def build_metadata(course: dict) -> dict:
+    #* metadata 可用於搜尋與顯示結果
+    return {
+        'id': course_doc_id(course),
+        'title': course['title'],
+        'teacher': course['teacher']['name'],
+        'link': course['link'],
+        'price': course['price']['price'],
+        'rating': course['rating']['rate'],
+        'category': course['category']['name'],
+        'platform': course['platform'],
+        'duration': course['info']['duration'],
+        'image': course.get('image', "")
+    }
+
+def content_hash(document: str, metadata: dict) -> str:
+    raw = json.dumps([document, metadata], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
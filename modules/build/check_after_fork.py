@@ -0,0 +1,109 @@
+from modules.build.catalog import build_metadata, course_doc_id
+from modules.build.crawler import build_course_data, parse_bundles
+from modules.build.stub_sat_api import course_bundles, course_detail
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# === gunicorn fork 離線檢查：worker 仍會查詢額外 shard (不呼叫 OpenAI) ===
+#* RETRIEVAL_BACKEND=snapshot 搭配 EXTRA_COLLECTIONS，依 gunicorn 的順序 fork 出 worker 並呼叫 after_fork 後查詢
+#* lazy：master 沒有載入索引，worker 自行開啟 Chroma；preload：master 預熱 (PRELOAD=1 WARMUP=1) 後才 fork
+#* 查詢向量與 shard 中的一門課程相同，合併結果第一名必須來自 shard；shard 被略過時結果只剩主 collection
+#? chromadb 在 master 使用過後 fork 出的行程再開啟會卡住，建庫也在子行程完成，master 在預熱前不碰 Chroma
+
+PRIMARY = "sat_courses_openai"
+SHARD = "extra_courses"
+DIM = 16
+
+
+def catalog(rng):
+    collections = {}
+    for name, course_range in ((PRIMARY, range(1, 11)), (SHARD, range(11, 21))):
+        courses = [build_course_data(i, course_detail(i), parse_bundles(course_bundles(i))) for i in course_range]
+        embeddings = rng.normal(size=(len(courses), DIM)).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        collections[name] = (courses, embeddings)
+    return collections
+
+def build_collections(collections):
+    from chromadb import PersistentClient
+    from modules.snapshot import publish_snapshot
+
+    client = PersistentClient(path="chroma_db")
+    for name, (courses, embeddings) in collections.items():
+        collection = client.create_collection(name)
+        collection.add(ids=[course_doc_id(c) for c in courses], embeddings=embeddings.tolist(),
+                       documents=[c["title"] for c in courses], metadatas=[build_metadata(c) for c in courses])
+        if name == PRIMARY:
+            publish_snapshot(collection, "chroma_db", "v1")
+
+def in_child(func):
+    #* 在 fork 出的子行程執行 func，回傳其 JSON 結果 (子行程失敗時為 None)
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        code = 1
+        try:
+            with os.fdopen(write_fd, "w") as f:
+                json.dump(func(), f)
+            code = 0
+        finally:
+            os._exit(code)
+
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        output = f.read()
+    _, status = os.waitpid(pid, 0)
+    return json.loads(output) if status == 0 and output else None
+
+def worker(config, query):
+    #* gunicorn post_fork → after_fork，之後第一個請求才 ensure_index
+    def run():
+        config.after_fork()
+        config.ensure_index()
+        return {"ids": top_ids(config, query), "shards": [shard.available for shard in config.shards]}
+    return run
+
+def top_ids(config, embedding):
+    return config._query([embedding], config.n_results)["ids"][0]
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="檢查 fork 後的 worker 仍會查詢額外 shard")
+    parser.add_argument("--dir", default="", help="chroma_db 所在目錄 (留空使用暫存目錄)")
+    args = parser.parse_args()
+
+    os.chdir(args.dir or tempfile.mkdtemp(prefix="check_after_fork_"))
+    os.environ.update(RETRIEVAL_BACKEND="snapshot", COLLECTION_NAME=PRIMARY, EXTRA_COLLECTIONS=SHARD,
+                      LEXICAL_SEARCH="0", EMBEDDING_CACHE_PATH="", SNAPSHOT_CHECK_INTERVAL="60")
+    from modules.config_manager import Config
+
+    collections = catalog(np.random.default_rng(0))
+    check(in_child(lambda: build_collections(collections) or True), "建立主 collection 快照與 shard collection")
+    courses, embeddings = collections[SHARD]
+    expected = course_doc_id(courses[3])
+    query = embeddings[3].tolist()
+
+    # === lazy：master 只建立 Config，worker 第一個請求才載入 ===
+    config = Config()
+    result = in_child(worker(config, query))
+    check(result and all(result["shards"]) and result["ids"][0] == expected,
+          f"lazy worker 的合併結果包含 shard 課程: {result}")
+
+    # === preload：master 預熱後 fork，worker 沿用 master 載入的索引 ===
+    config.warmup()
+    check(top_ids(config, query)[0] == expected, "master 的合併結果包含 shard 課程")
+    result = in_child(worker(config, query))
+    check(result and all(result["shards"]) and result["ids"][0] == expected,
+          f"preload worker 的合併結果包含 shard 課程: {result}")
+
+    print("\n🎉 全部通過")
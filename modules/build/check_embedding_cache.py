@@ -0,0 +1,80 @@
+from modules.build.compare_engine import FakeEmbedder
+from modules.cache import EmbeddingCache
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+# === 問句向量快取離線檢查 (假 embedding 函式，不呼叫 OpenAI) ===
+#* 命中 / 未命中計數、正規化 key、跨實例 (模擬重啟或其他 gunicorn worker) 共用磁碟層、TTL 與磁碟容量上限
+
+MODEL = "fake-embedding"
+
+
+class CountingEmbedder:
+
+    def __init__(self, dim=16):
+        self.embed = FakeEmbedder(dim)
+        self.calls = 0
+        self.texts = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return self.embed(texts)
+
+
+def disk_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以假 embedding 函式檢查問句向量快取")
+    parser.add_argument("--dir", default="", help="SQLite 檔案目錄 (留空使用暫存目錄)")
+    args = parser.parse_args()
+
+    workdir = args.dir or tempfile.mkdtemp(prefix="embedding_cache_")
+    path = os.path.join(workdir, "embedding_cache.db")
+    fetch = CountingEmbedder()
+
+    # === 記憶體層：相同問句 (正規化後) 只計算一次 ===
+    cache = EmbeddingCache(path=path, max_size=8)
+    first = cache.get_or_compute_many(["我想學理財", "Python 入門", "我想學理財"], MODEL, fetch)
+    second = cache.get_or_compute_many(["我想學理財", "  python   入門 "], MODEL, fetch)
+    check(fetch.calls == 1 and fetch.texts == 2, "同一批重複問句去重，第二次全部命中不再呼叫 embedding")
+    check(second == [first[0], first[1]], "全形 / 大小寫 / 空白差異對到同一個 key")
+    check(cache.stats()["misses"] == 2 and cache.stats()["memory_hits"] >= 2, "命中 / 未命中計數正確")
+
+    # === 磁碟層：新的實例 (重啟或其他 worker) 直接讀 SQLite ===
+    restarted = EmbeddingCache(path=path, max_size=8)
+    restarted.get_or_compute("我想學理財", MODEL, lambda text: fetch([text])[0])
+    check(fetch.calls == 1 and restarted.stats()["disk_hits"] == 1, "重啟後由磁碟層命中")
+    check(restarted.get_or_compute("我想學理財", "other-model", lambda text: fetch([text])[0]) is not None
+          and fetch.calls == 2, "不同模型的向量分開快取")
+
+    # === TTL：磁碟層過期資料視為未命中，且會被清除 ===
+    ttl_path = os.path.join(workdir, "embedding_cache_ttl.db")
+    short = EmbeddingCache(path=ttl_path, ttl=0.2)
+    short.get_or_compute("英文口說", MODEL, lambda text: fetch([text])[0])
+    time.sleep(0.3)
+    reopened = EmbeddingCache(path=ttl_path, ttl=0.2)
+    calls = fetch.calls
+    reopened.get_or_compute("英文口說", MODEL, lambda text: fetch([text])[0])
+    check(fetch.calls == calls + 1 and reopened.stats()["disk_pruned"] >= 1, "磁碟層超過 TTL 重新計算並清除舊資料")
+
+    # === 容量上限：只保留最新的 disk_max_size 筆 ===
+    bounded_path = os.path.join(workdir, "embedding_cache_bounded.db")
+    bounded = EmbeddingCache(path=bounded_path, max_size=4, disk_max_size=50, prune_every=20)
+    bounded.get_or_compute_many([f"問句 {i}" for i in range(200)], MODEL, fetch)
+    check(disk_rows(bounded_path) <= 50 + 20, f"磁碟層筆數受上限控制 ({disk_rows(bounded_path)} 筆)")
+    bounded.prune()
+    check(disk_rows(bounded_path) == 50, "手動清理後剩下最新 50 筆")
+
+    print(f"\n🎉 全部通過 ({workdir})")
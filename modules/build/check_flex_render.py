@@ -0,0 +1,70 @@
+from linebot.v3.messaging import FlexMessage
+from modules.build.catalog import build_lexical_fields, build_metadata, course_doc_id
+from modules.build.crawler import build_course_data, parse_bundles
+from modules.build.stub_sat_api import course_bundles, course_detail
+from modules.config_manager import Config
+from modules.flex_renderer import FlexRenderer
+from modules.lexical_index import LexicalIndex, LexicalIndexBuilder
+from modules.popular import PopularCourses
+
+# === Flex 卡片渲染離線檢查 (不呼叫 OpenAI / Chroma) ===
+#* 向量 + 詞彙融合結果中只由詞彙檢索取得的課程、詞彙降級與熱門課程降級的結果都沒有向量距離
+#* 確認這些結果都能渲染成 FlexMessage，沒有距離的課程顯示 "-"
+
+
+def relative_texts(message):
+    #* 取出每張卡片「相似距離」欄位的文字
+    texts = []
+    for bubble in message.to_dict()["contents"]["contents"]:
+        for row in bubble["body"]["contents"][2]["contents"]:
+            label, value = row["contents"][0]["text"], row["contents"][1]["text"]
+            if label == "相似距離":
+                texts.append(value)
+    return texts
+
+def render(renderer, result_dict):
+    return FlexMessage(alt_text="推薦課程", contents=renderer.render_carousel(result_dict))
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+
+if __name__ == "__main__":
+    courses = [build_course_data(i, course_detail(i), parse_bundles(course_bundles(i))) for i in range(1, 11)]
+    builder = LexicalIndexBuilder()
+    for course in courses:
+        builder.add(course_doc_id(course), build_lexical_fields(course), build_metadata(course))
+
+    config = Config()
+    config.lexical_index = LexicalIndex.from_data(builder.data())
+    config.n_results = 3
+    renderer = FlexRenderer()
+
+    # === 融合結果：向量檢索取得課程 1、2，詞彙檢索另外取得講師 3 的課程 (課程 3、10) ===
+    vector_ids = [course_doc_id(courses[0]), course_doc_id(courses[1])]
+    vector_result = {"ids": [vector_ids],
+                     "metadatas": [[build_metadata(courses[0]), build_metadata(courses[1])]],
+                     "distances": [[0.42, 0.87]]}
+    hits = config.lexical_index.search("講師 3", 5)
+    fused = config._format_result(config._fuse(vector_result, 0, hits), 0)
+    lexical_only = [row for row in fused.values() if row["link"] not in {c["link"] for c in courses[:2]}]
+    check(len(fused) == 3 and lexical_only and all(row["relative"] == "-" for row in lexical_only),
+          f"融合結果包含只由詞彙檢索取得的課程 ({len(lexical_only)} 門)")
+
+    texts = relative_texts(render(renderer, fused))
+    check(texts.count("-") == len(lexical_only) and "0.4" in texts, f"融合結果可渲染，距離欄位: {texts}")
+
+    # === 降級回覆：詞彙檢索 / 熱門課程，全部沒有向量距離 ===
+    lexical = config._format_result(config.lexical_index.to_result(config.lexical_index.search("理財", 3)), 0)
+    check(lexical and set(relative_texts(render(renderer, lexical))) == {"-"}, "詞彙降級結果可渲染")
+
+    popular = PopularCourses([build_metadata(c) for c in courses], [c["info"]["member_count"] for c in courses])
+    fallback = config._format_result(popular.top(3), 0)
+    check(set(relative_texts(render(renderer, fallback))) == {"-"}, "熱門課程降級結果可渲染")
+
+    check(FlexRenderer.format_relative(None) == "-" and FlexRenderer.format_relative("0.46") == "0.5",
+          "距離格式：None / \"-\" 顯示 \"-\"，數字四捨五入到小數一位")
+
+    print("\n🎉 全部通過")
@@ -0,0 +1,97 @@
+from modules.build import crawler
+from modules.build.stub_sat_api import StubSatServer
+import argparse
+import time
+
+# === 增量爬蟲離線檢查 (本機 SAT API stub，支援 ETag / 304) ===
+#* 第一次全部新增 → 第二次課程內容全部 304，不請求課程組合 → 更新部分課程、下架最後一門課程後只回報這些變動
+#* → 課程組合超過 bundle_max_age 時重新確認 → 限制課程數 (--limit) 時仍依完整目錄回報下架
+#* 同時比較完整爬取與增量爬取的請求數、下載量與耗時
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(f"❌ {message}")
+    print(f"✅ {message}")
+
+def timed(crawl):
+    start = time.perf_counter()
+    result = crawl()
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以本機 stub 檢查增量爬蟲 (條件式請求)")
+    parser.add_argument("--courses", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--changed", type=int, default=3, help="第三次爬取前更新的課程數")
+    args = parser.parse_args()
+
+    stub = StubSatServer(course_count=args.courses, latency=args.latency_ms / 1000).start()
+    crawler.set_api_base(stub.url)
+    crawler.print = lambda *a, **k: None    #? 關閉逐門課程的輸出
+
+    def new_client():
+        crawler.client = crawler.CrawlerClient(concurrency=args.concurrency, rate=1000)
+        stub.reset()
+
+    # === 完整爬取 (對照組) ===
+    new_client()
+    full, full_time = timed(lambda: crawler.crawl(0, args.concurrency))
+    full_requests, full_bytes = stub.requests, stub.bytes_sent
+
+    # === 第一次增量：沒有狀態，全部新增 ===
+    new_client()
+    (courses, state, delta), _ = timed(lambda: crawler.crawl_incremental(0, args.concurrency, {}))
+    check(len(delta["added"]) == args.courses and not delta["changed"] and not delta["removed"],
+          f"第一次全部新增 ({len(delta['added'])} 門)")
+    check([c["title"] for c in courses] == [c["title"] for c in full], "第一次增量結果與完整爬取相同")
+
+    # === 第二次增量：課程內容全部 304，不再請求課程組合 ===
+    new_client()
+    (courses, state, delta), second_time = timed(lambda: crawler.crawl_incremental(0, args.concurrency, state))
+    second_requests, second_bytes = stub.requests, stub.bytes_sent
+    list_requests = -(-args.courses // crawler.COURSE_PAGE_LIMIT) + 1     #? 最後一頁空白代表目錄結束
+    check(delta["unchanged"] == args.courses and not delta["added"] and not delta["changed"], "第二次沒有任何變動")
+    check(stub.not_modified == args.courses and crawler.client.not_modified_count == args.courses,
+          f"課程內容全部回 304 ({stub.not_modified} 次)")
+    check(second_requests == list_requests + args.courses and second_requests < full_requests,
+          f"沒有請求課程組合 ({second_requests} 次請求，完整爬取 {full_requests} 次)")
+    check([c["title"] for c in courses] == [c["title"] for c in full], "沿用狀態檔的課程資料與完整爬取相同")
+
+    # === 第三次增量：更新部分課程、只更新一門課程的組合，並下架最後一門 ===
+    touched = list(range(1, args.changed + 1))
+    bundle_only = args.changed + 1
+    for course_id in touched:
+        stub.touch(course_id)
+    stub.touch_bundles(bundle_only)
+    stub.server.course_count = args.courses - 1
+
+    new_client()
+    courses, state, delta = crawler.crawl_incremental(0, args.concurrency, state)
+    check(sorted(delta["changed"]) == touched, f"只回報更新過的課程 {touched}")
+    check(delta["removed"] == [args.courses], f"回報下架課程 {args.courses}")
+    check(all("第 1 版" in c["title"] for c in courses if int(c["link"].rsplit("/", 1)[-1]) in touched),
+          "更新過的課程內容為新版本")
+    check(stub.not_modified == args.courses - 1, "未更新的課程內容、更新過課程的組合仍回 304")
+
+    # === 第四次增量：課程組合超過 bundle_max_age，全部重新確認 ===
+    new_client()
+    courses, state, delta = crawler.crawl_incremental(0, args.concurrency, state, bundle_max_age=0)
+    check(delta["changed"] == [bundle_only], f"重新確認課程組合後回報只更新組合的課程 {bundle_only}")
+    check(stub.requests == list_requests + 2 * (args.courses - 1), "每門課程都重新確認課程組合")
+
+    # === 第五次增量：--limit 只檢查前幾門課程，仍以完整目錄判斷下架 ===
+    stub.server.course_count = args.courses - 2
+    new_client()
+    courses, limited_state, delta = crawler.crawl_incremental(10, args.concurrency, state)
+    check(len(courses) == 10 and delta["unchanged"] == 10, "只檢查前 10 門課程")
+    check(delta["removed"] == [args.courses - 1], f"限制數量時仍回報下架課程 {args.courses - 1}")
+    check(len(limited_state) == args.courses - 2, "未檢查但仍在目錄中的課程保留舊狀態")
+
+    print(f"\n{'模式':<10}{'請求數':>6}{'下載(KB)':>10}{'耗時(s)':>9}")
+    print(f"{'完整':<12}{full_requests:>7}{full_bytes / 1024:>12.1f}{full_time:>9.2f}")
+    print(f"{'增量 (304)':<10}{second_requests:>9}{second_bytes / 1024:>12.1f}{second_time:>9.2f}")
+    stub.stop()
+    print("\n🎉 全部通過")
@@ -0,0 +1,137 @@
+from modules.query_filters import QueryFilters
+from modules.vector_index import NumpyIndex
+import argparse
+import time
+
+import chromadb
+import numpy as np
+
+# === 檢索後端比較：NumPy 記憶體索引 vs Chroma (合成課程目錄，不呼叫 OpenAI) ===
+#* 一致性：同一批查詢向量在兩個後端的 top-k 課程與距離 (NumPy 為精確搜尋，Chroma HNSW 為近似，以 recall@k 表示)
+#* 延遲：課程數由 30 擴大到 100k，比較單筆查詢 p50 / p95 與建索引時間；篩選條件 (價格 + 分類) 也各量一次
+
+CATEGORIES = ["投資理財", "程式設計", "語言學習", "設計", "行銷", "生活品味"]
+
+
+def synthetic_catalog(n_courses, dim, seed=0):
+    #* 以少量群中心加上雜訊產生向量，比均勻亂數更接近真實課程 embedding 的分佈
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n_courses // 50, 4), dim)).astype(np.float32)
+    embeddings = centers[rng.integers(len(centers), size=n_courses)] + 0.3 * rng.standard_normal((n_courses, dim))
+    embeddings = embeddings.astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    ids = [f"course-{i}" for i in range(n_courses)]
+    metadatas = [{"cource": f"課程 {i}", "category": CATEGORIES[i % len(CATEGORIES)],
+                  "price": int(rng.integers(0, 5000)), "rating": round(float(rng.uniform(3, 5)), 1)}
+                 for i in range(n_courses)]
+    return ids, embeddings, metadatas
+
+def synthetic_queries(embeddings, n_queries, seed=1):
+    #* 問句向量落在課程附近 (隨機課程 + 雜訊)，與實際使用時問句接近某些課程的情況相同
+    rng = np.random.default_rng(seed)
+    queries = embeddings[rng.integers(len(embeddings), size=n_queries)] + 0.05 * rng.standard_normal(
+        (n_queries, embeddings.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def build_chroma(client, ids, embeddings, metadatas, space, search_ef):
+    name = f"compare_backends_{len(ids)}_{space}"
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+    collection = client.create_collection(name, metadata={"hnsw:space": space, "hnsw:search_ef": search_ef,
+                                                          "hnsw:construction_ef": max(search_ef, 100)})
+
+    batch_size = client.get_max_batch_size()
+    for start in range(0, len(ids), batch_size):
+        end = start + batch_size
+        collection.add(ids=ids[start:end], embeddings=embeddings[start:end], metadatas=metadatas[start:end],
+                       documents=[m["cource"] for m in metadatas[start:end]])
+    return collection
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] * 1000 if values else 0.0
+
+def timed_queries(query, queries):
+    latencies, results = [], []
+    for vector in queries:
+        start = time.perf_counter()
+        results.append(query(vector))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+def parity(numpy_results, chroma_results, k):
+    #* recall@k：Chroma 取回的課程中有幾成是精確 top-k；共同課程的距離差 (兩邊距離定義相同，只差浮點誤差)
+    recalls, diffs = [], []
+    for exact, approx in zip(numpy_results, chroma_results):
+        exact_ids, approx_ids = exact["ids"][0], approx["ids"][0]
+        if not exact_ids:
+            continue
+        recalls.append(len(set(exact_ids) & set(approx_ids)) / len(exact_ids))
+        exact_distances = dict(zip(exact_ids, exact["distances"][0]))
+        diffs.extend(abs(exact_distances[doc_id] - d) for doc_id, d in zip(approx_ids, approx["distances"][0])
+                     if doc_id in exact_distances)
+    return (sum(recalls) / len(recalls) if recalls else 1.0), (max(diffs) if diffs else 0.0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較 NumPy 與 Chroma 檢索後端的一致性與延遲")
+    parser.add_argument("--sizes", default="30,1000,10000,100000", help="課程數，逗號分隔")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--space", default="l2", choices=["l2", "cosine", "ip"])
+    parser.add_argument("--search-ef", type=int, default=100, help="Chroma HNSW 搜尋寬度 (Chroma 預設 10，越大越接近精確搜尋)")
+    parser.add_argument("--min-recall", type=float, default=0.95, help="recall@k 低於此值時以錯誤結束")
+    args = parser.parse_args()
+
+    client = chromadb.EphemeralClient()
+    filters = QueryFilters([("price", "$lte", 2000), ("category", "$in", ("投資理財", "程式設計"))])
+    failures = []
+
+    print(f"🔄 {args.queries} 筆查詢，top-{args.n_results}，{args.dim} 維，space={args.space}，search_ef={args.search_ef}\n")
+    print(f"{'課程數':>8}{'後端':>8}{'建索引(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}"
+          f"{'篩選p50':>10}{'篩選p95':>10}{'recall@k':>10}{'距離差':>10}")
+
+    for size in [int(s) for s in args.sizes.split(",")]:
+        ids, embeddings, metadatas = synthetic_catalog(size, args.dim)
+        queries = synthetic_queries(embeddings, args.queries, seed=size + 1)
+
+        start = time.perf_counter()
+        collection = build_chroma(client, ids, embeddings, metadatas, args.space, args.search_ef)
+        chroma_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = NumpyIndex.from_collection(collection)
+        numpy_build = time.perf_counter() - start
+
+        numpy_latency, numpy_results = timed_queries(
+            lambda v: index.query([v], n_results=args.n_results), queries)
+        chroma_latency, chroma_results = timed_queries(
+            lambda v: collection.query(query_embeddings=[v.tolist()], n_results=args.n_results), queries)
+        numpy_filtered, numpy_filtered_results = timed_queries(
+            lambda v: index.query([v], n_results=args.n_results, filters=filters), queries)
+        chroma_filtered, chroma_filtered_results = timed_queries(
+            lambda v: collection.query(query_embeddings=[v.tolist()], n_results=args.n_results,
+                                       where=filters.where()), queries)
+
+        recall, diff = parity(numpy_results, chroma_results, args.n_results)
+        filtered_recall, filtered_diff = parity(numpy_filtered_results, chroma_filtered_results, args.n_results)
+
+        for name, build, latency, filtered in [("numpy", numpy_build, numpy_latency, numpy_filtered),
+                                                ("chroma", chroma_build, chroma_latency, chroma_filtered)]:
+            line = (f"{size:>10}{name:>10}{build:>12.2f}{percentile(latency, 0.5):>10.2f}"
+                    f"{percentile(latency, 0.95):>10.2f}{percentile(filtered, 0.5):>10.2f}{percentile(filtered, 0.95):>10.2f}")
+            if name == "chroma":
+                line += f"{min(recall, filtered_recall):>10.3f}{max(diff, filtered_diff):>10.1e}"
+            print(line)
+
+        if min(recall, filtered_recall) < args.min_recall:
+            failures.append(size)
+        client.delete_collection(collection.name)
+
+    if failures:
+        raise SystemExit(f"❌ recall@k 低於 {args.min_recall}: {failures}")
+    print("\n✅ NumPy 與 Chroma 結果一致")
@@ -0,0 +1,235 @@
+from chromadb import PersistentClient
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from itertools import combinations
+from modules.build.embedding_pipeline import OpenAIEmbedder
+from modules.cache import EmbeddingCache
+import argparse
+import hashlib
+import json
+import openai
+import os
+import time
+
+# === 檢索設定比較引擎 ===
+#* 同一個問句平行送到 N 組檢索設定 (collection / embedding 模型 / k)，回傳各自結果與耗時
+#* 也可從問句檔批次評估：各設定的延遲分佈，以及兩兩之間的 overlap@k 與排名相關係數
+
+
+class CachedEmbedder:
+    # === 經過 embedding 快取的 OpenAI 查詢向量；cache_only 時不呼叫 API，未命中直接報錯 ===
+
+    def __init__(self, model, cache=None, cache_only=False):
+        self.model = model
+        self.cache = cache
+        self.cache_only = cache_only
+        self.embedder = OpenAIEmbedder(model=model)
+
+    def _fetch(self, texts):
+        if self.cache_only:
+            raise LookupError(f"embedding 快取未命中 ({self.model}): {texts[:3]}")
+        return self.embedder(texts)
+
+    def __call__(self, texts):
+        if self.cache is None:
+            return self._fetch(texts)
+        return self.cache.get_or_compute_many(texts, self.model, self._fetch)
+
+
+class FakeEmbedder:
+    # === 離線用的假向量：字元 bigram 雜湊成固定維度，只用來量測檢索流程本身的耗時 ===
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def __call__(self, texts):
+        embeddings = []
+        for text in texts:
+            vector = [0.0] * self.dim
+            for i in range(max(len(text) - 1, 1)):
+                digest = hashlib.md5(text[i:i + 2].encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0
+            norm = sum(v * v for v in vector) ** 0.5 or 1.0
+            embeddings.append([v / norm for v in vector])
+        return embeddings
+
+
+class RetrievalConfig:
+    # === 一組檢索設定；embed 為 None 時使用 collection 自帶的 embedding function (query_texts) ===
+
+    def __init__(self, name, collection, embed=None, n_results=3):
+        self.name = name
+        self.collection = collection
+        self.embed = embed
+        self.n_results = n_results
+
+    def search(self, queries):
+        timings = {}
+        start = time.perf_counter()
+        if self.embed is None:
+            result = self.collection.query(query_texts=queries, n_results=self.n_results)
+        else:
+            embeddings = self.embed(queries)
+            timings["embedding"] = time.perf_counter() - start
+            result = self.collection.query(query_embeddings=embeddings, n_results=self.n_results)
+        timings["total"] = time.perf_counter() - start
+        return result, timings
+
+
+class CompareEngine:
+
+    def __init__(self, configs, max_workers=None):
+        self.configs = configs
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or max(len(configs), 1),
+                                           thread_name_prefix="compare")
+
+    def _run_one(self, config, queries):
+        try:
+            result, timings = config.search(queries)
+            return {"result": result, "timings": timings, "error": None}
+        except Exception as e:
+            return {"result": None, "timings": {}, "error": f"{type(e).__name__}: {e}"}
+
+    def run(self, queries):
+        #* 回傳 {設定名稱: {"result", "timings", "error"}}，各設定同時執行，總耗時約等於最慢的一組
+        if isinstance(queries, str):
+            queries = [queries]
+        futures = {config.name: self.executor.submit(self._run_one, config, queries) for config in self.configs}
+        return {name: future.result() for name, future in futures.items()}
+
+    def evaluate(self, queries):
+        #* 逐句執行 (保留每句的延遲分佈)，彙整各設定的延遲與兩兩之間的一致性
+        latencies = {config.name: [] for config in self.configs}
+        errors = {config.name: 0 for config in self.configs}
+        rankings = {config.name: [] for config in self.configs}
+
+        for query in queries:
+            outputs = self.run([query])
+            for name, output in outputs.items():
+                if output["error"]:
+                    errors[name] += 1
+                    rankings[name].append(None)
+                    continue
+                latencies[name].append(output["timings"]["total"])
+                rankings[name].append(output["result"]["ids"][0])
+
+        report = {"queries": len(queries), "configs": {}, "pairs": []}
+        for config in self.configs:
+            values = sorted(latencies[config.name])
+            report["configs"][config.name] = {
+                "k": config.n_results,
+                "errors": errors[config.name],
+                "p50_ms": percentile(values, 0.5) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "mean_ms": sum(values) / len(values) * 1000 if values else 0.0
+            }
+
+        for a, b in combinations(self.configs, 2):
+            k = min(a.n_results, b.n_results)
+            overlaps, correlations = [], []
+            for ranking_a, ranking_b in zip(rankings[a.name], rankings[b.name]):
+                if ranking_a is None or ranking_b is None:
+                    continue
+                overlaps.append(overlap_at_k(ranking_a, ranking_b, k))
+                rho = rank_correlation(ranking_a, ranking_b)
+                if rho is not None:
+                    correlations.append(rho)
+
+            report["pairs"].append({
+                "a": a.name,
+                "b": b.name,
+                "k": k,
+                "overlap_at_k": sum(overlaps) / len(overlaps) if overlaps else 0.0,
+                "rank_correlation": sum(correlations) / len(correlations) if correlations else None,
+                "correlated_queries": len(correlations)
+            })
+
+        return report
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+# === 評估指標 ===
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * (len(sorted_values) - 1) + 0.5), len(sorted_values) - 1)]
+
+def overlap_at_k(a, b, k):
+    return len(set(a[:k]) & set(b[:k])) / k if k else 0.0
+
+def rank_correlation(a, b):
+    #* 兩份結果共同出現課程的 Spearman 相關係數 (依共同課程重新排名)；共同課程少於 2 筆時無法計算
+    shared = set(a) & set(b)
+    common = [doc_id for doc_id in a if doc_id in shared]
+    n = len(common)
+    if n < 2:
+        return None
+
+    rank_b = {doc_id: i for i, doc_id in enumerate(d for d in b if d in shared)}
+    d2 = sum((i - rank_b[doc_id]) ** 2 for i, doc_id in enumerate(common))
+    return 1.0 - 6.0 * d2 / (n * (n * n - 1))
+
+
+# === 命令列：批次評估 ===
+def parse_config(spec, client, cache, cache_only, fake):
+    #* name=collection[:model[:k]]；model 為 chroma 時使用 collection 自帶的 embedding function
+    name, _, rest = spec.partition("=")
+    parts = rest.split(":")
+    model = parts[1] if len(parts) > 1 else "chroma"
+    k = int(parts[2]) if len(parts) > 2 else 3
+    collection = client.get_collection(name=parts[0])
+
+    if model == "chroma":
+        embed = None
+    elif fake:
+        sample = collection.get(limit=1, include=["embeddings"])["embeddings"]
+        embed = FakeEmbedder(len(sample[0]) if len(sample) else 1536)
+    else:
+        embed = CachedEmbedder(model, cache=cache, cache_only=cache_only)
+    return RetrievalConfig(name, collection, embed=embed, n_results=k)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    openai.api_key = os.getenv("OPAI_API_KEY")
+
+    parser = argparse.ArgumentParser(description="平行比較多組檢索設定的結果與延遲")
+    parser.add_argument("--queries", default="data/retrieval_queries.tsv", help="問句檔 (一行一句，TAB 之後的欄位會忽略)")
+    parser.add_argument("--configs", default="st=sat_courses:chroma:3,openai=sat_courses_openai:text-embedding-3-small:3",
+                        help="name=collection[:model[:k]]，以逗號分隔")
+    parser.add_argument("--chroma-dir", default="./chroma_db")
+    parser.add_argument("--embedding-cache", default="cache/embedding_cache.db", help="embedding 快取路徑 (留空關閉)")
+    parser.add_argument("--cache-only", action="store_true", help="只使用快取中的 embedding，不呼叫 API")
+    parser.add_argument("--fake-embeddings", action="store_true", help="以假向量離線量測檢索耗時")
+    parser.add_argument("--output", default="", help="另存完整報告 (JSON)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queries):
+        raise FileNotFoundError(f"找不到問句檔: {args.queries}")
+    with open(args.queries, "r", encoding="utf-8") as f:
+        queries = [line.split("\t")[0].strip() for line in f if line.strip() and not line.startswith("#")]
+
+    client = PersistentClient(path=args.chroma_dir)
+    cache = EmbeddingCache(path=args.embedding_cache) if args.embedding_cache else None
+    configs = [parse_config(spec, client, cache, args.cache_only, args.fake_embeddings)
+               for spec in args.configs.split(",") if spec.strip()]
+
+    engine = CompareEngine(configs)
+    report = engine.evaluate(queries)
+    engine.close()
+
+    print(f"🔄 {report['queries']} 筆問句，{len(configs)} 組設定\n")
+    print(f"{'設定':<16}{'k':>4}{'p50(ms)':>10}{'p95(ms)':>10}{'平均(ms)':>10}{'錯誤':>6}")
+    for name, row in report["configs"].items():
+        print(f"{name:<18}{row['k']:>4}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['mean_ms']:>10.1f}{row['errors']:>6}")
+
+    print(f"\n{'比較':<28}{'overlap@k':>10}{'排名相關':>10}")
+    for pair in report["pairs"]:
+        rho = "-" if pair["rank_correlation"] is None else f"{pair['rank_correlation']:.2f}"
+        print(f"{pair['a'] + ' vs ' + pair['b']:<30}{pair['overlap_at_k']:>10.2f}{rho:>12}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
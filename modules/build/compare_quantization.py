@@ -0,0 +1,89 @@
+from modules.vector_index import NumpyIndex
+import argparse
+import time
+
+import numpy as np
+
+# === 壓縮向量比較：float16 / int8 / 截斷維度 + 精確重排 ===
+#* 以未壓縮的 float32 精確檢索為基準，比較每筆課程的掃描記憶體、單一查詢延遲與 recall@k
+#* 可讀取既有 collection，或產生合成資料 (群聚的單位向量) 模擬大型目錄
+
+def synthetic_catalog(count, dim, clusters=200, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    matrix = centers[rng.integers(0, clusters, count)] + 0.7 * rng.standard_normal((count, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+def sample_queries(matrix, count, noise=0.3, seed=1):
+    #* 以目錄中的向量加上雜訊當作問句，近似「問句與某些課程相近但不完全相同」
+    rng = np.random.default_rng(seed)
+    dim = matrix.shape[1]
+    queries = matrix[rng.integers(0, len(matrix), count)] + noise / np.sqrt(dim) * rng.standard_normal((count, dim)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def parse_variant(spec):
+    #* dtype[@dims]，例如 int8、float16、int8@512、float32@512
+    dtype, _, dims = spec.partition("@")
+    return dtype, int(dims) if dims else None
+
+def run(index, queries, k):
+    latencies, results = [], []
+    index.query(queries[:1], n_results=k)
+    for query in queries:
+        start = time.perf_counter()
+        result = index.query(query[None, :], n_results=k)
+        latencies.append(time.perf_counter() - start)
+        results.append(result["ids"][0])
+    latencies.sort()
+    return results, latencies[int(0.5 * (len(latencies) - 1))], latencies[int(0.95 * (len(latencies) - 1))]
+
+def recall(results, baseline, k):
+    return sum(len(set(r[:k]) & set(b[:k])) / k for r, b in zip(results, baseline)) / len(baseline)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較壓縮向量 + 精確重排的記憶體、延遲與 recall")
+    parser.add_argument("--collection", default="", help="讀取既有 collection 的向量 (留空使用合成資料)")
+    parser.add_argument("--chroma-dir", default="./chroma_db")
+    parser.add_argument("--synthetic", type=int, default=50000, help="合成資料筆數")
+    parser.add_argument("--dim", type=int, default=1536, help="合成資料維度 (text-embedding-3-small 為 1536)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--variants", default="float16,int8,float32@512,int8@512,int8@256")
+    parser.add_argument("--rerank", default="1,4", help="候選倍數 (1 表示不重排，只看壓縮向量的排序)")
+    args = parser.parse_args()
+
+    if args.collection:
+        from chromadb import PersistentClient
+
+        collection = PersistentClient(path=args.chroma_dir).get_collection(name=args.collection)
+        data = collection.get(include=["embeddings"])
+        ids = data["ids"]
+        matrix = np.asarray(data["embeddings"], dtype=np.float32).reshape(len(ids), -1)
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+    else:
+        matrix = synthetic_catalog(args.synthetic, args.dim)
+        ids = [str(i) for i in range(len(matrix))]
+        space = "l2"
+
+    queries = sample_queries(matrix, args.queries)
+    empty = [""] * len(ids)
+    metas = [{}] * len(ids)
+
+    print(f"🔄 {len(ids)} 筆課程 × {matrix.shape[1]} 維，{len(queries)} 筆問句，top-{args.k} ({space})\n")
+    print(f"{'方式':<18}{'重排':>6}{'bytes/課程':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'recall@k':>10}")
+
+    baseline_index = NumpyIndex(ids, matrix, empty, metas, space=space)
+    baseline, p50, p95 = run(baseline_index, queries, args.k)
+    scan_bytes = (baseline_index.matrix.nbytes + baseline_index.sq_norms.nbytes) / len(ids)
+    print(f"{'float32 (基準)':<20}{'-':>6}{scan_bytes:>12.0f}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}{1.0:>10.3f}")
+
+    for spec in args.variants.split(","):
+        dtype, dims = parse_variant(spec)
+        for rerank in [int(r) for r in args.rerank.split(",")]:
+            index = NumpyIndex(ids, matrix, empty, metas, space=space, quantization=dtype, dimensions=dims, rerank=rerank)
+            results, p50, p95 = run(index, queries, args.k)
+            #? 原始 float32 向量只在重排時讀取候選 (snapshot 後端為 memory-mapped)，不計入掃描記憶體
+            scan_bytes = index.quantized.nbytes / len(ids)
+            print(f"{spec:<18}{rerank:>6}{scan_bytes:>12.0f}{p50 * 1000:>10.2f}{p95 * 1000:>10.2f}"
+                  f"{recall(results, baseline, args.k):>10.3f}")
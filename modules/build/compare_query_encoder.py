@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor
+from modules.build.embedding_pipeline import OpenAIEmbedder
+from modules.local_encoder import LocalEncoder
+import argparse
+import os
+import random
+import time
+import types
+
+import numpy as np
+import openai
+
+# === 查詢向量延遲 / 吞吐量比較：本機 ONNX 模型 vs 遠端 OpenAI API ===
+#* 遠端以 stub 取代 openai.embeddings.create (固定延遲 + 抖動)，只量測網路往返對服務的影響，不實際呼叫 API
+#* 單句延遲 (逐句送出)、批次吞吐量 (每次 N 句)、並行吞吐量 (多執行緒同時送出單句)
+
+def stub_embeddings(latency, jitter, dim):
+    def create(model, input, **kwargs):
+        time.sleep(latency + random.random() * jitter)
+        data = [types.SimpleNamespace(index=i, embedding=np.random.standard_normal(dim).tolist())
+                for i in range(len(input))]
+        return types.SimpleNamespace(data=data)
+    return create
+
+def load_queries(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.split("\t")[0].strip() for line in f if line.strip() and not line.startswith("#")]
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[int(0.5 * (len(latencies) - 1))] * 1000, latencies[int(0.95 * (len(latencies) - 1))] * 1000
+
+def single(encode, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        encode([query])
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+def batched(encode, queries, batch_size):
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        encode(queries[i:i + batch_size])
+    return len(queries) / (time.perf_counter() - start)
+
+def concurrent(encode, queries, threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda query: encode([query]), queries))
+    return len(queries) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較本機 ONNX 與遠端 OpenAI 查詢向量的延遲與吞吐量")
+    parser.add_argument("--model-dir", default="models/all-MiniLM-L6-v2-onnx", help="modules.build.export_onnx 的輸出目錄")
+    parser.add_argument("--queries", default="data/retrieval_queries.tsv")
+    parser.add_argument("--repeat", type=int, default=4, help="問句重複次數 (讓樣本數足夠)")
+    parser.add_argument("--remote-latency-ms", type=float, default=120, help="stub 的固定延遲")
+    parser.add_argument("--remote-jitter-ms", type=float, default=60, help="stub 的隨機抖動上限")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--threads", type=int, default=4, help="並行吞吐量測試的執行緒數")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queries):
+        raise FileNotFoundError(f"找不到問句檔: {args.queries}")
+    queries = load_queries(args.queries) * args.repeat
+
+    openai.embeddings.create = stub_embeddings(args.remote_latency_ms / 1000, args.remote_jitter_ms / 1000, 1536)
+    encoders = {"remote (stub)": OpenAIEmbedder(model="text-embedding-3-small")}
+    for quantized in (False, True):
+        encoder = LocalEncoder(args.model_dir, quantized=quantized)
+        encoder.encode(["warmup"])
+        encoders[f"local {os.path.basename(encoder.model_path)}"] = encoder.encode
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(",")]
+    print(f"🔄 {len(queries)} 筆問句，遠端 stub 延遲 {args.remote_latency_ms:.0f} + 0~{args.remote_jitter_ms:.0f} ms\n")
+    header = f"{'encoder':<26}{'p50(ms)':>9}{'p95(ms)':>9}"
+    header += "".join(f"{f'batch{size}(q/s)':>14}" for size in batch_sizes)
+    header += f"{f'{args.threads}執行緒(q/s)':>14}"
+    print(header)
+
+    for name, encode in encoders.items():
+        p50, p95 = single(encode, queries)
+        row = f"{name:<26}{p50:>9.2f}{p95:>9.2f}"
+        row += "".join(f"{batched(encode, queries, size):>14.0f}" for size in batch_sizes)
+        row += f"{concurrent(encode, queries, args.threads):>14.0f}"
+        print(row)
@@ -0,0 +1,93 @@
+from modules.config_manager import config
+import argparse
+import os
+import time
+
+# === 檢索方式比較：純向量 / 純詞彙 (BM25) / 混合 (RRF) ===
+#* 問句檔一行一筆「問句<TAB>相關關鍵字」，關鍵字以 | 分隔，出現在課名 / 講師 / 分類任一處即算相關
+#* 預設關閉 embedding 快取，讓每種方式的延遲都包含實際的 embedding 請求
+
+def load_queries(path):
+    queries = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            question, _, expected = line.rstrip("\n").partition("\t")
+            queries.append((question.strip(), [k.strip().lower() for k in expected.split("|") if k.strip()]))
+    return queries
+
+def is_relevant(row, keywords):
+    text = f"{row['cource']} {row['teacher']} {row['category']}".lower()
+    return any(k in text for k in keywords)
+
+def lexical_only(question):
+    hits = config.lexical_index.search(question, config.n_results)
+    return config._format_result(config.lexical_index.to_result(hits), 0)
+
+def vector_only(question):
+    lexical_index, config.lexical_index = config.lexical_index, None
+    try:
+        return config._recommend_batch([(question, None)])[0]
+    finally:
+        config.lexical_index = lexical_index
+
+def hybrid(question):
+    return config._recommend_batch([(question, None)])[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比較向量 / 詞彙 / 混合檢索的相關性與延遲")
+    parser.add_argument("--queries", default="data/retrieval_queries.tsv", help="問句檔 (問句<TAB>關鍵字)")
+    parser.add_argument("--modes", default="vector,lexical,hybrid")
+    parser.add_argument("--embedding-cache", action="store_true", help="保留 embedding 快取 (延遲會偏低)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queries):
+        raise FileNotFoundError(f"找不到問句檔: {args.queries}")
+
+    queries = load_queries(args.queries)
+    if not args.embedding_cache:
+        config.embedding_cache = None
+    config.semantic_cache = None
+
+    config.ensure_index()
+    if config.lexical_index is None:
+        raise FileNotFoundError("找不到詞彙索引，請先執行建庫腳本 (modules.build.embedding_openai)")
+
+    #* 計算實際送出的 embedding 請求數
+    request_embeddings = config._request_embeddings
+    embedding_calls = [0]
+
+    def counted_request_embeddings(texts, model=None):
+        embedding_calls[0] += 1
+        return request_embeddings(texts, model)
+
+    config._request_embeddings = counted_request_embeddings
+
+    runners = {"vector": vector_only, "lexical": lexical_only, "hybrid": hybrid}
+    k = config.n_results
+    print(f"🔄 {len(queries)} 筆問句，top-{k}")
+    print(f"\n{'方式':<8} | {'Hit@k':>6} | {'P@k':>6} | {'MRR':>6} | {'p50(ms)':>8} | {'p95(ms)':>8} | embedding 請求")
+
+    for mode in args.modes.split(","):
+        run = runners[mode]
+        latencies = []
+        embedding_calls[0] = 0
+        hits = precision = reciprocal_rank = 0.0
+
+        for question, keywords in queries:
+            start = time.perf_counter()
+            result_dict = run(question)
+            latencies.append(time.perf_counter() - start)
+
+            relevant = [is_relevant(row, keywords) for row in result_dict.values()]
+            hits += any(relevant)
+            precision += sum(relevant) / k
+            reciprocal_rank += next((1.0 / (rank + 1) for rank, r in enumerate(relevant) if r), 0.0)
+
+        n = len(queries)
+        latencies.sort()
+        p50, p95 = latencies[int(0.5 * (n - 1))], latencies[int(0.95 * (n - 1))]
+        print(f"{mode:<10} | {hits / n:>6.2f} | {precision / n:>6.2f} | {reciprocal_rank / n:>6.2f} | "
+              f"{p50 * 1000:>8.1f} | {p95 * 1000:>8.1f} | {embedding_calls[0]}")
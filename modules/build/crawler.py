@@ -1,5 +1,15 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from datetime import datetime, timezone
+from modules.build.catalog import write_courses
+from modules.metrics import metrics
+from urllib.parse import urlsplit
+import argparse
+import hashlib
+import os
 import requests
 import json
+import threading
 import time
 
 # === API 參數設定 ===
@@ -9,25 +19,150 @@ COURSE_LIST_URL = f"{API_BASE}/courses"
 COURSE_DETAIL_URL = f"{API_BASE}/course/{{}}"
 BUNDLE_URL = f"{API_BASE}/course_bundles?course_id={{}}"
 COURSE_PAGE_LIMIT = 9
-TOTAL_COURSE_COUNT = 30
+TOTAL_COURSE_COUNT = 30                 #? 0 表示抓取全部課程
 HEADERS = {
     "User-Agent": "Mozilla/5.0"
 }
 
+# === 連線與速率參數 ===
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5                      #? 秒，重試間隔 0.5, 1, 2 ...
+RETRY_STATUS = {429, 500, 502, 503, 504}
+REQUEST_TIMEOUT = 10
+DEFAULT_RATE = 5.0                      #? 次/秒；舊版每門課 2 個請求 + sleep(0.5)，最快約 4 次/秒，預設不低於舊版
+BUNDLE_MAX_AGE = 7 * 86400              #? 秒，增量爬蟲在課程內容未變動時，多久重新確認一次課程組合
+
+def set_api_base(api_base: str):
+    #* 可指向本機 stub server 做離線測試
+    global API_BASE, COURSE_LIST_URL, COURSE_DETAIL_URL, BUNDLE_URL
+    API_BASE = api_base.rstrip("/")
+    COURSE_LIST_URL = f"{API_BASE}/courses"
+    COURSE_DETAIL_URL = f"{API_BASE}/course/{{}}"
+    BUNDLE_URL = f"{API_BASE}/course_bundles?course_id={{}}"
+
+class TokenBucket:
+    # === Token bucket 限速：平均 rate 次/秒，允許 burst 次突發 ===
+    
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class CrawlerClient:
+    # === 共用 Session (連線池) + 限速 + 每個 host 併發上限 + 重試退避 ===
+    
+    def __init__(self, concurrency: int = 1, rate: float = DEFAULT_RATE, per_host: int = None):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(concurrency * 2, 10))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        self.bucket = TokenBucket(rate, burst=concurrency)
+        self.per_host = per_host or concurrency
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        
+        self.request_count = 0
+        self.retry_count = 0
+        self.not_modified_count = 0
+        self.bytes_received = 0
+    
+    def _host_slot(self, url: str):
+        host = urlsplit(url).netloc
+        with self.host_lock:
+            if host not in self.host_slots:
+                self.host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return self.host_slots[host]
+    
+    def get(self, url: str, headers: dict = None):
+        for attempt in range(MAX_RETRIES + 1):
+            self.bucket.acquire()
+            try:
+                with self._host_slot(url):
+                    self.request_count += 1
+                    response = self.session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException:
+                if attempt == MAX_RETRIES:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                    self.bytes_received += len(response.content)
+                    if response.status_code == 304:
+                        self.not_modified_count += 1
+                    return response
+                
+                retry_after = response.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    self.retry_count += 1
+                    time.sleep(int(retry_after))
+                    continue
+            
+            self.retry_count += 1
+            time.sleep(BACKOFF_BASE * (2 ** attempt))
+    
+    def get_json(self, url: str):
+        return self.get(url).json()
+    
+    def get_json_conditional(self, url: str, validators: dict):
+        #* 帶 If-None-Match / If-Modified-Since，304 時回傳 (None, 原 validators)
+        headers = {}
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
+        
+        response = self.get(url, headers=headers)
+        if response.status_code == 304:
+            return None, validators
+        
+        return response.json(), {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+
+client = CrawlerClient()
+
 def fetch_course_list(page: int, limit: int):
     url = f"{COURSE_LIST_URL}?page={page}&limit={limit}"
-    response = requests.get(url, headers=HEADERS)
-    return response.json().get("data", [])
+    with metrics.timer("fetch_course_list"):
+        return client.get_json(url).get("data", [])
 
 def fetch_course_detail(course_id: int):
     url = COURSE_DETAIL_URL.format(course_id)
-    response = requests.get(url, headers=HEADERS)
-    return response.json().get("data", {})
+    with metrics.timer("fetch_course_detail"):
+        return client.get_json(url).get("data", {})
 
 def fetch_course_bundles(course_id: int):
     url = BUNDLE_URL.format(course_id)
-    response = requests.get(url, headers=HEADERS)
-    return response.json().get("data", {})
+    with metrics.timer("fetch_course_bundles"):
+        return client.get_json(url).get("data", {})
+
+def fetch_course_detail_conditional(course_id: int, validators: dict):
+    with metrics.timer("fetch_course_detail"):
+        data, validators = client.get_json_conditional(COURSE_DETAIL_URL.format(course_id), validators)
+    return (None if data is None else data.get("data", {})), validators
+
+def fetch_course_bundles_conditional(course_id: int, validators: dict):
+    with metrics.timer("fetch_course_bundles"):
+        data, validators = client.get_json_conditional(BUNDLE_URL.format(course_id), validators)
+    return (None if data is None else data.get("data", {})), validators
 
 def parse_bundles(data):
     if not data:
@@ -70,69 +205,214 @@ def calc_duration(duration_sec):
     hour, minite = int(minite / 60), int(minite % 60)
     return f"{hour} 小時 {minite} 分鐘"
     
-if __name__ == '__main__':
-    # === 儲存課程資料 ===
-    course_data_list = []
+def build_course_data(course_id: int, detail: dict, bundles_data: list):
+    dutation_str = calc_duration(detail.get("info", {}).get("duration", 0))
+    expired_str  = calc_duration(detail.get("info", {}).get("expired_time", None))
     
-    # === 開始爬蟲 ===
+    return {
+        "title": detail.get("name", ""),
+        "teacher": {
+                "name":  detail.get("teacher", {}).get("nick_name", ""),
+                "brief": detail.get("teacher", {}).get("brief", "")
+            },
+        "platform": "SAT知識衛星",
+        "link": f"https://sat.cool/course/{course_id}",
+        "category": detail.get("category", {}),             #? name, slug
+        "intro": detail.get("info", {}).get("description", "").strip(),
+        "info": {
+                "chapter_count": detail.get("info", {}).get("chapter_count", 0),
+                "duration": dutation_str,
+                "expired_time": expired_str,
+                "member_count": detail.get("info", {}).get("member_count", 0)
+            },
+        "price": {
+                "original": detail.get("main_project", {}).get("original_price", 0),
+                "price": detail.get("main_project", {}).get("sale_price", 0)
+            },
+        "rating": {
+                "rate": detail.get("rate", 0),
+                "rate_contents": detail.get("rate_contents", []),
+                "rate_count": detail.get("rate_count", 0)
+            },
+        "image": detail.get("images", {}).get("seo_cover", ""),
+        "bundles": bundles_data
+    }
+
+def crawl_course(course_id: int, request_pool: ThreadPoolExecutor):
+    #* 同一門課的 detail 與 bundles 平行抓取
+    bundles_future = request_pool.submit(fetch_course_bundles, course_id)
+    detail = fetch_course_detail(course_id)
+    bundles_data = parse_bundles(bundles_future.result())
+    
+    course_data = build_course_data(course_id, detail, bundles_data)
+    print("Crawler course: {} -- Done".format(detail.get("name", "")))
+    return course_data
+
+def list_course_ids(total: int):
+    #* 回傳 (course_ids, 是否已列出完整目錄)；total 為 0 時抓到列表結束為止
+    course_ids = []
     page = 1
     
-    while len(course_data_list) < TOTAL_COURSE_COUNT:
+    while not total or len(course_ids) < total:
         course_dict = fetch_course_list(page, COURSE_PAGE_LIMIT)
+        courses = course_dict.get('courses', [])
+        if not courses:
+            return course_ids, True
         
-        for course in course_dict.get('courses', []):
-            course_id = course.get("id")
-            detail = fetch_course_detail(course_id)
-            
-            bundles = fetch_course_bundles(course_id)
-            bundles_data = parse_bundles(bundles)
-            
-            dutation_str = calc_duration(detail.get("info", {}).get("duration", 0))
-            expired_str  = calc_duration(detail.get("info", {}).get("expired_time", None))
-            
-            course_data = {
-                "title": detail.get("name", ""),
-                "teacher": {
-                        "name":  detail.get("teacher", {}).get("nick_name", ""),
-                        "brief": detail.get("teacher", {}).get("brief", "")
-                    },
-                "platform": "SAT知識衛星",
-                "link": f"https://sat.cool/course/{course_id}",
-                "category": detail.get("category", {}),             #? name, slug
-                "intro": detail.get("info", {}).get("description", "").strip(),
-                "info": {
-                        "chapter_count": detail.get("info", {}).get("chapter_count", 0),
-                        "duration": dutation_str,
-                        "expired_time": expired_str,
-                        "member_count": detail.get("info", {}).get("member_count", 0)
-                    },
-                "price": {
-                        "original": detail.get("main_project", {}).get("original_price", 0),
-                        "price": detail.get("main_project", {}).get("sale_price", 0)
-                    },
-                "rating": {
-                        "rate": detail.get("rate", 0),
-                        "rate_contents": detail.get("rate_contents", []),
-                        "rate_count": detail.get("rate_count", 0)
-                    },
-                "image": detail.get("images", {}).get("seo_cover", ""),
-                "bundles": bundles_data
-            }
-            
-            course_data_list.append(course_data)
-            print("Crawler course: {} -- Done".format(detail.get("name", "")))
-            
-            if len(course_data_list) >= TOTAL_COURSE_COUNT:
+        for course in courses:
+            course_ids.append(course.get("id"))
+            if total and len(course_ids) >= total:
                 break
-            
-            time.sleep(0.5)  # 避免過度請求
         
         page += 1
+    
+    return course_ids, False
+
+def crawl(total: int, concurrency: int):
+    course_ids, _ = list_course_ids(total)
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as course_pool, \
+         ThreadPoolExecutor(max_workers=concurrency) as request_pool:
+        futures = [course_pool.submit(crawl_course, course_id, request_pool) for course_id in course_ids]
+        return [f.result() for f in futures]
+
+# === 增量爬蟲 ===
+def content_hash(course_data: dict):
+    raw = json.dumps(course_data, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def load_state(path: str):
+    if not os.path.exists(path):
+        return {}
+    
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_state(path: str, state: dict):
+    #* 先寫暫存檔再 rename，避免中途失敗留下壞掉的狀態檔
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def crawl_course_incremental(course_id: int, entry: dict, bundle_max_age: float):
+    #* 先以條件式請求抓課程內容：304 時直接沿用狀態檔中的課程資料，不再請求課程組合
+    #* 課程組合只在課程內容有變動，或距離上次確認超過 bundle_max_age 秒時才重新確認 (一樣是條件式請求)
+    entry = dict(entry or {})
+    record = entry.get("record")
+    now = time.time()
+    
+    detail, detail_validators = fetch_course_detail_conditional(course_id,
+                                                                entry.get("detail", {}) if record else {})
+    bundles = None
+    if detail is not None or now - entry.get("bundles_checked_at", 0) >= bundle_max_age:
+        bundles, entry["bundles"] = fetch_course_bundles_conditional(course_id,
+                                                                     entry.get("bundles", {}) if record else {})
+        entry["bundles_checked_at"] = now
+    
+    if detail is None and bundles is None:
+        status = "unchanged"
+    else:
+        if detail is None:
+            course_data = dict(record, bundles=parse_bundles(bundles))
+        elif bundles is None:
+            course_data = build_course_data(course_id, detail, record["bundles"])
+        else:
+            course_data = build_course_data(course_id, detail, parse_bundles(bundles))
+        
+        new_hash = content_hash(course_data)
+        if record is None:
+            status = "added"
+        elif new_hash != entry.get("hash"):
+            status = "changed"
+        else:
+            status = "unchanged"
+        
+        entry["record"] = course_data
+        entry["hash"] = new_hash
+    
+    entry["detail"] = detail_validators
+    entry["last_seen"] = datetime.now(timezone.utc).isoformat()
+    
+    if status != "unchanged":
+        print("Crawler course: {} -- {}".format(entry["record"].get("title", ""), status))
+    return status, entry
+
+def crawl_incremental(total: int, concurrency: int, state: dict, bundle_max_age: float = BUNDLE_MAX_AGE):
+    #* 一律列出完整目錄 (列表每頁 COURSE_PAGE_LIMIT 門，請求數少) 才能判斷下架；total 只限制重新確認內容的課程數
+    listed, _ = list_course_ids(0)
+    course_ids = listed[:total] if total else listed
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as course_pool:
+        futures = {
+            course_id: course_pool.submit(crawl_course_incremental, course_id, state.get(str(course_id)), bundle_max_age)
+            for course_id in course_ids
+        }
+        results = {course_id: f.result() for course_id, f in futures.items()}
+    
+    delta = {"added": [], "changed": [], "removed": [], "unchanged": 0}
+    new_state = {}
+    for course_id, (status, entry) in results.items():
+        new_state[str(course_id)] = entry
+        if status == "unchanged":
+            delta["unchanged"] += 1
+        else:
+            delta[status].append(course_id)
+    
+    #* 目錄中已不存在的課程為下架；仍在目錄中但超過 total 沒有檢查的課程保留舊狀態
+    listed_keys = {str(course_id) for course_id in listed}
+    for course_id, entry in state.items():
+        if course_id in new_state:
+            continue
+        if course_id in listed_keys:
+            new_state[course_id] = entry
+        else:
+            delta["removed"].append(int(course_id) if course_id.isdigit() else course_id)
+    
+    course_data_list = [results[course_id][1]["record"] for course_id in course_ids]
+    return course_data_list, new_state, delta
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SAT 知識衛星課程爬蟲")
+    parser.add_argument("--concurrency", type=int, default=1, help="同時抓取的課程數")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="每秒最多請求數 (token bucket)")
+    parser.add_argument("--per-host", type=int, default=None, help="每個 host 的併發上限 (預設同 concurrency)")
+    parser.add_argument("--limit", type=int, default=TOTAL_COURSE_COUNT, help="抓取課程數量")
+    parser.add_argument("--api-base", default=API_BASE, help="API 位址，可指向本機 stub server")
+    parser.add_argument("--output", default="data/sat_courses.json", help="輸出檔，副檔名 .ndjson 時寫成一行一筆")
+    parser.add_argument("--incremental", action="store_true", help="使用條件式請求，只重抓有變動的課程")
+    parser.add_argument("--state", default="data/crawl_state.json", help="增量爬蟲狀態檔")
+    parser.add_argument("--delta", default="data/sat_courses_delta.json", help="增量爬蟲變動清單")
+    parser.add_argument("--bundle-max-age", type=float, default=BUNDLE_MAX_AGE / 3600,
+                        help="增量爬蟲：課程內容未變動時，課程組合多久 (小時) 重新確認一次")
+    args = parser.parse_args()
+    
+    set_api_base(args.api_base)
+    client = CrawlerClient(concurrency=args.concurrency, rate=args.rate, per_host=args.per_host)
+    
+    # === 開始爬蟲 ===
+    start = time.time()
+    if args.incremental:
+        state = load_state(args.state)
+        course_data_list, state, delta = crawl_incremental(args.limit, args.concurrency, state,
+                                                           bundle_max_age=args.bundle_max_age * 3600)
+    else:
+        course_data_list = crawl(args.limit, args.concurrency)
+    elapsed = time.time() - start
 
     # === 儲存為 JSON 檔案 ===
-    with open("data/sat_courses.json", "w", encoding="utf-8") as f:
-        json.dump(course_data_list, f, ensure_ascii=False, indent=2)
+    write_courses(args.output, course_data_list)
         
-    print(f"✅ 已成功儲存 {len(course_data_list)} 筆課程資料至 sat_courses.json")
+    print(f"✅ 已成功儲存 {len(course_data_list)} 筆課程資料至 {args.output}")
+    
+    if args.incremental:
+        delta["generated_at"] = datetime.now(timezone.utc).isoformat()
+        save_state(args.state, state)
+        with open(args.delta, "w", encoding="utf-8") as f:
+            json.dump(delta, f, ensure_ascii=False, indent=2)
         
-        
\ No newline at end of file
+        print(f"🔁 新增 {len(delta['added'])}、變更 {len(delta['changed'])}、下架 {len(delta['removed'])}、"
+              f"未變動 {delta['unchanged']} 筆 (304 回應 {client.not_modified_count} 次)")
+    print(f"⏱️ 耗時 {elapsed:.2f} 秒，共 {client.request_count} 次請求 (重試 {client.retry_count} 次)，"
+          f"{client.request_count / max(elapsed, 1e-9):.1f} req/s，下載 {client.bytes_received / 1024:.1f} KB")
+    print(metrics.summary())
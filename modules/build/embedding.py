@@ -1,62 +1,40 @@
 
 from chromadb import PersistentClient
-import json
+from modules.catalog_version import bump_version, new_version
+from modules.build.catalog import build_document, build_lexical_fields, build_metadata, course_doc_id, iter_collection, iter_courses
+from modules.build.embedding_pipeline import chunked, encode_sentence_transformer
+from modules.lexical_index import LexicalIndexBuilder, lexical_index_path
+from modules.popular import PopularCoursesBuilder, popular_courses_path
+from modules.metrics import metrics
+from modules.snapshot import publish_snapshot, read_manifest
+import argparse
 import os
 from sentence_transformers import SentenceTransformer
-import sys
 import time
 
 if __name__ == "__main__":
-    course_file = "data/sat_courses.json"
     chroma_dir  = "./chroma_db"
     collection_name = "sat_courses" 
     
-    # === Step 0: 可選參數 --force-rebuild 支援 ===
-    force_rebuild = "--force-rebuild" in sys.argv
+    # === Step 0: 可選參數 ===
+    parser = argparse.ArgumentParser(description="建立 SentenceTransformer 向量資料庫")
+    parser.add_argument("--catalog", default="data/sat_courses.json", help="課程目錄 (JSON 陣列或 NDJSON)")
+    parser.add_argument("--force-rebuild", action="store_true", help="刪除舊 collection 後重建")
+    parser.add_argument("--batch-size", type=int, default=64, help="encode 批次大小")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="每次編碼並寫入的文件數")
+    parser.add_argument("--processes", type=int, default=1, help="多行程編碼的行程數")
+    args = parser.parse_args()
     
-    # === Step 1: 載入課程 JSON 檔 ===
+    course_file = args.catalog
+    force_rebuild = args.force_rebuild
+    
+    # === Step 1: 確認課程目錄檔 ===
     if not os.path.exists(course_file):
         raise FileNotFoundError(f"找不到課程資料檔案: {course_file}")
     
-    with open(course_file, "r", encoding="utf-8") as f:
-        courses = json.load(f)
-    
     start = time.time()
     
-    # === Step 2: 提取文字內容與 metadata ===
-    documents = []
-    metadatas = []
-    ids = []
-    for i, course in enumerate(courses):
-        #* 文字內容會拿來當作語意向量 embedding
-        content = (
-            f"可成名稱: {course['title']}\n"
-            f"講師: {course['teacher']['name']}\n"
-            f"分類: {course['category']['name']}\n"
-            f"簡介: {course['intro']}"
-        )
-        documents.append(content)
-        
-        #* metadata 可用於搜尋與顯示結果
-        metadatas.append({
-            'id': i,
-            'title': course['title'],
-            'teacher': course['teacher']['name'],
-            'link': course['link'],
-            'price': course['price']['price'],
-            'rating': course['rating']['rate'],
-            'category': course['category']['name'],
-            'platform': course['platform']
-        })
-    
-    # ✅ 自動生成唯一 ID
-    ids = [str(i) for i in range(len(documents))]
-
-    # === Step 3. 建立文本向量 ===
-    model = SentenceTransformer("all-MiniLM-L6-v2")     #? 小型快模型
-    embeddings = model.encode(documents, show_progress_bar=True)
-    
-    # === Step 4. 初始化 Chroma 向量資料庫 ===
+    # === Step 2. 初始化 Chroma 向量資料庫 ===
     chroma_client = PersistentClient(path=chroma_dir)
     
     if force_rebuild:
@@ -71,32 +49,64 @@ if __name__ == "__main__":
         collection = chroma_client.create_collection(name=collection_name)
         print(f"✅ 建立新 collection: {collection_name}")
 
-    # === Step 5. 新增資料 (避免重複)
-    existing_ids = set(collection.get()["ids"])
-    new_docs   = []
-    new_ids    = []
-    new_metas  = []
-    new_embeds = []
+    # === Step 3. 串流讀取課程並過濾已存在的資料 (避免重複編碼) ===
+    existing_ids = set()
+    for page in iter_collection(collection):
+        existing_ids.update(page["ids"])
+    
+    lexical = LexicalIndexBuilder()
+    popular = PopularCoursesBuilder()
+    seen_ids = set()
     
-    for doc, meta, embed, doc_id in zip(documents, metadatas, embeddings, ids):
-        if doc_id not in existing_ids:
-            new_docs.append(doc)
-            new_ids.append(doc_id)
-            new_metas.append(meta)
-            new_embeds.append(embed)
-            
-    if new_docs:
-        collection.add(
-            documents=new_docs,
-            embeddings=new_embeds,
-            metadatas=new_metas,
-            ids=new_ids
-        )
-        print(f"✅ 新增 {len(new_docs)} 筆資料")
-        
+    def new_items():
+        for course in iter_courses(course_file):
+            doc_id = course_doc_id(course)
+            seen_ids.add(doc_id)
+            meta = build_metadata(course)
+            lexical.add(doc_id, build_lexical_fields(course), meta)
+            popular.add(meta, course['info'].get('member_count'))
+            if doc_id not in existing_ids:
+                yield doc_id, build_document(course), meta
+    
+    # === Step 4. 分塊建立文本向量並寫入 ===
+    model = SentenceTransformer("all-MiniLM-L6-v2")     #? 小型快模型
+    added = 0
+    
+    for chunk, embeddings in encode_sentence_transformer(model, chunked(new_items(), args.chunk_size),
+                                                         batch_size=args.batch_size,
+                                                         processes=args.processes):
+        with metrics.timer("chroma_add"):
+            collection.add(
+                ids=[item[0] for item in chunk],
+                documents=[item[1] for item in chunk],
+                metadatas=[item[2] for item in chunk],
+                embeddings=[e.tolist() for e in embeddings]
+            )
+        added += len(chunk)
+    
+    #* 目錄中已不存在的課程 (包含舊版以序號 "0".."N" 當 id 寫入的資料) 一併刪除，避免同一門課重複出現
+    removed_ids = list(existing_ids - seen_ids)
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+    
+    if added or removed_ids:
+        print(f"✅ 新增 {added} 筆、刪除 {len(removed_ids)} 筆資料")
     else:
         print("所有資料已存在，未新增")
     
-    # === Step 6: 儲存資料庫到磁碟 ===
+    lexical.save(lexical_index_path(chroma_dir, collection_name))
+    print(f"🔤 已寫入詞彙索引: {len(lexical.ids)} 筆課程")
+    popular.save(popular_courses_path(chroma_dir, collection_name))     #? 相依服務故障時的降級回覆
+    
+    # === 有變動 (或尚未發佈過) 時發佈索引快照，再更新目錄版本；服務端 (snapshot 後端) 會自動切換 ===
+    if added or removed_ids or force_rebuild or read_manifest(chroma_dir, collection_name) is None:
+        version = new_version()
+        manifest = publish_snapshot(collection, chroma_dir, version, lexical=lexical)
+        print(f"📦 已發佈索引快照: {manifest['path']} ({manifest['count']} 筆課程)")
+        bump_version(chroma_dir, collection_name, version)
+        print(f"🏷️ 目錄版本已更新: {version}")
+    
+    # === Step 5: 儲存資料庫到磁碟 ===
     end = time.time()
-    print(f"✅ 向量資料庫已儲存到 {chroma_dir}，耗時: {end - start:.2f} 秒")
\ No newline at end of file
+    print(f"✅ 向量資料庫已儲存到 {chroma_dir}，耗時: {end - start:.2f} 秒")
+    print(metrics.summary())
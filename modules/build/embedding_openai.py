@@ -1,10 +1,16 @@
 
 from chromadb import PersistentClient
 from dotenv import load_dotenv
-import json
+from modules.catalog_version import bump_version, new_version
+from modules.build.catalog import build_document, build_lexical_fields, build_metadata, content_hash, course_doc_id, iter_collection, iter_courses
+from modules.build.embedding_pipeline import OpenAIEmbedder, embed_stream, make_batches
+from modules.lexical_index import LexicalIndexBuilder, lexical_index_path
+from modules.popular import PopularCoursesBuilder, popular_courses_path
+from modules.metrics import metrics
+from modules.snapshot import publish_snapshot, read_manifest
+import argparse
 import os
 import openai
-import sys
 import time
 
 # 讀取 .env 檔案
@@ -13,60 +19,27 @@ load_dotenv()
 # 初始化 OpenAI API
 openai.api_key = os.getenv("OPAI_API_KEY")
 
-# 查詢 OpenAI embedding
-def get_openai_embedding(text: str) -> list:
-    response = openai.embeddings.create(
-        model="text-embedding-3-small",  # 或改成 text-embedding-ada-002
-        input=text
-    )
-    return response.data[0].embedding
-
 if __name__ == "__main__":
-    course_file = "data/sat_courses.json"
     chroma_dir = "./chroma_db"
     collection_name = "sat_courses_openai"
-
-    force_rebuild = "--force-rebuild" in sys.argv
+    embedding_model = "text-embedding-3-small"     #? 或改成 text-embedding-ada-002
+
+    parser = argparse.ArgumentParser(description="建立 OpenAI embedding 向量資料庫")
+    parser.add_argument("--catalog", default="data/sat_courses.json", help="課程目錄 (JSON 陣列或 NDJSON)")
+    parser.add_argument("--force-rebuild", action="store_true", help="刪除舊 collection 後重建")
+    parser.add_argument("--batch-tokens", type=int, default=50000, help="每批次 token 預算")
+    parser.add_argument("--batch-size", type=int, default=256, help="每批次最多文件數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時送出的批次數")
+    args = parser.parse_args()
+    
+    course_file = args.catalog
+    force_rebuild = args.force_rebuild
 
     if not os.path.exists(course_file):
         raise FileNotFoundError(f"找不到課程資料檔案: {course_file}")
 
-    with open(course_file, "r", encoding="utf-8") as f:
-        courses = json.load(f)
-
     start = time.time()
 
-    documents = []
-    metadatas = []
-    ids = []
-
-    for i, course in enumerate(courses):
-        content = (
-            f"可成名稱: {course['title']}\n"
-            f"講師: {course['teacher']['name']}\n"
-            f"分類: {course['category']['name']}\n"
-            f"簡介: {course['intro']}"
-        )
-        documents.append(content)
-        metadatas.append({
-            'id': i,
-            'title': course['title'],
-            'teacher': course['teacher']['name'],
-            'link': course['link'],
-            'price': course['price']['price'],
-            'rating': course['rating']['rate'],
-            'category': course['category']['name'],
-            'platform': course['platform'],
-            'duration': course['info']['duration'],
-            'image': course.get('image', "")
-        })
-
-    ids = [str(i) for i in range(len(documents))]
-
-    # === 產生 OpenAI Embedding ===
-    print(f"🔄 正在使用 OpenAI 建立 {len(documents)} 筆向量...")
-    embeddings = [get_openai_embedding(doc) for doc in documents]
-
     # === 初始化 Chroma 向量資料庫 ===
     chroma_client = PersistentClient(path=chroma_dir)
 
@@ -82,30 +55,74 @@ if __name__ == "__main__":
         collection = chroma_client.create_collection(name=collection_name)
         print(f"✅ 建立新 collection: {collection_name}")
 
-    # === 避免重複新增 ===
-    existing_ids = set(collection.get()["ids"])
-    new_docs = []
-    new_ids = []
-    new_metas = []
-    new_embeds = []
-
-    for doc, meta, embed, doc_id in zip(documents, metadatas, embeddings, ids):
-        if doc_id not in existing_ids:
-            new_docs.append(doc)
-            new_ids.append(doc_id)
-            new_metas.append(meta)
-            new_embeds.append(embed)
-
-    if new_docs:
-        collection.add(
-            documents=new_docs,
-            embeddings=new_embeds,
-            metadatas=new_metas,
-            ids=new_ids
-        )
-        print(f"✅ 新增 {len(new_docs)} 筆資料")
-    else:
-        print("所有資料已存在，未新增")
+    # === 讀取現有內容 hash (分頁讀取，只保留 id → hash) ===
+    existing_hashes = {}
+    for page in iter_collection(collection, include=["metadatas"]):
+        for doc_id, meta in zip(page["ids"], page["metadatas"]):
+            existing_hashes[doc_id] = (meta or {}).get('content_hash')
+    
+    seen_ids = set()
+    counts = {"added": 0, "changed": 0, "skipped": 0}
+    lexical = LexicalIndexBuilder()
+    popular = PopularCoursesBuilder()
+
+    def pending_items():
+        #* 串流讀取課程並比對 hash，只把新增或變更的課程交給後續批次 embedding
+        for course in iter_courses(course_file):
+            doc_id = course_doc_id(course)
+            content = build_document(course)
+            meta = build_metadata(course)
+            lexical.add(doc_id, build_lexical_fields(course), dict(meta))     #? 詞彙索引涵蓋全部課程 (含未變動者)
+            popular.add(dict(meta), course['info'].get('member_count'))
+            meta['content_hash'] = content_hash(content, meta)
+            seen_ids.add(doc_id)
+            
+            if doc_id not in existing_hashes:
+                counts["added"] += 1
+            elif existing_hashes[doc_id] != meta['content_hash']:
+                counts["changed"] += 1
+            else:
+                counts["skipped"] += 1
+                continue
+            
+            yield doc_id, content, meta
+
+    # === 產生 OpenAI Embedding (依 token 預算分批、並行送出，完成一批就寫入一批) ===
+    print("🔄 正在使用 OpenAI 建立向量...")
+    embedder = OpenAIEmbedder(model=embedding_model)
+    batches = make_batches(pending_items(), max_tokens=args.batch_tokens, max_size=args.batch_size)
+    
+    for batch, embeddings in embed_stream(batches, embedder, concurrency=args.concurrency):
+        with metrics.timer("chroma_upsert"):
+            collection.upsert(
+                ids=[item[0] for item in batch],
+                documents=[item[1] for item in batch],
+                metadatas=[item[2] for item in batch],
+                embeddings=embeddings
+            )
+    
+    print(f"📨 共 {embedder.request_count} 次 embedding 請求 (重試 {embedder.retry_count} 次)")
+    
+    removed_ids = list(set(existing_hashes) - seen_ids)
+    if removed_ids:
+        collection.delete(ids=removed_ids)
+    
+    # === 寫出詞彙索引 (BM25)，服務端用於混合檢索 ===
+    lexical.save(lexical_index_path(chroma_dir, collection_name))
+    print(f"🔤 已寫入詞彙索引: {len(lexical.ids)} 筆課程")
+    popular.save(popular_courses_path(chroma_dir, collection_name))     #? 相依服務故障時的降級回覆
+    
+    # === 有任何變動 (或尚未發佈過) 就發佈索引快照並更新目錄版本，讓服務端切換索引、推薦快取失效 ===
+    changed = counts["added"] or counts["changed"] or removed_ids or force_rebuild
+    if changed or read_manifest(chroma_dir, collection_name) is None:
+        version = new_version()
+        manifest = publish_snapshot(collection, chroma_dir, version, lexical=lexical)
+        print(f"📦 已發佈索引快照: {manifest['path']} ({manifest['count']} 筆課程)")
+        bump_version(chroma_dir, collection_name, version)
+        print(f"🏷️ 目錄版本已更新: {version}")
 
     end = time.time()
-    print(f"✅ 完成建庫，耗時: {end - start:.2f} 秒")
\ No newline at end of file
+    print(f"✅ 新增 {counts['added']} 筆、更新 {counts['changed']} 筆、刪除 {len(removed_ids)} 筆，"
+          f"略過 {counts['skipped']} 筆未變動 (省下 {counts['skipped']} 次 embedding)")
+    print(f"✅ 完成建庫，耗時: {end - start:.2f} 秒")
+    print(metrics.summary())
@@ -0,0 +1,121 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from modules.metrics import metrics
+import openai
+import random
+import threading
+import time
+
+# === OpenAI embeddings API 限制 ===
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_INPUT = 8191
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0                      #? 秒，重試間隔 1, 2, 4 ... 並加上隨機抖動
+
+
+def estimate_tokens(text: str) -> int:
+    #* 粗估 token 數：中日韓文字約 1 字 1 token，其餘約 4 字元 1 token
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+def make_batches(items, max_tokens: int = 50000, max_size: int = 256):
+    #* items 為 (doc_id, document, metadata)，依 token 預算切成批次 (generator，不一次展開全部)
+    batch = []
+    batch_tokens = 0
+    max_size = min(max_size, MAX_INPUTS_PER_REQUEST)
+
+    for item in items:
+        tokens = min(estimate_tokens(item[1]), MAX_TOKENS_PER_INPUT)
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_size):
+            yield batch
+            batch = []
+            batch_tokens = 0
+
+        batch.append(item)
+        batch_tokens += tokens
+
+    if batch:
+        yield batch
+
+def chunked(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class OpenAIEmbedder:
+    # === OpenAI 批次 embedding，遇到限流 / 暫時性錯誤時退避重試 ===
+
+    def __init__(self, model: str = "text-embedding-3-small", dimensions: int = None):
+        self.model = model
+        self.dimensions = dimensions
+        self.request_count = 0
+        self.retry_count = 0
+        self._lock = threading.Lock()           #? embed_stream 的多個執行緒同時更新計數
+
+    def __call__(self, texts: list) -> list:
+        retryable = (openai.RateLimitError, openai.APIConnectionError,
+                     openai.APITimeoutError, openai.InternalServerError)
+        kwargs = {"model": self.model, "input": texts}
+        if self.dimensions:
+            kwargs["dimensions"] = self.dimensions
+
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                with self._lock:
+                    self.request_count += 1
+                with metrics.timer("embedding_batch"):
+                    response = openai.embeddings.create(**kwargs)
+                return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+            except retryable:
+                if attempt == MAX_RETRIES:
+                    raise
+                with self._lock:
+                    self.retry_count += 1
+                time.sleep(BACKOFF_BASE * (2 ** attempt) * (1 + random.random()))
+
+
+def embed_stream(batches, embed_func, concurrency: int = 4):
+    #* 同時送出最多 concurrency 個批次，完成一批就 yield 一批 (順序不保證)
+    #* 未送出的批次不會預先展開，記憶體只保留進行中的批次
+    batches = iter(batches)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = {}
+        for batch in batches:
+            pending[pool.submit(embed_func, [item[1] for item in batch])] = batch
+            if len(pending) >= concurrency:
+                break
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch = pending.pop(future)
+                yield batch, future.result()
+
+                next_batch = next(batches, None)
+                if next_batch is not None:
+                    pending[pool.submit(embed_func, [item[1] for item in next_batch])] = next_batch
+
+
+def encode_sentence_transformer(model, chunks, batch_size: int = 64, processes: int = 1):
+    #* SentenceTransformer 分塊編碼；processes > 1 時使用多行程 encode pool
+    pool = None
+    if processes > 1:
+        pool = model.start_multi_process_pool(target_devices=["cpu"] * processes)
+
+    try:
+        for chunk in chunks:
+            texts = [item[1] for item in chunk]
+            with metrics.timer("encode_chunk"):
+                if pool is not None:
+                    embeddings = model.encode_multi_process(texts, pool, batch_size=batch_size)
+                else:
+                    embeddings = model.encode(texts, batch_size=batch_size)
+            yield chunk, embeddings
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
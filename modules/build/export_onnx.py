@@ -0,0 +1,99 @@
+from modules.local_encoder import LocalEncoder
+from sentence_transformers import SentenceTransformer
+import argparse
+import json
+import os
+import time
+import torch
+
+import numpy as np
+
+# === 匯出 SentenceTransformer 為 ONNX 模型 (服務端本機查詢向量用) ===
+#* 只匯出 transformer 本體 (輸出每個 token 的向量)，池化與正規化由 modules.local_encoder 以 NumPy 完成
+#* --quantize 另外產生 int8 動態量化版本 (model_int8.onnx)，服務端預設優先使用
+#* 匯出後以同一批句子比對 SentenceTransformer 與 ONNX 的向量，確認與建庫時的向量一致
+
+class TokenEmbeddings(torch.nn.Module):
+
+    def __init__(self, transformer, use_token_type_ids):
+        super().__init__()
+        self.transformer = transformer
+        self.use_token_type_ids = use_token_type_ids
+
+    def forward(self, input_ids, attention_mask, token_type_ids=None):
+        kwargs = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if self.use_token_type_ids:
+            kwargs["token_type_ids"] = token_type_ids
+        return self.transformer(**kwargs)[0]
+
+
+def pooling_mode(model):
+    for module in model:
+        if type(module).__name__ == "Pooling":
+            return "cls" if module.get_pooling_mode_str() == "cls" else "mean"
+    return "mean"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="匯出 SentenceTransformer 為 ONNX 模型")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="與 modules.build.embedding 建庫時相同的模型")
+    parser.add_argument("--output", default="models/all-MiniLM-L6-v2-onnx")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--quantize", action="store_true", help="另外產生 int8 動態量化模型")
+    args = parser.parse_args()
+
+    start = time.time()
+    model = SentenceTransformer(args.model, device="cpu")
+    tokenizer = model.tokenizer
+    use_token_type_ids = "token_type_ids" in tokenizer.model_input_names
+    os.makedirs(args.output, exist_ok=True)
+
+    # === 匯出 transformer (batch 與序列長度皆為動態維度) ===
+    input_names = ["input_ids", "attention_mask"] + (["token_type_ids"] if use_token_type_ids else [])
+    sample = tokenizer(["我想學理財", "python 入門課程"], padding=True, return_tensors="pt")
+    wrapper = TokenEmbeddings(model[0].auto_model, use_token_type_ids).eval()
+    model_path = os.path.join(args.output, "model.onnx")
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["token_embeddings"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in input_names + ["token_embeddings"]},
+            opset_version=args.opset,
+            do_constant_folding=True
+        )
+    print(f"✅ 已匯出 ONNX 模型: {model_path}")
+
+    if args.quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(model_path, os.path.join(args.output, "model_int8.onnx"), weight_type=QuantType.QInt8)
+        print("✅ 已產生 int8 量化模型: model_int8.onnx")
+
+    # === tokenizer 與池化設定 ===
+    tokenizer.backend_tokenizer.save(os.path.join(args.output, "tokenizer.json"))
+    settings = {
+        "model": args.model,
+        "dim": model.get_sentence_embedding_dimension(),
+        "max_length": model.max_seq_length,
+        "pooling": pooling_mode(model),
+        "normalize": any(type(module).__name__ == "Normalize" for module in model),
+        "pad_token": tokenizer.pad_token,
+        "pad_id": tokenizer.pad_token_id
+    }
+    with open(os.path.join(args.output, "encoder.json"), "w", encoding="utf-8") as f:
+        json.dump(settings, f, ensure_ascii=False, indent=2)
+
+    # === 與 SentenceTransformer 的向量比對 ===
+    texts = ["我想學理財", "如何提升簡報能力", "python 資料分析入門", "想轉職當設計師", "英文口說練習"]
+    expected = model.encode(texts, normalize_embeddings=settings["normalize"])
+    for quantized in ([False, True] if args.quantize else [False]):
+        encoder = LocalEncoder(args.output, quantized=quantized)
+        actual = np.asarray(encoder.encode(texts))
+        cosine = (actual * expected).sum(axis=1) / (np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1))
+        print(f"🔍 {os.path.basename(encoder.model_path)} 與 SentenceTransformer 的 cosine 相似度: 最低 {cosine.min():.4f}")
+
+    print(f"✅ 完成匯出，耗時: {time.time() - start:.2f} 秒")
@@ -0,0 +1,173 @@
+from modules.build.compare_engine import FakeEmbedder
+from modules.build.compare_query_encoder import load_queries
+from modules.build.load_test_webhook import SECRET, signature, webhook_body
+from modules.build.stub_line_api import StubLineServer
+from modules.metrics import metrics
+import argparse
+import logging
+import os
+import random
+import threading
+import time
+import types
+
+# === 故障注入：驗證推薦流程在相依服務故障時的延遲上限與降級回覆 ===
+#* 以假的 OpenAI embedding (字元 bigram 雜湊向量) 與包裝過的 Chroma collection 注入延遲、錯誤或卡住
+#* 每個情境先以正常狀態跑一半問句 (累積「最近成功的結果」)，再開啟故障跑全部問句
+#* 每則問句走完整的 app.handle_message (批次處理、Flex 卡片渲染、回覆至本機 LINE API stub)，降級結果也要能渲染
+#* 回報每個情境的回覆延遲分位數、降級回覆的來源分布、斷路器開啟次數與處理失敗 (沒有回覆) 的次數
+
+SCENARIOS = {
+    "healthy":          {},
+    "embedding_slow":   {"embedding": "hang"},
+    "embedding_down":   {"embedding": "error"},
+    "embedding_flaky":  {"embedding": "flaky"},
+    "vector_slow":      {"vector": "hang"},
+    "vector_down":      {"vector": "error"},
+    "collection_missing": {"vector": "missing"}
+}
+FALLBACK_COUNTERS = ("fallback_cached", "fallback_lexical", "fallback_popular", "fallback_empty")
+
+logger = logging.getLogger(__name__)
+
+
+class Fault:
+    # === 依模式決定每次呼叫的行為：正常延遲 / 卡住 / 拋錯 / 一半機率拋錯 ===
+
+    def __init__(self, latency, hang):
+        self.mode = None
+        self.latency = latency
+        self.hang = hang
+        self.released = threading.Event()       #? 情境結束時放行卡住的呼叫，避免背景執行緒一直佔著
+
+    def apply(self, name):
+        if self.mode == "hang":
+            self.released.wait(self.hang)
+        elif self.mode == "error" or (self.mode == "flaky" and random.random() < 0.5):
+            raise ConnectionError(f"{name} 故障注入")
+        else:
+            time.sleep(self.latency)
+
+
+class FaultyEmbeddings:
+    # === 取代 openai 模組：只提供 embeddings.create ===
+
+    def __init__(self, dim, fault):
+        self.embed = FakeEmbedder(dim)
+        self.fault = fault
+        self.embeddings = types.SimpleNamespace(create=self.create)
+
+    def create(self, model, input, **kwargs):
+        self.fault.apply("embedding")
+        data = [types.SimpleNamespace(index=i, embedding=e) for i, e in enumerate(self.embed(input))]
+        return types.SimpleNamespace(data=data)
+
+
+class FaultyCollection:
+    # === 包裝 Chroma collection，query / get 前先套用故障 ===
+
+    def __init__(self, collection, fault):
+        self.collection = collection
+        self.fault = fault
+        self.metadata = collection.metadata
+
+    def query(self, **kwargs):
+        self.fault.apply("vector_query")
+        return self.collection.query(**kwargs)
+
+    def get(self, **kwargs):
+        self.fault.apply("vector_query")
+        return self.collection.get(**kwargs)
+
+
+def message_event(app_module, event_id, question):
+    #* 以簽章正確的 webhook body 解析出 MessageEvent (時間戳記為現在，時間預算從此起算)
+    body = webhook_body(event_id, text=f"請推薦 {question}")
+    return app_module.handler.parser.parse(body, signature(body))[0]
+
+def handle(app_module, name, event_id, question):
+    #* 回傳是否處理成功；處理失敗 (例如降級結果無法渲染) 時使用者不會收到回覆
+    try:
+        app_module.handle_message(message_event(app_module, event_id, question))
+        return True
+    except Exception:
+        logger.exception("%s 處理失敗: %s", name, question)
+        return False
+
+def run_scenario(name, faults, queries, args, stub):
+    import app as app_module
+    from modules.config_manager import Config
+
+    config = Config()
+    config.embedding_cache = None           #? 每次都實際呼叫相依服務，不被快取掩蓋
+    config.result_cache = None
+    config.ensure_index()
+    if config.collections is None:
+        raise RuntimeError(f"找不到 collection: {config.collection_name}")
+    app_module.config = config              #? handle_message 改用這個情境的 Config
+
+    embedding_fault = Fault(args.latency_ms / 1000, args.hang_ms / 1000)
+    vector_fault = Fault(0.0, args.hang_ms / 1000)
+    sample = config.collections.get(limit=1, include=["embeddings"])
+    config.openai = FaultyEmbeddings(len(sample["embeddings"][0]), embedding_fault)
+    config.collections = FaultyCollection(config.collections, vector_fault)
+
+    crashes = 0
+    for i, question in enumerate(queries[:len(queries) // 2]):
+        crashes += not handle(app_module, name, f"{name}-warm-{i}", question)
+
+    embedding_fault.mode = faults.get("embedding")
+    vector_fault.mode = faults.get("vector")
+    if vector_fault.mode == "missing":
+        config.collections = None
+
+    before = dict(metrics.counters)
+    stub.reset()
+    latencies = []
+    for i, question in enumerate(queries):
+        start = time.perf_counter()
+        crashes += not handle(app_module, name, f"{name}-{i}", question)
+        latencies.append(time.perf_counter() - start)
+
+    embedding_fault.released.set()
+    vector_fault.released.set()
+
+    counts = {key: metrics.counters.get(key, 0) - before.get(key, 0) for key in FALLBACK_COUNTERS}
+    opens = config.embedding_dependency.breaker.opens + config.vector_dependency.breaker.opens
+    empty = sum(types != ["flex"] for types in stub.message_types)     #? 回覆文字訊息 (沒有符合的課程)
+    latencies.sort()
+    p50 = latencies[int(0.5 * (len(latencies) - 1))] * 1000
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] * 1000
+    print(f"{name:<20}{p50:>9.1f}{p95:>9.1f}{latencies[-1] * 1000:>9.1f}"
+          + "".join(f"{counts[key]:>9}" for key in FALLBACK_COUNTERS) + f"{empty:>7}{opens:>7}{crashes:>7}")
+    return crashes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="注入 OpenAI / Chroma 故障，檢查推薦延遲上限與降級回覆")
+    parser.add_argument("--queries", default="data/retrieval_queries.tsv")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--latency-ms", type=float, default=120, help="正常狀態下假 embedding 的延遲")
+    parser.add_argument("--hang-ms", type=float, default=30000, help="卡住的呼叫要多久才回應")
+    parser.add_argument("--budget-ms", type=float, default=0, help="覆寫 REPLY_BUDGET_MS")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queries):
+        raise FileNotFoundError(f"找不到問句檔: {args.queries}")
+    if args.budget_ms:
+        os.environ["REPLY_BUDGET_MS"] = str(args.budget_ms)
+    queries = load_queries(args.queries)
+
+    #* app 在 import 時讀取這些設定：回覆送到本機 stub、同步處理 (不經 webhook 佇列)
+    stub = StubLineServer().start()
+    os.environ.update(CHANNEL_SECRET=SECRET, CHANNEL_ACCESS_TOKEN="fault-injection", LINE_API_HOST=stub.url,
+                      WEBHOOK_WORKERS="0", WARMUP="0")
+
+    print(f"🔄 {len(queries)} 筆問句，每個情境先以正常狀態跑前 {len(queries) // 2} 筆\n")
+    print(f"{'情境':<18}{'p50(ms)':>9}{'p95(ms)':>9}{'max(ms)':>9}"
+          f"{'快取':>7}{'詞彙':>7}{'熱門':>7}{'空結果':>6}{'無結果':>4}{'斷路':>5}{'失敗':>5}")
+    crashes = sum(run_scenario(name, SCENARIOS[name], queries, args, stub) for name in args.scenarios.split(","))
+    stub.stop()
+
+    if crashes:
+        raise SystemExit(f"❌ {crashes} 則訊息處理失敗 (沒有回覆)")
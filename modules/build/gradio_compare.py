@@ -1,11 +1,12 @@
 from chromadb import PersistentClient
 from dotenv import load_dotenv
+from functools import lru_cache
+from modules.build.compare_engine import CompareEngine, RetrievalConfig
+from modules.build.search_cache import SearchCache
 import gradio as gr
 import openai
 import os
 import pandas as pd
-import sqlite3
-import tempfile
 
 # 讀取 .env 檔案
 load_dotenv()
@@ -16,51 +17,24 @@ CHROMA_DIR = "./chroma_db"
 COLLECTION_CHROMBA = "sat_courses"
 COLLECTION_OPENAI  = "sat_courses_openai"
 DB_FILE = "search_cache.db"
+CSV_DIR = "search_cache_csv"
+CACHE_MAX_ENTRIES = 500
+CACHE_MAX_AGE = 7 * 86400      #? 秒
 
 # 初始化 OpenAI API
 openai.api_key = os.environ.get("OPAI_API_KEY")
 client = PersistentClient(path=CHROMA_DIR)
 
-# === DB 初始化 ===
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS cache (
-            query TEXT PRIMARY KEY,
-            table_a TEXT,
-            table_b TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-    
-# === 查詢快取 ===
-def load_from_cache(query):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT table_a, table_b FROM cache WHERE query=?", (query,))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        return row[0], row[1]
-    return None
-
-def save_to_cache(query, html_a, html_b):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("REPLACE INTO cache (query, table_a, table_b) VALUES (?, ?, ?)",
-              (query, html_a, html_b))
-    conn.commit()
-    conn.close()
+# === 查詢快取 (長駐 WAL 連線，依筆數 / 時間淘汰) ===
+cache = SearchCache(DB_FILE, csv_dir=CSV_DIR, max_entries=CACHE_MAX_ENTRIES, max_age=CACHE_MAX_AGE)
 
 def get_query_history():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT query FROM cache ORDER BY rowid DESC LIMIT 20")
-    rows = c.fetchall()
-    conn.close()
-    return [row[0] for row in rows]
+    return cache.history(limit=20)
+
+@lru_cache(maxsize=None)
+def get_collection(name: str):
+    #* collection handle 只取一次，之後每次查詢重複使用
+    return client.get_collection(name=name)
 
 # === 模型查詢 ===
 def get_openai_embedding(text: str) -> list:
@@ -70,12 +44,16 @@ def get_openai_embedding(text: str) -> list:
     )
     return response.data[0].embedding
 
-def query_collection_html_and_csv(collection, query_text=None, query_embedding=None, use_embedding=False):
-    if use_embedding:
-        result = collection.query(query_embeddings=[query_embedding], n_results=3)
-    else:
-        result = collection.query(query_texts=[query_text], n_results=3)
+@lru_cache(maxsize=None)
+def get_engine():
+    #* 兩組設定平行查詢，總耗時約等於較慢的一組
+    return CompareEngine([
+        RetrievalConfig("SentenceTransformer", get_collection(COLLECTION_CHROMBA)),
+        RetrievalConfig("OpenAI", get_collection(COLLECTION_OPENAI),
+                        embed=lambda texts: [get_openai_embedding(text) for text in texts])
+    ])
 
+def result_html_and_csv(result, timings):
     courses = result["metadatas"][0]
     distances = result["distances"][0]
 
@@ -106,37 +84,33 @@ def query_collection_html_and_csv(collection, query_text=None, query_embedding=N
     for i, col in enumerate(course_columns):
         df_csv.loc[df_csv["欄位"] == "課程連結", col] = courses[i]["link"]
 
-    # 儲存成暫存 CSV 檔案
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv", mode='w', newline='', encoding='utf-8')
-    df_csv.to_csv(tmp.name, index=False)
-    return df.to_html(escape=False, index=False), tmp.name
+    # 耗時顯示在表格上方；CSV 內容存進快取，下載時才寫成檔案
+    timing = " / ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items())
+    return f"<p>⏱️ {timing}</p>" + df.to_html(escape=False, index=False), df_csv.to_csv(index=False)
 
 # === 主查詢流程 ===
 def search_courses(query_text):
-    cached = load_from_cache(query_text)
+    cached = cache.get(query_text)
     if cached:
-        return cached[0], cached[1], None, None, gr.update(choices=get_query_history())
-
-    collection_transformer = client.get_collection(name=COLLECTION_CHROMBA)
-    collection_openai = client.get_collection(name=COLLECTION_OPENAI)
-
-    result_a = query_collection_html_and_csv(collection_transformer, query_text=query_text, use_embedding=False)
-    embedding_b = get_openai_embedding(query_text)
-    result_b = query_collection_html_and_csv(collection_openai, query_embedding=embedding_b, use_embedding=True)
+        html_a, html_b, csv_a, csv_b = cached
+    else:
+        outputs = get_engine().run(query_text)
+        for output in outputs.values():
+            if output["error"]:
+                raise gr.Error(output["error"])
+        
+        html_a, csv_a = result_html_and_csv(outputs["SentenceTransformer"]["result"], outputs["SentenceTransformer"]["timings"])
+        html_b, csv_b = result_html_and_csv(outputs["OpenAI"]["result"], outputs["OpenAI"]["timings"])
+        cache.set(query_text, html_a, html_b, csv_a, csv_b)
 
-    html_a, csv_a = result_a
-    html_b, csv_b = result_b
-    
-    save_to_cache(query_text, html_a, html_b)
-    return html_a, html_b, csv_a, csv_b, gr.update(choices=get_query_history())
+    return (html_a, html_b,
+            cache.csv_file(query_text, "a", csv_a), cache.csv_file(query_text, "b", csv_b),
+            gr.update(choices=get_query_history()))
 
 # === 點選歷史查詢項目 ===
 def reuse_history_item(selected_query):
     return search_courses(selected_query)
 
-# === 初始化資料庫 ===
-init_db()
-
 # === Gradio 介面 ===
 with gr.Blocks(title="課程語意查詢比較工具 (含快取與 CSV 下載)") as demo:
     gr.Markdown("## 🎓 課程語意查詢工具：比較兩種模型推薦結果")
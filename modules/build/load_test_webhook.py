@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor
+from modules.build.stub_line_api import StubLineServer
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+# === Webhook 壓測：同步處理 vs 背景 worker 佇列 ===
+#* 以本機 stub 取代 LINE Messaging API，推薦流程以固定延遲的假結果取代 (不呼叫 OpenAI / Chroma)
+#* 對真正的 Flask app 送出簽章正確的 webhook，量測 /callback 回應時間、狀態碼、佇列背壓與全部回覆完成的時間
+#* 非 2xx 的事件模擬 LINE 的重送 (isRedelivery=true，間隔逐次加倍)，以 stub 收到的不重複 reply token 確認訊息沒有遺失
+
+SECRET = "load-test-secret"
+FAKE_RESULT = {0: {"cource": "壓測課程", "teacher": "講師", "category": "測試", "link": "https://example.com/course/1",
+                   "rate": "4.5", "duration": "1小時", "price": "990", "image": "", "relative": "0.8"}}
+
+
+def webhook_body(event_id, redelivery=False, text="請推薦 理財"):
+    return json.dumps({"destination": "Ubot", "events": [{
+        "type": "message", "mode": "active", "timestamp": int(time.time() * 1000),
+        "source": {"type": "user", "userId": "Uload"}, "webhookEventId": event_id,
+        "deliveryContext": {"isRedelivery": redelivery}, "replyToken": f"token-{event_id}",
+        "message": {"id": event_id, "type": "text", "quoteToken": "q", "text": text}
+    }]})
+
+def signature(body):
+    return base64.b64encode(hmac.new(SECRET.encode(), body.encode(), hashlib.sha256).digest()).decode()
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))] * 1000 if values else 0.0
+
+
+def run_mode(app_module, url, stub, workers, args):
+    from modules.webhook_queue import EventDispatcher
+
+    #* 每個模式使用新的 dispatcher 與去重紀錄，互不影響
+    app_module.config.webhook_workers = workers
+    app_module.dispatcher = EventDispatcher(app_module.dispatch_event, workers=workers, max_queue_size=args.queue_size)
+    app_module.deduplicator.memory.clear()
+    stub.reset()
+
+    latencies, statuses, lock = [], {}, threading.Lock()
+    session = threading.local()
+
+    def post(event_id, redelivery=False):
+        if not hasattr(session, "http"):
+            session.http = requests.Session()
+        body = webhook_body(event_id, redelivery)
+        start = time.perf_counter()
+        response = session.http.post(url, data=body, timeout=60,
+                                     headers={"X-Line-Signature": signature(body), "Content-Type": "application/json"})
+        with lock:
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return response.status_code
+
+    start = time.perf_counter()
+    pending = [f"{workers}-{i}" for i in range(args.events)]
+    redelivery, delay = False, args.redelivery_delay_ms / 1000
+    for attempt in range(args.max_redeliveries + 1):
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            codes = list(pool.map(lambda event_id: post(event_id, redelivery), pending))
+        pending = [event_id for event_id, code in zip(pending, codes) if code != 200]
+        if not pending:
+            break
+        redelivery = True
+        time.sleep(delay)
+        delay *= 2
+    acked = time.perf_counter() - start
+
+    if workers > 0:
+        app_module.dispatcher.join()
+    total = time.perf_counter() - start
+    stats = app_module.dispatcher.stats() if workers > 0 else {}
+    lost = args.events - len(set(stub.reply_tokens))
+
+    print(f"{workers:>8}{percentile(latencies, 0.5):>10.1f}{percentile(latencies, 0.95):>10.1f}"
+          f"{percentile(latencies, 0.99):>10.1f}{statuses.get(503, 0):>7}{statuses.get(500, 0):>7}{lost:>7}"
+          f"{stats.get('wait_time_max', 0.0) * 1000:>12.1f}{acked:>9.2f}{total:>9.2f}{stub.replies:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Webhook 壓測 (本機 LINE API stub + 假推薦結果)")
+    parser.add_argument("--events", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32, help="同時送出 webhook 的連線數 (模擬 LINE 平台)")
+    parser.add_argument("--workers", default="0,4,16", help="WEBHOOK_WORKERS，逗號分隔；0 為同步處理")
+    parser.add_argument("--queue-size", type=int, default=256)
+    parser.add_argument("--recommend-ms", type=float, default=150, help="假推薦流程的延遲 (embedding + 檢索)")
+    parser.add_argument("--reply-ms", type=float, default=20, help="stub LINE API 的回應延遲")
+    parser.add_argument("--max-redeliveries", type=int, default=6)
+    parser.add_argument("--redelivery-delay-ms", type=float, default=500, help="第一次重送的間隔，之後逐次加倍")
+    args = parser.parse_args()
+
+    stub = StubLineServer(latency=args.reply_ms / 1000).start()
+    os.environ.update(CHANNEL_SECRET=SECRET, CHANNEL_ACCESS_TOKEN="load-test", LINE_API_HOST=stub.url,
+                      LINE_POOL_SIZE=str(args.concurrency))
+    import app as app_module
+    from werkzeug.serving import make_server
+
+    def fake_recommendation(question, filters=None, deadline=None):
+        time.sleep(args.recommend_ms / 1000)
+        return FAKE_RESULT
+    app_module.config.recommendation = fake_recommendation
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    logging.getLogger("modules.webhook_queue").setLevel(logging.ERROR)     #? 佇列已滿的警告改由 503 欄位呈現
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/callback"
+
+    print(f"🔄 {args.events} 則事件，{args.concurrency} 條並行連線，推薦 {args.recommend_ms:.0f} ms，"
+          f"回覆 {args.reply_ms:.0f} ms，佇列容量 {args.queue_size}\n")
+    print(f"{'workers':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'503':>7}{'500':>7}{'遺失':>5}"
+          f"{'最長排隊(ms)':>10}{'全部ack(s)':>9}{'完成(s)':>8}{'回覆數':>5}")
+    for workers in [int(w) for w in args.workers.split(",")]:
+        run_mode(app_module, url, stub, workers, args)
+
+    server.shutdown()
+    stub.stop()
@@ -0,0 +1,119 @@
+from modules.build.catalog import build_document, build_metadata, content_hash, course_doc_id, is_ndjson, iter_courses
+from modules.build.crawler import build_course_data, parse_bundles
+from modules.build.embedding_pipeline import chunked
+from modules.build.stub_sat_api import course_bundles, course_detail
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# === 課程目錄讀取的尖峰記憶體 (peak RSS)：json.load 整份載入 vs 串流讀取 ===
+#* 產生合成課程目錄 (預設 200k 門課程，格式與爬蟲輸出相同)，每種讀法在獨立子行程執行，回報 ru_maxrss 與耗時
+#* 只量測「讀取 → 建立文件 / metadata / content hash → 分塊」這段，不呼叫 embedding 或寫入 Chroma
+#* --memory-limit-mb 限制子行程位址空間，超過時回報 MemoryError 而不是讓整台機器 OOM
+
+
+def synthetic_course(course_id, intro_chars):
+    course = build_course_data(course_id, course_detail(course_id), parse_bundles(course_bundles(course_id)))
+    course["intro"] = (f"第 {course_id} 門課程的介紹。" * (intro_chars // 10 + 1))[:intro_chars]
+    return course
+
+def write_catalog(path, n_courses, intro_chars):
+    #* 逐筆寫出，產生目錄本身不佔用大量記憶體
+    with open(path, "w", encoding="utf-8") as f:
+        if is_ndjson(path):
+            for course_id in range(1, n_courses + 1):
+                f.write(json.dumps(synthetic_course(course_id, intro_chars), ensure_ascii=False) + "\n")
+            return
+
+        f.write("[\n")
+        for course_id in range(1, n_courses + 1):
+            f.write(("" if course_id == 1 else ",\n") + json.dumps(synthetic_course(course_id, intro_chars), ensure_ascii=False))
+        f.write("\n]")
+
+
+def load_all(path):
+    #* 改版前的讀法：json.load 整份目錄，再建立三個平行 list
+    with open(path, "r", encoding="utf-8") as f:
+        courses = json.load(f)
+
+    documents, metadatas, ids = [], [], []
+    for course in courses:
+        content = build_document(course)
+        meta = build_metadata(course)
+        meta["content_hash"] = content_hash(content, meta)
+        documents.append(content)
+        metadatas.append(meta)
+        ids.append(course_doc_id(course))
+    return len(ids)
+
+def load_streaming(path, chunk_size):
+    #* 目前建庫腳本的讀法：逐筆讀取並建立文件，一次只保留一個分塊
+    def items():
+        for course in iter_courses(path):
+            content = build_document(course)
+            meta = build_metadata(course)
+            meta["content_hash"] = content_hash(content, meta)
+            yield course_doc_id(course), content, meta
+
+    return sum(len(chunk) for chunk in chunked(items(), chunk_size))
+
+def run_child(mode, path, chunk_size, memory_limit_mb):
+    if memory_limit_mb:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    start = time.perf_counter()
+    try:
+        count = load_all(path) if mode == "json_load" else load_streaming(path, chunk_size)
+        status = "ok"
+    except MemoryError:
+        count, status = 0, "MemoryError"
+    elapsed = time.perf_counter() - start
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024     #? Linux 的 ru_maxrss 單位為 KB
+    print(json.dumps({"mode": mode, "count": count, "status": status, "peak_mb": peak_mb, "elapsed": elapsed}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="量測課程目錄讀取的尖峰記憶體")
+    parser.add_argument("--courses", type=int, default=200000)
+    parser.add_argument("--intro-chars", type=int, default=2000, help="每門課程介紹的字數 (控制目錄大小)")
+    parser.add_argument("--format", default="json", choices=["json", "ndjson"])
+    parser.add_argument("--catalog", default="", help="使用既有的目錄檔 (留空時產生合成目錄至暫存目錄)")
+    parser.add_argument("--modes", default="stream,json_load")
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--memory-limit-mb", type=int, default=4096, help="子行程的位址空間上限 (0 不限制)")
+    parser.add_argument("--child", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.catalog, args.chunk_size, args.memory_limit_mb)
+        sys.exit(0)
+
+    path = args.catalog
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(prefix="catalog_memory_"), f"courses.{args.format}")
+        start = time.perf_counter()
+        write_catalog(path, args.courses, args.intro_chars)
+        print(f"📝 已產生合成目錄: {path} ({args.courses} 門課程，{os.path.getsize(path) / 1024 ** 2:.0f} MB，"
+              f"{time.perf_counter() - start:.1f} 秒)")
+
+    print(f"\n{'讀法':<12}{'課程數':>8}{'peak RSS(MB)':>14}{'耗時(s)':>9}  狀態")
+    for mode in args.modes.split(","):
+        output = subprocess.run([sys.executable, "-m", "modules.build.measure_catalog_memory", "--child", mode,
+                                 "--catalog", path, "--chunk-size", str(args.chunk_size),
+                                 "--memory-limit-mb", str(args.memory_limit_mb)],
+                                capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{mode:<12}{'-':>10}{'-':>14}{'-':>9}  exit {output.returncode}: {output.stderr.strip()[-200:]}")
+            continue
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        print(f"{mode:<12}{result['count']:>10}{result['peak_mb']:>14.1f}{result['elapsed']:>9.1f}  {result['status']}")
+
+    if not args.catalog:
+        os.remove(path)
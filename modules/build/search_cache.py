@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# === 查詢比較工具的結果快取 ===
+#* 單一長駐 WAL 連線 (SQL 字串固定，由 sqlite3 的 statement cache 重複使用已編譯的語句)
+#* HTML 與 CSV 都存在資料庫，CSV 只在需要下載時才寫成檔案，並隨快取淘汰一起刪除
+
+SELECT_ENTRY = "SELECT table_a, table_b, csv_a, csv_b, created_at FROM cache WHERE query=?"
+TOUCH_ENTRY = "UPDATE cache SET accessed_at=? WHERE query=?"
+UPSERT_ENTRY = ("REPLACE INTO cache (query, table_a, table_b, csv_a, csv_b, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)")
+SELECT_HISTORY = "SELECT query FROM cache ORDER BY accessed_at DESC LIMIT ?"
+SELECT_EXPIRED = "SELECT query FROM cache WHERE created_at < ?"
+SELECT_OVERFLOW = "SELECT query FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?"
+DELETE_ENTRY = "DELETE FROM cache WHERE query=?"
+
+
+class SearchCache:
+
+    def __init__(self, path="search_cache.db", csv_dir="search_cache_csv", max_entries=500, max_age=7 * 86400):
+        self.path = path
+        self.csv_dir = csv_dir
+        self.max_entries = max_entries      #? 超過筆數時淘汰最久未使用的查詢
+        self.max_age = max_age              #? 秒；None 表示不過期
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        #* fork 之後不能沿用父行程的連線，依 pid 重新開啟
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, cached_statements=32)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                query TEXT PRIMARY KEY,
+                table_a TEXT,
+                table_b TEXT
+            )
+        ''')
+
+        #* 舊版快取只有 HTML 欄位，補上 CSV 與時間欄位 (舊資料視為剛建立)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache)")}
+        now = time.time()
+        for column, ddl in (("csv_a", "TEXT"), ("csv_b", "TEXT"),
+                            ("created_at", f"REAL DEFAULT {now}"), ("accessed_at", f"REAL DEFAULT {now}")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE cache ADD COLUMN {column} {ddl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        conn.commit()
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def get(self, query):
+        #* 回傳 (html_a, html_b, csv_a, csv_b) 或 None；超過 max_age 的結果視為未命中並刪除
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(SELECT_ENTRY, (query,)).fetchone()
+            if row is not None and self.max_age is not None and row[4] < now - self.max_age:
+                self._delete(conn, query)
+                self.evictions += 1
+                row = None
+            elif row is not None:
+                conn.execute(TOUCH_ENTRY, (now, query))
+            conn.commit()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return row[:4]
+
+    def set(self, query, html_a, html_b, csv_a, csv_b):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(UPSERT_ENTRY, (query, html_a, html_b, csv_a, csv_b, now, now))
+            self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn, now):
+        expired = []
+        if self.max_age is not None:
+            expired += [row[0] for row in conn.execute(SELECT_EXPIRED, (now - self.max_age,))]
+        if self.max_entries:
+            expired += [row[0] for row in conn.execute(SELECT_OVERFLOW, (self.max_entries,))]
+
+        for query in set(expired):
+            self._delete(conn, query)
+        self.evictions += len(set(expired))
+
+    def _delete(self, conn, query):
+        conn.execute(DELETE_ENTRY, (query,))
+        for suffix in ("a", "b"):
+            path = self._csv_path(query, suffix)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def history(self, limit=20):
+        with self._lock:
+            return [row[0] for row in self._connect().execute(SELECT_HISTORY, (limit,))]
+
+    def _csv_path(self, query, suffix):
+        name = hashlib.sha256(query.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.csv_dir, f"{name}_{suffix}.csv")
+
+    def csv_file(self, query, suffix, content):
+        #* 下載時才把 CSV 內容寫成檔案；同一查詢重複使用同一個檔案，不再產生新的暫存檔
+        if content is None:
+            return None
+
+        path = self._csv_path(query, suffix)
+        if not os.path.exists(path):
+            os.makedirs(self.csv_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return path
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,96 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socket
+import threading
+import time
+
+# === 本機 LINE Messaging API stub (只實作 reply) ===
+#* 壓測與連線池比較用：可設定回應延遲，統計收到的回覆數與開啟的 TCP 連線數
+#* 啟動後把 LINE_API_HOST (或 LineMessagingClient 的 host) 指向 stub.url
+
+REPLY_RESPONSE = json.dumps({"sentMessages": [{"id": "1", "quoteToken": "stub"}]}).encode("utf-8")
+
+
+class StubLineHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"           #? 支援 keep-alive，連線池才有重用的效果
+
+    def setup(self):
+        super().setup()
+        #* 標頭與 body 分兩次寫出，keep-alive 連線上會被 Nagle + delayed ACK 多卡約 40 ms
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+        if self.server.connect_latency:
+            time.sleep(self.server.connect_latency)     #? 模擬新連線的 TCP + TLS handshake，重用連線時不會再付
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        payload = json.loads(body or b"{}")
+        with self.server.lock:
+            self.server.replies += 1
+            self.server.reply_tokens.append(payload.get("replyToken"))
+            self.server.message_types.append([message.get("type") for message in payload.get("messages", [])])
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(REPLY_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(REPLY_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 256                #? 預設 backlog 只有 5，高並行時會被 reset
+
+
+class StubLineServer:
+
+    def __init__(self, latency=0.0, port=0, connect_latency=0.0):
+        self.server = StubHTTPServer(("127.0.0.1", port), StubLineHandler)
+        self.server.daemon_threads = True
+        self.server.latency = latency       #? 秒，每次回覆的處理時間
+        self.server.connect_latency = connect_latency   #? 秒，每條新連線的建立成本
+        self.server.lock = threading.Lock()
+        self.reset()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    @property
+    def replies(self):
+        return self.server.replies
+
+    @property
+    def connections(self):
+        return self.server.connections
+
+    @property
+    def reply_tokens(self):
+        return self.server.reply_tokens
+
+    @property
+    def message_types(self):
+        return self.server.message_types        #? 每則回覆的訊息類型，例如 ["flex"]
+
+    def reset(self):
+        self.server.replies = 0
+        self.server.connections = 0
+        self.server.reply_tokens = []
+        self.server.message_types = []
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-line-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,177 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import hashlib
+import json
+import random
+import threading
+import time
+
+# === 本機 SAT 知識衛星 API stub (課程列表 / 課程內容 / 課程組合) ===
+#* 爬蟲離線測試用：可設定回應延遲與失敗率 (429 帶 Retry-After、503、中斷連線)，並記錄每個請求的到達時間
+#* 課程內容與組合回應帶 ETag，If-None-Match 相符時回 304；touch() / touch_bundles() 模擬課程內容 / 組合更新
+#* 啟動後以 crawler.set_api_base(stub.url) 或 --api-base 指向 stub
+
+
+def course_detail(course_id, revision=0):
+    return {
+        "id": course_id,
+        "name": f"離線測試課程 {course_id}" + (f" (第 {revision} 版)" if revision else ""),
+        "teacher": {"nick_name": f"講師 {course_id % 7}", "brief": "stub"},
+        "category": {"name": ["投資理財", "程式設計", "語言學習"][course_id % 3], "slug": "stub"},
+        "info": {"description": f"第 {course_id} 門課程的介紹", "chapter_count": 10, "duration": 3600 + course_id,
+                 "expired_time": None, "member_count": course_id * 10},
+        "main_project": {"original_price": 2000, "sale_price": 1000 + course_id},
+        "rate": 4.5, "rate_contents": [], "rate_count": course_id,
+        "images": {"seo_cover": f"https://files.sat.cool/cover/{course_id}.png"}
+    }
+
+def course_bundles(course_id, revision=0):
+    return [{"bundle": {"name": f"組合 {course_id}" + (f" (第 {revision} 版)" if revision else "")},
+             "projects": [{"sale_price": 1000, "discount": 100,
+                           "course": {"id": course_id, "cover": "", "name": f"離線測試課程 {course_id}"}}]}]
+
+
+class StubSatHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.arrivals.append(time.monotonic())
+            fault = server.random.random() < server.failure_rate
+            fault_kind = server.random.choice(["429", "503", "drop"]) if fault else None
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if fault_kind == "drop":
+            #* 不回應直接關閉連線，讓客戶端走連線錯誤的重試路徑
+            with server.lock:
+                server.faults += 1
+            self.close_connection = True
+            self.connection.close()
+            return
+        if fault_kind:
+            with server.lock:
+                server.faults += 1
+            self._send(int(fault_kind), {"message": "stub fault"}, {"Retry-After": "0"} if fault_kind == "429" else {})
+            return
+
+        url = urlsplit(self.path)
+        parts = url.path.rstrip("/").split("/")
+        if parts[-1] == "courses":
+            query = parse_qs(url.query)
+            page, limit = int(query.get("page", [1])[0]), int(query.get("limit", [9])[0])
+            ids = list(range(1, server.course_count + 1))[(page - 1) * limit:page * limit]
+            self._send(200, {"data": {"courses": [{"id": i} for i in ids]}})
+        elif parts[-2] == "course":
+            course_id = int(parts[-1])
+            self._send_conditional({"data": course_detail(course_id, server.revisions.get(course_id, 0))})
+        elif parts[-1] == "course_bundles":
+            course_id = int(parse_qs(url.query)["course_id"][0])
+            self._send_conditional({"data": course_bundles(course_id, server.bundle_revisions.get(course_id, 0))})
+        else:
+            self._send(404, {"message": "not found"})
+
+    def _send_conditional(self, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if self.headers.get("If-None-Match") == etag:
+            with self.server.lock:
+                self.server.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self._send(200, payload, {"ETag": etag}, body)
+
+    def _send(self, status, payload, headers=None, body=None):
+        body = body or json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    request_queue_size = 256
+
+
+class StubSatServer:
+
+    def __init__(self, course_count=40, latency=0.0, failure_rate=0.0, seed=0, port=0):
+        self.server = StubHTTPServer(("127.0.0.1", port), StubSatHandler)
+        self.server.daemon_threads = True
+        self.server.course_count = course_count
+        self.server.latency = latency               #? 秒，每個請求的處理時間
+        self.server.failure_rate = failure_rate     #? 0 ~ 1，隨機回 429 / 503 或中斷連線的比例
+        self.server.random = random.Random(seed)
+        self.server.revisions = {}
+        self.server.bundle_revisions = {}
+        self.server.lock = threading.Lock()
+        self.reset()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/v2"
+
+    @property
+    def requests(self):
+        return len(self.server.arrivals)
+
+    @property
+    def faults(self):
+        return self.server.faults
+
+    @property
+    def not_modified(self):
+        return self.server.not_modified
+
+    @property
+    def bytes_sent(self):
+        return self.server.bytes_sent
+
+    def touch(self, course_id):
+        #* 課程內容更新 (名稱加上版本號)，之後的 ETag 會不同
+        with self.server.lock:
+            self.server.revisions[course_id] = self.server.revisions.get(course_id, 0) + 1
+
+    def touch_bundles(self, course_id):
+        #* 只更新課程組合 (課程內容的 ETag 不變)
+        with self.server.lock:
+            self.server.bundle_revisions[course_id] = self.server.bundle_revisions.get(course_id, 0) + 1
+
+    def peak_rate(self, window=1.0):
+        #* 任一 window 秒內收到的最多請求數 / window，用來確認限速有效
+        arrivals = sorted(self.server.arrivals)
+        peak, start = 0, 0
+        for end, arrival in enumerate(arrivals):
+            while arrival - arrivals[start] > window:
+                start += 1
+            peak = max(peak, end - start + 1)
+        return peak / window
+
+    def reset(self):
+        self.server.arrivals = []
+        self.server.faults = 0
+        self.server.not_modified = 0
+        self.server.bytes_sent = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-sat-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
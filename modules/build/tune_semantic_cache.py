@@ -0,0 +1,34 @@
+from modules.config_manager import config
+from modules.semantic_cache import replay
+import argparse
+import os
+
+# === 語意快取門檻調整：離線重播記錄下來的問句 ===
+#* 問句檔為一行一句 (可用 QUERY_LOG_PATH 記錄線上問句)，依時間順序重播
+#* 每句都會做一次實際檢索當作標準答案，再模擬不同門檻下的命中率與誤用率
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="重播問句並評估語意快取門檻")
+    parser.add_argument("--queries", default="cache/query_log.txt", help="問句檔 (一行一句)")
+    parser.add_argument("--thresholds", default="0.85,0.88,0.90,0.92,0.94,0.96,0.98")
+    parser.add_argument("--capacity", type=int, default=512)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.queries):
+        raise FileNotFoundError(f"找不到問句檔: {args.queries}")
+
+    with open(args.queries, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip()]
+
+    print(f"🔄 重播 {len(questions)} 筆問句...")
+    embeddings = config._fetch_embeddings(questions)     #? 會經過 embedding 快取，重跑不需重新計費
+    result = config._query(embeddings, config.n_results)
+    answers = [config._format_result(result, i) for i in range(len(questions))]
+
+    thresholds = [float(t) for t in args.thresholds.split(",")]
+    report = replay(embeddings, answers, thresholds, capacity=args.capacity, same=config._same_courses)
+
+    print(f"\n{'門檻':>6} | {'命中率':>8} | {'誤用率':>8} | 命中 / 誤用")
+    for row in report:
+        print(f"{row['threshold']:>8.2f} | {row['hit_ratio']:>10.1%} | {row['false_reuse_ratio']:>10.1%} | "
+              f"{row['hits']} / {row['false_reuse']}")
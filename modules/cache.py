@@ -0,0 +1,277 @@
+from array import array
+from collections import OrderedDict
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+
+def normalize_text(text):
+    #* 全形轉半形、去除多餘空白、英文轉小寫，讓同一個問題對到同一個 key
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split()).lower()
+
+
+class LRUCache:
+    # === 行程內 LRU 快取 (容量 + TTL 淘汰，執行緒安全) ===
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl                  #? 秒；None 表示不過期
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+
+            value, expire_at = item
+            if expire_at is not None and expire_at < time.monotonic():
+                del self._data[key]
+                self.evictions += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expire_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expire_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+class EmbeddingCache:
+    # === 問句向量快取：記憶體 LRU + SQLite 磁碟層 ===
+    #* key = sha256(模型名稱 + 正規化後的問句)，磁碟層重啟後仍保留，且可由多個 gunicorn worker 共用
+    #* TTL 同時套用在兩層：磁碟讀取時依 created_at 判斷過期；連線時與每寫入 prune_every 筆清掉過期與超出 disk_max_size 的舊資料
+
+    def __init__(self, path="cache/embedding_cache.db", max_size=4096, ttl=None, disk_max_size=100000, prune_every=1000):
+        self.path = path
+        self.ttl = ttl                      #? 秒；None 表示不過期
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.disk_max_size = disk_max_size  #? 磁碟層最多保留幾筆 (0 表示不限制)
+        self.prune_every = prune_every
+
+        self.disk_hits = 0
+        self.disk_expired = 0
+        self.disk_pruned = 0
+        self.misses = 0
+        self._writes = 0
+
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text, model):
+        raw = f"{model}\n{normalize_text(text)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _connect(self):
+        #* fork 之後不能沿用父行程的連線，依 pid 重新開啟
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT,
+                dim INTEGER,
+                vector BLOB,
+                created_at REAL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+        conn.commit()
+        self._prune(conn)                   #? 每個行程第一次連線時先清一次，寫入量少的 worker 也不會無限成長
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def _load(self, key):
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT vector, created_at FROM embeddings WHERE key=?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            #* 過期資料視為未命中 (不刪除，重新計算後會以新的 created_at 覆寫)
+            if self.ttl and row[1] < time.time() - self.ttl:
+                self.disk_expired += 1
+                return None
+
+            self.disk_hits += 1
+        return array("f", row[0]).tolist()
+
+    def _save(self, key, model, embedding):
+        blob = array("f", embedding).tobytes()     #? 以 float32 儲存，空間約為 JSON 的 1/4
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, len(embedding), blob, time.time())
+            )
+            conn.commit()
+
+            self._writes += 1
+            if self._writes % self.prune_every == 0:
+                self._prune(conn)
+
+    def _prune(self, conn):
+        #* 呼叫端需持有 self._lock
+        deleted = 0
+        if self.ttl:
+            deleted += conn.execute("DELETE FROM embeddings WHERE created_at < ?", (time.time() - self.ttl,)).rowcount
+        if self.disk_max_size:
+            deleted += conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY created_at DESC LIMIT -1 OFFSET ?)", (self.disk_max_size,)
+            ).rowcount
+        conn.commit()
+        self.disk_pruned += deleted
+
+    def prune(self):
+        with self._lock:
+            self._prune(self._connect())
+
+    def get(self, text, model):
+        key = self.make_key(text, model)
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            return embedding
+
+        embedding = self._load(key)
+        if embedding is not None:
+            self.memory.set(key, embedding)
+        return embedding
+
+    def set(self, text, model, embedding):
+        key = self.make_key(text, model)
+        self.memory.set(key, embedding)
+        self._save(key, model, embedding)
+
+    def get_or_compute(self, text, model, fetch):
+        embedding = self.get(text, model)
+        if embedding is not None:
+            return embedding
+
+        with self._lock:
+            self.misses += 1
+        embedding = fetch(text)
+        self.set(text, model, embedding)
+        return embedding
+
+    def get_or_compute_many(self, texts, model, fetch_many):
+        #* 只把未命中的問句 (去重後) 一次送出批次請求
+        embeddings = [self.get(text, model) for text in texts]
+        missing = list(dict.fromkeys(t for t, e in zip(texts, embeddings) if e is None))
+        if not missing:
+            return embeddings
+
+        with self._lock:
+            self.misses += len(missing)
+        fetched = dict(zip(missing, fetch_many(missing)))
+        for text, embedding in fetched.items():
+            self.set(text, model, embedding)
+
+        return [e if e is not None else fetched[t] for t, e in zip(texts, embeddings)]
+
+    def stats(self):
+        memory = self.memory.stats()
+        total = memory["hits"] + self.disk_hits + self.misses
+        return {
+            "memory_size": memory["size"],
+            "memory_hits": memory["hits"],
+            "memory_evictions": memory["evictions"],
+            "disk_hits": self.disk_hits,
+            "disk_expired": self.disk_expired,
+            "disk_pruned": self.disk_pruned,
+            "misses": self.misses,
+            "hit_ratio": (memory["hits"] + self.disk_hits) / total if total else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
+
+
+class RecommendationCache:
+    # === 推薦結果快取 ===
+    #* key = (正規化問句, n_results, collection 名稱, 目錄版本, 篩選條件)；版本變更時整個清空
+
+    def __init__(self, max_size=1024, ttl=None):
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.version = None
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def _check_version(self, version):
+        if version == self.version:
+            return
+
+        with self._lock:
+            if version != self.version:
+                if self.version is not None:
+                    self.memory.clear()
+                    self.invalidations += 1
+                self.version = version
+
+    def make_key(self, question, n_results, collection_name, version, filters=None):
+        return (normalize_text(question), n_results, collection_name, version, filters or None)
+
+    def get(self, question, n_results, collection_name, version, filters=None):
+        self._check_version(version)
+        return self.memory.get(self.make_key(question, n_results, collection_name, version, filters))
+
+    def set(self, question, n_results, collection_name, version, result, filters=None):
+        self._check_version(version)
+        self.memory.set(self.make_key(question, n_results, collection_name, version, filters), result)
+
+    def stats(self):
+        return dict(self.memory.stats(), version=self.version, invalidations=self.invalidations)
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+import uuid
+
+
+# === 課程目錄版本 ===
+#* 建庫腳本每次更新 collection 後寫入新版本號，服務端據此自動讓快取失效
+
+def version_path(chroma_dir, collection_name):
+    return os.path.join(chroma_dir, f"{collection_name}.version")
+
+def new_version():
+    return f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+def bump_version(chroma_dir, collection_name, version=None):
+    #* version 可由呼叫端先產生 (例如先以同一版本號發佈索引快照)
+    version = version or new_version()
+    path = version_path(chroma_dir, collection_name)
+    tmp_path = f"{path}.tmp"
+
+    os.makedirs(chroma_dir, exist_ok=True)
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp_path, path)
+    return version
+
+def read_version(chroma_dir, collection_name):
+    try:
+        with open(version_path(chroma_dir, collection_name), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+class CatalogVersion:
+    # === 讀取目錄版本，最多每 check_interval 秒看一次檔案 ===
+
+    def __init__(self, chroma_dir, collection_name, check_interval=1.0):
+        self.chroma_dir = chroma_dir
+        self.collection_name = collection_name
+        self.check_interval = check_interval
+
+        self._version = read_version(chroma_dir, collection_name)
+        self._checked_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval:
+                    self._version = read_version(self.chroma_dir, self.collection_name)
+                    self._checked_at = now
+        return self._version
+
+
+class CatalogVersions:
+    # === 多個版本來源的組合 (CatalogVersion 或其他有 get() 的物件)，任一個更新都會讓快取失效 ===
+
+    def __init__(self, versions):
+        self.versions = versions
+
+    def get(self):
+        return "|".join(version.get() for version in self.versions)
@@ -1,12 +1,29 @@
 
-from chromadb import PersistentClient
+from concurrent.futures import TimeoutError as FutureTimeout
 from dotenv import load_dotenv
+from functools import partial
+from modules.batcher import MicroBatcher
+from modules.cache import EmbeddingCache, LRUCache, RecommendationCache, normalize_text
+from modules.catalog_version import CatalogVersion, CatalogVersions
+from modules.lexical_index import LexicalIndex, key_terms, lexical_index_path, reciprocal_rank_fusion
+from modules.local_encoder import LocalEncoder
+from modules.metrics import metrics
+from modules.popular import PopularCourses, popular_courses_path
+from modules.resilience import Dependency, DependencyUnavailable, Deadline, DeadlineExceeded, deadline_scope
+from modules.semantic_cache import SemanticCache
+from modules.shards import PartialResult, ShardFanOut, collection_space, merge_results, parse_shards
+from modules.snapshot import SnapshotManager
+from modules.vector_index import NumpyIndex
+import logging
 import os
-import openai
+import threading
+import time
 
 # 讀取 .env 檔案
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class Config:
     
     def __init__(self):
@@ -16,49 +33,478 @@ class Config:
         
         self.openai_api_key = None
         
+        self.openai = None
         self.db_client = None
         self.collections = None
+        self.index_ready = False
+        self.init_lock = threading.Lock()
+        self.warmup_on_start = False
         self.chroma_dir = "chroma_db"
         self.collection_name = "sat_courses_openai"
+        self.retrieval_backend = "chroma"                   #? chroma | numpy | snapshot
+        self.snapshots = None               #? 使用中的 index / lexical_index 由 SnapshotManager 持有，可整組原子替換
+        self.snapshot_check_interval = 2.0  #? 秒，snapshot 後端檢查新快照的間隔
+        self.index_quantization = None      #? None | float16 | int8，numpy / snapshot 後端第一階段掃描用的壓縮向量
+        self.index_dimensions = 0           #? >0 時第一階段只用前 N 維 (text-embedding-3 系列可截斷)
+        self.rerank_factor = 4              #? 候選數 = n_results * rerank_factor，再以原始向量精確重排
+        self.embedding_model = "text-embedding-3-small"     #? 或 "text-embedding-ada-002"
+        
+        self.query_encoder = "openai"       #? openai | local (ONNX Runtime 本機模型，搭配 embedding.py 建立的 sat_courses)
+        self.local_encoder = None
+        self.local_encoder_dir = "models/all-MiniLM-L6-v2-onnx"
+        self.local_encoder_threads = 1
+        self.local_encoder_workers = 2
+        self.local_encoder_int8 = True
+        
+        self.extra_collections = ""         #? 其他平台 / 其他模型的 collection，逗號分隔，可用 name@model 指定模型
+        self.shards = []
+        self.shard_fan_out = None
+        self.shard_timeout_ms = 800
+        
+        self.lexical_search = True          #? 有詞彙索引檔 (建庫時產生) 才會啟用混合檢索
+        self.hybrid_candidates = 20         #? 向量與詞彙端各取幾筆候選做 RRF 融合
+        self.rrf_k = 60
+        self.lexical_skip_max_terms = 4     #? 關鍵詞數不超過此值且有課程完全命中的問句略過 embedding (0 關閉)
+        
+        self.embedding_cache = None
+        self.embedding_cache_path = "cache/embedding_cache.db"
+        self.embedding_cache_size = 4096
+        self.embedding_cache_ttl  = None
+        self.embedding_cache_disk_size = 100000     #? 磁碟層最多保留幾筆 (0 表示不限制)
+        
+        self.catalog_version = None
+        self.result_cache = None
+        self.result_cache_size = 1024       #? 0 表示關閉
+        
+        self.semantic_cache = None
+        self.semantic_cache_size = 0        #? 0 表示關閉
+        self.semantic_cache_threshold  = 0.92
+        self.semantic_cache_audit_rate = 0.01
+        
+        self.query_log_path = None          #? 記錄問句供離線重播調整門檻
+        self.query_log_lock = threading.Lock()
         
+        self.line_api_host  = None          #? 預設為 https://api.line.me，可指向本機 stub server
+        self.line_pool_size = 10
+        self.line_timeout   = 10.0
+        
+        self.webhook_workers    = 4         #? 0 表示維持同步處理
+        self.webhook_queue_size = 256
+        self.webhook_dedup_ttl  = 3600      #? 秒，已處理的 webhookEventId 保留多久 (LINE 重送的事件直接丟棄)
+        self.webhook_dedup_size = 10000
+        self.webhook_dedup_path = None      #? SQLite 路徑；多個 gunicorn worker 共用去重紀錄
+        
+        self.reply_budget_ms = 8000         #? 從 LINE 送出事件起算，推薦結果必須在此時間內產生 (reply token 約 1 分鐘失效)
+        self.embedding_timeout_ms = 3000    #? 單次 OpenAI embedding 呼叫上限 (另受請求剩餘時間限制)
+        self.vector_timeout_ms = 2000       #? 單次 Chroma 查詢上限
+        self.breaker_failures = 5           #? 連續失敗幾次後斷路器開啟
+        self.breaker_reset_s = 30.0         #? 斷路器開啟後多久放行試探請求
+        self.embedding_dependency = None
+        self.vector_dependency = None
+        self.popular_courses = None
+        self.fallback_cache = None          #? 最近成功的推薦結果 (不分目錄版本)，相依服務故障時優先使用
+        self.fallback_cache_size = 1024     #? 0 表示關閉
+        
+        self.n_results = 3
+        self.batcher = None
+        self.batch_max_size = 32            #? 1 表示不做批次
+        self.batch_max_wait_ms = 5
+        self.batch_workers = 2              #? 同時處理批次的執行緒數
+        
+        #* Chroma / OpenAI 延遲到第一次使用 (或 warmup) 才初始化，import 時只讀設定
         self.read_env_var()
-        self.set_openai_api_key()
-        self.init_chroma()
+        self.init_local_encoder()
+        self.init_snapshots()
+        self.init_shards()
+        self.init_embedding_cache()
+        self.init_result_cache()
+        self.init_resilience()
+        self.init_batcher()
     
     def read_env_var(self):
         self.linebot_access_token  = os.getenv('CHANNEL_ACCESS_TOKEN')
         self.linebot_access_secret = os.getenv('CHANNEL_SECRET')
         self.openai_api_key = os.getenv("OPAI_API_KEY")
+        
+        self.query_encoder = os.getenv("QUERY_ENCODER", self.query_encoder)
+        self.collection_name = os.getenv("COLLECTION_NAME") or ("sat_courses" if self.query_encoder == "local"
+                                                                else self.collection_name)
+        self.local_encoder_dir = os.getenv("LOCAL_ENCODER_DIR", self.local_encoder_dir)
+        self.local_encoder_threads = int(os.getenv("LOCAL_ENCODER_THREADS", self.local_encoder_threads))
+        self.local_encoder_workers = int(os.getenv("LOCAL_ENCODER_WORKERS", self.local_encoder_workers))
+        self.local_encoder_int8 = os.getenv("LOCAL_ENCODER_INT8", "1") == "1"
+        
+        self.retrieval_backend = os.getenv("RETRIEVAL_BACKEND", self.retrieval_backend)
+        self.snapshot_check_interval = float(os.getenv("SNAPSHOT_CHECK_INTERVAL", self.snapshot_check_interval))
+        self.index_quantization = os.getenv("INDEX_QUANTIZATION") or None
+        self.index_dimensions = int(os.getenv("INDEX_DIMENSIONS", self.index_dimensions))
+        self.rerank_factor = int(os.getenv("RERANK_FACTOR", self.rerank_factor))
+        self.extra_collections = os.getenv("EXTRA_COLLECTIONS", self.extra_collections)
+        self.shard_timeout_ms = float(os.getenv("SHARD_TIMEOUT_MS", self.shard_timeout_ms))
+        self.warmup_on_start = os.getenv("WARMUP", "0") == "1"
+        
+        self.lexical_search = os.getenv("LEXICAL_SEARCH", "1") == "1"
+        self.hybrid_candidates = int(os.getenv("HYBRID_CANDIDATES", self.hybrid_candidates))
+        self.rrf_k = int(os.getenv("RRF_K", self.rrf_k))
+        self.lexical_skip_max_terms = int(os.getenv("LEXICAL_SKIP_MAX_TERMS", self.lexical_skip_max_terms))
+        
+        self.embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", self.embedding_cache_path)
+        self.embedding_cache_size = int(os.getenv("EMBEDDING_CACHE_SIZE", self.embedding_cache_size))
+        if os.getenv("EMBEDDING_CACHE_TTL"):
+            self.embedding_cache_ttl = float(os.getenv("EMBEDDING_CACHE_TTL"))
+        self.embedding_cache_disk_size = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", self.embedding_cache_disk_size))
+        
+        self.result_cache_size = int(os.getenv("RESULT_CACHE_SIZE", self.result_cache_size))
+        
+        self.semantic_cache_size = int(os.getenv("SEMANTIC_CACHE_SIZE", self.semantic_cache_size))
+        self.semantic_cache_threshold  = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", self.semantic_cache_threshold))
+        self.semantic_cache_audit_rate = float(os.getenv("SEMANTIC_CACHE_AUDIT_RATE", self.semantic_cache_audit_rate))
+        self.query_log_path = os.getenv("QUERY_LOG_PATH") or None
+        
+        self.line_api_host  = os.getenv("LINE_API_HOST") or None
+        self.line_pool_size = int(os.getenv("LINE_POOL_SIZE", self.line_pool_size))
+        self.line_timeout   = float(os.getenv("LINE_TIMEOUT", self.line_timeout))
+        
+        self.webhook_workers    = int(os.getenv("WEBHOOK_WORKERS", self.webhook_workers))
+        self.webhook_queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", self.webhook_queue_size))
+        self.webhook_dedup_ttl  = float(os.getenv("WEBHOOK_DEDUP_TTL", self.webhook_dedup_ttl))
+        self.webhook_dedup_size = int(os.getenv("WEBHOOK_DEDUP_SIZE", self.webhook_dedup_size))
+        self.webhook_dedup_path = os.getenv("WEBHOOK_DEDUP_PATH") or None
+        
+        self.batch_max_size    = int(os.getenv("RECOMMEND_BATCH_SIZE", self.batch_max_size))
+        self.batch_max_wait_ms = float(os.getenv("RECOMMEND_BATCH_WAIT_MS", self.batch_max_wait_ms))
+        self.batch_workers     = int(os.getenv("RECOMMEND_BATCH_WORKERS", self.batch_workers))
+        
+        self.reply_budget_ms      = float(os.getenv("REPLY_BUDGET_MS", self.reply_budget_ms))
+        self.embedding_timeout_ms = float(os.getenv("EMBEDDING_TIMEOUT_MS", self.embedding_timeout_ms))
+        self.vector_timeout_ms    = float(os.getenv("VECTOR_TIMEOUT_MS", self.vector_timeout_ms))
+        self.breaker_failures     = int(os.getenv("BREAKER_FAILURES", self.breaker_failures))
+        self.breaker_reset_s      = float(os.getenv("BREAKER_RESET_S", self.breaker_reset_s))
+        self.fallback_cache_size  = int(os.getenv("FALLBACK_CACHE_SIZE", self.fallback_cache_size))
     
-    def set_openai_api_key(self):
+    def init_openai(self):
+        #* openai 套件 import 成本高，第一次需要 embedding 時才載入
+        import openai
+        
         openai.api_key = self.openai_api_key
+        self.openai = openai
+    
+    def init_local_encoder(self):
+        #* 本機模型取代 OpenAI 產生查詢向量；embedding_model 改為本機模型名稱 (快取 key、shard 分組都依此判斷)
+        if self.query_encoder != "local":
+            return
+        
+        self.local_encoder = LocalEncoder(self.local_encoder_dir,
+                                          threads=self.local_encoder_threads,
+                                          workers=self.local_encoder_workers,
+                                          quantized=self.local_encoder_int8)
+        self.embedding_model = self.local_encoder.model
+        metrics.register_stats("local_encoder", self.local_encoder.stats)
+    
+    def init_snapshots(self):
+        self.snapshots = SnapshotManager(self.chroma_dir, self.collection_name,
+                                         check_interval=self.snapshot_check_interval,
+                                         lexical=self.lexical_search,
+                                         n_results=self.n_results,
+                                         index_options=self.index_options())
+        if self.retrieval_backend == "snapshot":
+            metrics.register_stats("snapshot", self.snapshots.stats)
+    
+    def index_options(self):
+        return {"quantization": self.index_quantization,
+                "dimensions": self.index_dimensions or None,
+                "rerank": self.rerank_factor}
+    
+    @property
+    def index(self):
+        #* 請求進行中 (pin) 時回傳該請求開始時的快照，不受背景切換影響
+        return self.snapshots.current().index
+    
+    @index.setter
+    def index(self, index):
+        self.snapshots.swap(self.snapshots.active.replace(index=index))
+    
+    @property
+    def lexical_index(self):
+        return self.snapshots.current().lexical_index
+    
+    @lexical_index.setter
+    def lexical_index(self, lexical_index):
+        self.snapshots.swap(self.snapshots.active.replace(lexical_index=lexical_index))
+    
+    def init_shards(self):
+        #* 只解析設定，collection 在 init_chroma 時才連線
+        self.shards = parse_shards(self.extra_collections, self.embedding_model)
+        if not self.shards:
+            return
+        
+        self.shard_fan_out = ShardFanOut(self.shards, timeout=self.shard_timeout_ms / 1000)
+        metrics.register_stats("shards", self.shard_fan_out.stats)
+    
+    def init_embedding_cache(self):
+        #* EMBEDDING_CACHE_PATH 設為空字串可關閉快取
+        if not self.embedding_cache_path:
+            return
+        
+        self.embedding_cache = EmbeddingCache(path=self.embedding_cache_path,
+                                              max_size=self.embedding_cache_size,
+                                              ttl=self.embedding_cache_ttl,
+                                              disk_max_size=self.embedding_cache_disk_size)
+        metrics.register_stats("embedding_cache", self.embedding_cache.stats)
+    
+    def init_result_cache(self):
+        #* snapshot 後端以使用中的快照版本作為目錄版本，切換完成的同時快取失效
+        if self.retrieval_backend == "snapshot":
+            primary = self.snapshots
+        else:
+            primary = CatalogVersion(self.chroma_dir, self.collection_name)
+        
+        if self.shards:
+            self.catalog_version = CatalogVersions([primary] + [CatalogVersion(self.chroma_dir, shard.name)
+                                                                for shard in self.shards])
+        else:
+            self.catalog_version = primary
+        if self.result_cache_size > 0:
+            self.result_cache = RecommendationCache(max_size=self.result_cache_size)
+            metrics.register_stats("result_cache", self.result_cache.stats)
+        
+        if self.semantic_cache_size > 0:
+            self.semantic_cache = SemanticCache(capacity=self.semantic_cache_size,
+                                                threshold=self.semantic_cache_threshold,
+                                                audit_rate=self.semantic_cache_audit_rate)
+            metrics.register_stats("semantic_cache", self.semantic_cache.stats)
+    
+    def init_resilience(self):
+        #* OpenAI embedding 與 Chroma 查詢各自有逾時與斷路器；NumPy / snapshot 索引在行程內計算，不經過斷路器
+        self.embedding_dependency = Dependency("embedding", self.embedding_timeout_ms / 1000,
+                                               failure_threshold=self.breaker_failures,
+                                               reset_timeout=self.breaker_reset_s)
+        self.vector_dependency = Dependency("vector_query", self.vector_timeout_ms / 1000,
+                                            failure_threshold=self.breaker_failures,
+                                            reset_timeout=self.breaker_reset_s)
+        metrics.register_stats("embedding_dependency", self.embedding_dependency.stats)
+        metrics.register_stats("vector_dependency", self.vector_dependency.stats)
+        
+        if self.fallback_cache_size > 0:
+            self.fallback_cache = LRUCache(max_size=self.fallback_cache_size)
+            metrics.register_stats("fallback_cache", self.fallback_cache.stats)
+    
+    def new_deadline(self, timestamp_ms=None):
+        #* timestamp_ms: webhook 事件時間，扣掉排隊等已經花掉的時間
+        budget = self.reply_budget_ms / 1000
+        return Deadline.from_event(timestamp_ms, budget) if timestamp_ms else Deadline(budget)
     
     def init_chroma(self):
+        from chromadb import PersistentClient
+        
         self.db_client = PersistentClient(path=self.chroma_dir)
         if self.collection_name not in [c.name for c in self.db_client.list_collections()]:
             print(f"❌ 找不到 collection: {self.collection_name}")
         
         else:
             self.collections = self.db_client.get_collection(name=self.collection_name)
+        
+        for shard in self.shards:
+            if not shard.available:
+                shard.connect(self.db_client, self.retrieval_backend, self.index_options())
+    
+    def init_index(self):
+        #* numpy 後端：啟動時一次載入全部向量與 metadata 到記憶體
+        if self.retrieval_backend != "numpy" or self.collections is None or self.index is not None:
+            return
+        
+        self.index = NumpyIndex.from_collection(self.collections, **self.index_options())
+        print(f"✅ 已載入 NumPy 索引: {len(self.index)} 筆課程")
+    
+    def init_snapshot(self):
+        #* snapshot 後端：載入建庫腳本發佈的最新快照，之後由背景執行緒監看新版本並原子替換
+        if self.index is None:
+            self.snapshots.refresh()
+        self.snapshots.start()
+    
+    def init_lexical_index(self):
+        path = lexical_index_path(self.chroma_dir, self.collection_name)
+        if not self.lexical_search or self.lexical_index is not None or not os.path.exists(path):
+            return
+        
+        self.lexical_index = LexicalIndex.load(path)
+        print(f"✅ 已載入詞彙索引: {len(self.lexical_index)} 筆課程")
+    
+    def init_popular_courses(self):
+        path = popular_courses_path(self.chroma_dir, self.collection_name)
+        if self.popular_courses is not None or not os.path.exists(path):
+            return
+        
+        self.popular_courses = PopularCourses.load(path)
+        print(f"✅ 已載入熱門課程: {len(self.popular_courses)} 筆課程")
+    
+    def ensure_index(self):
+        if self.index_ready:
+            return
+        
+        with self.init_lock:
+            if self.index_ready:
+                return
+            
+            if self.retrieval_backend == "snapshot":
+                self.init_snapshot()
+                #* 主索引來自快照，只有額外 shard 需要 Chroma 連線
+                if self.shards and self.db_client is None:
+                    self.init_chroma()
+            else:
+                if self.collections is None:
+                    self.init_chroma()
+                self.init_index()
+                self.init_lexical_index()
+            self.init_popular_courses()
+            #* collection 尚未建立時保持未就緒，下次請求再試
+            self.index_ready = self.collections is not None or self.index is not None
+    
+    def warmup(self):
+        #* 預先載入索引並跑一次假查詢，讓第一位使用者不用等初始化
+        start = time.time()
+        if self.local_encoder is not None:
+            self.local_encoder.encode(["warmup"])
+        
+        self.ensure_index()
+        if not self.index_ready:
+            return
+        
+        if self.index is not None:
+            dim = self.index.matrix.shape[1]
+        else:
+            sample = self.collections.get(limit=1, include=["embeddings"])
+            if len(sample["embeddings"]) == 0:
+                return
+            dim = len(sample["embeddings"][0])
+        
+        self._query([[0.0] * dim], self.n_results)
+        print(f"✅ 索引預熱完成，耗時: {time.time() - start:.2f} 秒")
+    
+    def after_fork(self):
+        #* gunicorn worker fork 之後重新開啟 Chroma 連線；NumPy 索引為唯讀，直接沿用父行程的記憶體分頁
+        self.db_client = None
+        self.collections = None
+        for shard in self.shards:
+            shard.collection = None
+        if self.retrieval_backend == "snapshot" and self.index is not None:
+            self.snapshots.start()
+        #* shard 的記憶體索引直接沿用；只靠 Chroma 連線的 shard 已斷線，保持未就緒讓 ensure_index 重新連線，不會默默略過
+        self.index_ready = self.index is not None and all(shard.available for shard in self.shards)
+    
+    def init_batcher(self):
+        if self.batch_max_size <= 1:
+            return
+        
+        self.batcher = MicroBatcher(self._process_batch,
+                                    max_batch_size=self.batch_max_size,
+                                    max_wait=self.batch_max_wait_ms / 1000,
+                                    workers=self.batch_workers)
+        metrics.register_stats("batcher", self.batcher.stats)
+    
+    def _request_embeddings(self, texts, model=None):
+        #* embeddings API 可一次接受多筆輸入，回傳順序與輸入相同
+        if self.local_encoder is not None and (model or self.embedding_model) == self.local_encoder.model:
+            with metrics.timer("embedding_local"):
+                return self.local_encoder.encode(texts)
+        
+        return self.embedding_dependency.call(self._request_remote_embeddings, texts, model or self.embedding_model)
+    
+    def _request_remote_embeddings(self, texts, model):
+        if self.openai is None:
+            self.init_openai()
+        
+        #? 逾時由 embedding_dependency 控制；SDK 端的 timeout 讓被放棄的請求也能盡快結束
+        with metrics.timer("embedding"):
+            response = self.openai.embeddings.create(
+                model=model,
+                input=texts,
+                timeout=self.embedding_timeout_ms / 1000
+            )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+    
+    def _request_embedding(self, text):
+        return self._request_embeddings([text])[0]
     
     def _fetch_embedding(self, text):
-        response = openai.embeddings.create(
-            model="text-embedding-3-small",  # 或 "text-embedding-ada-002"
-            input=text
-        )
-        return response.data[0].embedding
-
-    def recommendation(self, question):
-        embedding = self._fetch_embedding(question)
-        result = self.collections.query(
-            query_embeddings=[embedding],
-            n_results=3
-        )
-        
-        result_dict = {}
-        for idx, (doc, meta, dist) in enumerate(zip(result["documents"][0],
-                                                    result["metadatas"][0],
-                                                    result["distances"][0])):
+        return self._fetch_embeddings([text])[0]
+    
+    def _fetch_embeddings(self, texts, model=None):
+        model = model or self.embedding_model
+        if self.embedding_cache is None:
+            return self._request_embeddings(texts, model)
+        
+        return self.embedding_cache.get_or_compute_many(texts, model, partial(self._request_embeddings, model=model))
+    
+    def _query(self, embeddings, n_results, filters=None, questions=None):
+        #* 有額外 shard 時平行查詢，主 collection 在目前執行緒查詢；逾時或失敗的 shard 直接略過
+        #* 其他 embedding 模型的 shard 需要原始問句 (questions) 才能查詢，沒有時略過
+        self.ensure_index()
+        if not self.shards:
+            return self._query_primary(embeddings, n_results, filters)
+        
+        calls = {}
+        for shard in self.shards:
+            if not shard.available:
+                continue
+            if shard.model == self.embedding_model:
+                calls[shard] = partial(shard.query, embeddings, n_results, filters)
+            elif questions is not None:
+                calls[shard] = partial(self._query_shard_model, shard, questions, n_results, filters)
+        
+        futures, deadline = self.shard_fan_out.submit(calls)
+        results = [(self._query_primary(embeddings, n_results, filters), self._primary_space())]
+        collected = self.shard_fan_out.collect(futures, deadline)
+        for shard, result in collected.items():
+            results.append((result, shard.space))
+        
+        merged = merge_results(results, n_results)
+        if len(collected) < len(calls):
+            #* 有 shard 逾時或失敗：結果仍可回覆，但標記為部分結果，不寫入快取
+            metrics.inc("shard_partial")
+            merged["partial"] = True
+        return merged
+    
+    def _query_shard_model(self, shard, questions, n_results, filters):
+        return shard.query(self._fetch_embeddings(questions, shard.model), n_results, filters)
+    
+    def _primary_space(self):
+        return self.index.space if self.index is not None else collection_space(self.collections)
+    
+    def _query_primary(self, embeddings, n_results, filters=None):
+        #* 篩選條件下推：NumPy 索引用預先建好的 bitmap，Chroma 轉成 where 子句
+        with metrics.timer("vector_query"):
+            if self.index is not None:
+                return self.index.query(embeddings, n_results=n_results, filters=filters)
+            
+            if self.collections is None:
+                raise DependencyUnavailable(f"collection 尚未就緒: {self.collection_name}")
+            
+            return self.vector_dependency.call(
+                self.collections.query,
+                query_embeddings=embeddings,
+                n_results=n_results,
+                where=filters.where() if filters else None
+            )
+    
+    def _query_each(self, embeddings, n_results, filters_list, questions=None):
+        #* 篩選條件相同的問句合併成一次查詢，回傳每個問句各自的結果 (單一查詢格式)
+        groups = {}
+        for i, filters in enumerate(filters_list):
+            groups.setdefault(filters or None, []).append(i)
+        
+        results = [None] * len(embeddings)
+        for filters, indices in groups.items():
+            result = self._query([embeddings[i] for i in indices], n_results, filters,
+                                 questions=[questions[i] for i in indices] if questions else None)
+            for j, i in enumerate(indices):
+                results[i] = {key: [result[key][j]] for key in ("ids", "metadatas", "distances")}
+                results[i]["partial"] = result.get("partial", False)
+        return results
+    
+    def _format_result(self, result, i):
+        result_dict = PartialResult() if result.get("partial") else {}
+        for idx, (meta, dist) in enumerate(zip(result["metadatas"][i], result["distances"][i])):
             result_dict[idx] = {
                 'cource': f"{meta['title']}",
                 'teacher': f"{meta['teacher']}",
@@ -68,9 +514,256 @@ class Config:
                 'duration': f"{meta['duration']}",
                 'price': f"{meta['price']}",
                 'image': f"{meta['image']}",
-                'relative': f"{dist:.1f}"
+                'relative': f"{dist:.1f}" if dist is not None else "-"     #? 只由詞彙檢索取得的課程沒有向量距離
             }
             
         return result_dict
+    
+    @staticmethod
+    def _same_courses(a, b):
+        return [r['link'] for r in a.values()] == [r['link'] for r in b.values()]
+    
+    def _lexical_matches(self, question, hits):
+        #* 短關鍵字 (講師名、分類名、課名片段) 時，回傳包含所有關鍵詞的文件位置；不符合條件回傳空清單
+        if not hits or not 0 < len(key_terms(question)) <= self.lexical_skip_max_terms:
+            return []
+        
+        return [position for position, _ in hits[:self.n_results]
+                if self.lexical_index.coverage(question, position) >= 1.0]
+    
+    def _document_embeddings(self, doc_ids):
+        #* 取出已建庫課程的向量 (本機讀取，不呼叫 embedding API)
+        if self.index is not None:
+            return self.index.embeddings(doc_ids)
+        
+        if self.collections is None:
+            raise DependencyUnavailable(f"collection 尚未就緒: {self.collection_name}")
+        
+        data = self.vector_dependency.call(self.collections.get, ids=list(dict.fromkeys(doc_ids)), include=["embeddings"])
+        by_id = dict(zip(data["ids"], data["embeddings"]))
+        return [list(by_id[doc_id]) for doc_id in doc_ids]
+    
+    def _recommend_lexical(self, matches, filters_list):
+        #* 詞彙端完全命中的課程排前面，不足 n 筆時以第一名課程的向量找相似課程補滿
+        anchors = [self.lexical_index.ids[positions[0]] for positions in matches]
+        neighbour_results = self._query_each(self._document_embeddings(anchors), self.n_results * 2, filters_list)
+        
+        results = []
+        for positions, result in zip(matches, neighbour_results):
+            neighbours = {doc_id: (meta, dist) for doc_id, meta, dist in zip(result["ids"][0],
+                                                                             result["metadatas"][0],
+                                                                             result["distances"][0])}
+            ids = [self.lexical_index.ids[position] for position in positions]
+            ids += [doc_id for doc_id in result["ids"][0] if doc_id not in ids]
+            
+            metadatas, distances = [], []
+            for doc_id in ids[:self.n_results]:
+                meta, dist = neighbours.get(doc_id) or (self.lexical_index.metadatas[self.lexical_index.positions[doc_id]], None)
+                metadatas.append(meta)
+                distances.append(dist)
+            results.append(self._format_result({"metadatas": [metadatas], "distances": [distances],
+                                                "partial": result.get("partial", False)}, 0))
+        
+        return results
+    
+    def _fuse(self, result, i, hits):
+        #* 向量與詞彙候選以 RRF 融合，回傳單一查詢的 collection.query 格式
+        lexical_ids = [self.lexical_index.ids[position] for position, _ in hits]
+        fused = reciprocal_rank_fusion([result["ids"][i], lexical_ids], k=self.rrf_k)[:self.n_results]
+        
+        vector_rows = {doc_id: (meta, dist) for doc_id, meta, dist in zip(result["ids"][i],
+                                                                          result["metadatas"][i],
+                                                                          result["distances"][i])}
+        metadatas, distances = [], []
+        for doc_id in fused:
+            meta, dist = vector_rows.get(doc_id) or (self.lexical_index.metadatas[self.lexical_index.positions[doc_id]], None)
+            metadatas.append(meta)
+            distances.append(dist)
+        
+        return {"ids": [fused], "metadatas": [metadatas], "distances": [distances], "partial": result.get("partial", False)}
+    
+    def _search(self, embeddings, lexical_hits, filters_list, questions=None):
+        #* 向量檢索；有詞彙索引時多取候選，再與詞彙結果融合
+        if self.lexical_index is None:
+            return [self._format_result(result, 0)
+                    for result in self._query_each(embeddings, self.n_results, filters_list, questions)]
+        
+        results = self._query_each(embeddings, max(self.hybrid_candidates, self.n_results), filters_list, questions)
+        return [self._format_result(self._fuse(result, 0, hits), 0) for result, hits in zip(results, lexical_hits)]
+    
+    def _recommend_batch(self, requests):
+        #* requests: [(問句, 篩選條件)]
+        #* 先做詞彙檢索，有把握的短關鍵字直接回傳，其餘問句才做 embedding + 向量檢索
+        self.ensure_index()
+        with self.snapshots.pin():
+            try:
+                return self._recommend_pinned(requests)
+            except DependencyUnavailable:
+                raise
+            except Exception:
+                if len(requests) == 1:
+                    raise
+                #* 單筆問句造成的錯誤不該拖垮同批其他請求：改為逐筆處理，失敗的那筆回傳 Exception
+                logger.exception("批次推薦失敗，改為逐筆處理 (%d 筆)", len(requests))
+                return [self._recommend_isolated(request) for request in requests]
+    
+    def _recommend_isolated(self, request):
+        try:
+            return self._recommend_pinned([request])[0]
+        except Exception as e:
+            return e
+    
+    def _process_batch(self, items):
+        #* items: [(問句, 篩選條件, Deadline)]，由 MicroBatcher 的執行緒呼叫
+        #* deadline_scope 是 thread-local，呼叫端的截止時間不會自動帶到批次執行緒：以同批最晚的截止時間為上限
+        #* (各呼叫端仍只等到自己的截止時間；有任一筆沒有截止時間就不設上限)
+        deadlines = [deadline for _, _, deadline in items]
+        latest = None if None in deadlines else max(deadlines, key=lambda deadline: deadline.expires_at)
+        with deadline_scope(latest):
+            return self._recommend_batch([(question, filters) for question, filters, _ in items])
+    
+    def _recommend_pinned(self, requests):
+        questions = [question for question, _ in requests]
+        filters_list = [filters for _, filters in requests]
+        results = [None] * len(requests)
+        lexical_hits = [None] * len(requests)
+        
+        if self.lexical_index is not None:
+            with metrics.timer("lexical_query"):
+                matches = {}
+                for i, question in enumerate(questions):
+                    lexical_hits[i] = self.lexical_index.search(question, self.hybrid_candidates, filters_list[i])
+                    positions = self._lexical_matches(question, lexical_hits[i])
+                    if positions:
+                        matches[i] = positions
+                
+                if matches:
+                    matched_results = self._recommend_lexical(list(matches.values()), [filters_list[i] for i in matches])
+                    for i, result_dict in zip(matches, matched_results):
+                        results[i] = result_dict
+                    metrics.inc("lexical_skip", len(matches))
+        
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            vector_results = self._recommend_vector([questions[i] for i in pending],
+                                                    [lexical_hits[i] for i in pending],
+                                                    [filters_list[i] for i in pending])
+            for i, r in zip(pending, vector_results):
+                results[i] = r
+        
+        return results
+    
+    def _recommend_vector(self, questions, lexical_hits, filters_list):
+        #* 一次批次 embedding + 一次多向量 query，再依序拆回各個問題
+        embeddings = self._fetch_embeddings(questions)
+        if self.semantic_cache is None:
+            return self._search(embeddings, lexical_hits, filters_list, questions)
+        
+        #* 先查語意快取，只對未命中 (或抽樣稽核) 的問句做向量檢索
+        version = self.catalog_version.get()
+        keys = [(self.n_results, self.collection_name, filters or None) for filters in filters_list]
+        results = [None] * len(questions)
+        audits = {}
+        
+        for i, (embedding, key) in enumerate(zip(embeddings, keys)):
+            reused, _ = self.semantic_cache.lookup(embedding, key, version)
+            if reused is not None and self.semantic_cache.should_audit():
+                audits[i] = reused
+                reused = None
+            results[i] = reused
+        
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            searched = self._search([embeddings[i] for i in pending],
+                                    [lexical_hits[i] for i in pending],
+                                    [filters_list[i] for i in pending],
+                                    [questions[i] for i in pending])
+            for i, result_dict in zip(pending, searched):
+                results[i] = result_dict
+                if i in audits:
+                    self.semantic_cache.record_audit(audits[i], results[i], same=self._same_courses)
+                elif not isinstance(result_dict, PartialResult):
+                    self.semantic_cache.add(embeddings[i], keys[i], results[i], version)
+        
+        return results
+
+    def _log_question(self, question):
+        with self.query_log_lock:
+            with open(self.query_log_path, "a", encoding="utf-8") as f:
+                f.write(question.replace("\n", " ") + "\n")
+    
+    def recommendation(self, question, filters=None, deadline=None):
+        #* filters: modules.query_filters.QueryFilters (價格 / 評分 / 分類)，由 parse_query 從問句解析
+        #* deadline: modules.resilience.Deadline，相依服務逾時、斷路器開啟或 collection 不存在時改回降級結果
+        with metrics.timer("recommendation"):
+            try:
+                with deadline_scope(deadline):
+                    result_dict = self._cached_recommendation(question, filters, deadline)
+            except DependencyUnavailable as e:
+                logger.warning("推薦改用降級結果: %s", e)
+                return self._fallback(question, filters)
+            except Exception:
+                logger.exception("推薦失敗，改用降級結果")
+                return self._fallback(question, filters)
+            
+            if self.fallback_cache is not None and result_dict:
+                self.fallback_cache.set((normalize_text(question), filters or None), result_dict)
+            return result_dict
+    
+    def _fallback(self, question, filters=None):
+        #* 依序嘗試：同一問句最近成功的結果 → 詞彙檢索 → 熱門課程 (學員數、評分)；都沒有時回傳空結果
+        metrics.inc("fallback")
+        if self.fallback_cache is not None:
+            result_dict = self.fallback_cache.get((normalize_text(question), filters or None))
+            if result_dict:
+                metrics.inc("fallback_cached")
+                return result_dict
+        
+        #? 索引初始化本身失敗時 (例如 Chroma 無法開啟)，詞彙索引與熱門課程仍可從本機檔案載入
+        if self.retrieval_backend != "snapshot":
+            self.init_lexical_index()
+        self.init_popular_courses()
+        
+        if self.lexical_index is not None:
+            hits = self.lexical_index.search(question, self.n_results, filters)
+            if hits:
+                metrics.inc("fallback_lexical")
+                return self._format_result(self.lexical_index.to_result(hits), 0)
+        
+        if self.popular_courses is not None:
+            result = self.popular_courses.top(self.n_results, filters)
+            if result["ids"][0]:
+                metrics.inc("fallback_popular")
+                return self._format_result(result, 0)
+        
+        metrics.inc("fallback_empty")
+        return {}
+    
+    def _cached_recommendation(self, question, filters=None, deadline=None):
+        if self.query_log_path:
+            self._log_question(question)
+        
+        if self.result_cache is None:
+            return self._recommend(question, filters, deadline)
+        
+        version = self.catalog_version.get()
+        result_dict = self.result_cache.get(question, self.n_results, self.collection_name, version, filters)
+        if result_dict is None:
+            result_dict = self._recommend(question, filters, deadline)
+            if not isinstance(result_dict, PartialResult):
+                self.result_cache.set(question, self.n_results, self.collection_name, version, result_dict, filters)
+        
+        return result_dict
+    
+    def _recommend(self, question, filters=None, deadline=None):
+        if self.batcher is not None:
+            #* 批次在背景執行緒處理，呼叫端只等到請求的截止時間
+            try:
+                return self.batcher.submit((question, filters, deadline), timeout=deadline.remaining() if deadline else None)
+            except FutureTimeout:
+                metrics.inc("recommendation_timeout")
+                raise DeadlineExceeded("推薦批次逾時")
+        
+        return self._recommend_batch([(question, filters)])[0]
 
 config = Config()
\ No newline at end of file
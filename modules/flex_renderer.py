@@ -0,0 +1,111 @@
+from linebot.v3.messaging import FlexBubble, FlexCarousel
+from modules.cache import LRUCache
+import copy
+import json
+import os
+import re
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "build", "flex_msg_template.json")
+DEFAULT_IMAGE = "https://developers-resource.landpress.line.me/fx/img/01_1_cafe.png"
+STAR_URL = "https://developers-resource.landpress.line.me/fx/img/review_{}_star_28.png"
+PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+def get_rate_contents(rate):
+    if isinstance(rate, str):
+        rate = round(float(rate), 1)
+
+    rate_list = []
+
+    for idx in range(1, 6):
+        rate_list.append({
+            "type": "icon",
+            "size": "sm",
+            "url": STAR_URL.format("gold" if idx <= rate else "gray")
+        })
+
+    rate_list.append({
+            "type": "text",
+            "text": f"{rate}",
+            "size": "sm",
+            "color": "#999999",
+            "margin": "md",
+            "flex": 0
+    })
+
+    return rate_list
+
+
+class FlexRenderer:
+    # === 預先編譯的 Flex 卡片渲染器 ===
+    #* 啟動時解析一次 flex_msg_template.json，記下所有 {{欄位}} 的位置，之後只需填值
+    #* 每門課的 FlexBubble 依卡片內容快取，回覆時直接組成 FlexCarousel，不再 json.dumps / from_json 來回轉換
+
+    def __init__(self, template_path=TEMPLATE_PATH, cache_size=1024):
+        with open(template_path, "r", encoding="utf-8") as f:
+            self.template = json.load(f)
+
+        self.slots = []
+        self._compile(self.template, ())
+        self.bubbles = LRUCache(max_size=cache_size)
+
+    def _compile(self, node, path):
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        else:
+            return
+
+        for key, value in items:
+            if isinstance(value, str) and PLACEHOLDER.search(value):
+                self.slots.append((path + (key,), value))
+            else:
+                self._compile(value, path + (key,))
+
+    def _fill(self, values):
+        bubble = copy.deepcopy(self.template)
+        for path, pattern in self.slots:
+            parent = bubble
+            for key in path[:-1]:
+                parent = parent[key]
+
+            whole = PLACEHOLDER.fullmatch(pattern)
+            if whole:
+                #* 整個欄位就是 placeholder 時直接放入值 (可為 list，例如星等)
+                parent[path[-1]] = values[whole.group(1)]
+            else:
+                parent[path[-1]] = PLACEHOLDER.sub(lambda m: str(values[m.group(1)]), pattern)
+
+        return bubble
+
+    @staticmethod
+    def format_relative(relative):
+        #* 只由詞彙檢索或降級回覆取得的課程沒有向量距離 (None / "-")，顯示 "-"；Flex 的 text 不可為空字串
+        if relative is None:
+            return "-"
+        if isinstance(relative, str):
+            try:
+                relative = round(float(relative), 1)
+            except ValueError:
+                return "-"
+        return f"{relative}"
+
+    def render_bubble_dict(self, cource_data):
+        values = dict(cource_data,
+                      image=cource_data.get('image') or DEFAULT_IMAGE,
+                      relative=self.format_relative(cource_data.get('relative')),
+                      rate_contents=get_rate_contents(cource_data['rate']))
+        return self._fill(values)
+
+    def render_bubble(self, cource_data):
+        #* 卡片只依課程 metadata 與距離而定，內容相同即可重用
+        key = tuple(sorted(cource_data.items()))
+        bubble = self.bubbles.get(key)
+        if bubble is None:
+            bubble = FlexBubble.from_dict(self.render_bubble_dict(cource_data))
+            self.bubbles.set(key, bubble)
+        return bubble
+
+    def render_carousel(self, results):
+        return FlexCarousel(contents=[self.render_bubble(result) for result in results.values()])
@@ -0,0 +1,121 @@
+from modules.cache import LRUCache
+import os
+import sqlite3
+import threading
+import time
+
+
+class EventDeduplicator:
+    # === Webhook 事件去重 (以 webhookEventId 為 key) ===
+    #* 回應太慢時 LINE 會重送同一事件 (deliveryContext.isRedelivery=true)，重複的事件在入列前就丟棄
+    #* 記憶體層：容量 + TTL 的 LRU；設定 path 時另以 SQLite 共用已處理的事件，讓多個 gunicorn worker 互相看得到
+
+    def __init__(self, ttl=3600, max_size=10000, path=None):
+        self.ttl = ttl                      #? 秒，事件 id 保留多久
+        self.path = path
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+
+        self.checked = 0
+        self.duplicates = 0
+        self.redeliveries = 0
+        self.redelivery_duplicates = 0
+        self.released = 0
+
+        self._conn = None
+        self._conn_pid = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    @staticmethod
+    def event_key(event):
+        #* 舊版 webhook 沒有 webhookEventId 時不去重
+        return getattr(event, "webhook_event_id", None)
+
+    @staticmethod
+    def is_redelivery(event):
+        context = getattr(event, "delivery_context", None)
+        return bool(getattr(context, "is_redelivery", False))
+
+    def _connect(self):
+        #* fork 之後不能沿用父行程的連線，依 pid 重新開啟
+        if self._conn is not None and self._conn_pid == os.getpid():
+            return self._conn
+
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                event_id TEXT PRIMARY KEY,
+                expire_at REAL
+            )
+        ''')
+
+        self._conn = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def _claim_shared(self, key, now):
+        #* 插入成功 (或舊紀錄已過期而被覆寫) 才算第一次看到；多個 worker 同時收到時只有一個會成功
+        conn = self._connect()
+        cursor = conn.execute(
+            "INSERT INTO webhook_events (event_id, expire_at) VALUES (?, ?) "
+            "ON CONFLICT(event_id) DO UPDATE SET expire_at=excluded.expire_at WHERE webhook_events.expire_at < ?",
+            (key, now + self.ttl, now)
+        )
+        if now - self._purged_at > self.ttl:
+            conn.execute("DELETE FROM webhook_events WHERE expire_at < ?", (now,))
+            self._purged_at = now
+        return cursor.rowcount == 1
+
+    def is_duplicate(self, event):
+        #* 第一次看到的事件會被記錄下來並回傳 False；重複事件回傳 True
+        key = self.event_key(event)
+        if key is None:
+            return False
+
+        redelivery = self.is_redelivery(event)
+        with self._lock:
+            self.checked += 1
+            self.redeliveries += redelivery
+
+            duplicate = self.memory.get(key) is not None
+            if not duplicate and self.path:
+                duplicate = not self._claim_shared(key, time.time())
+            self.memory.set(key, True)
+
+            if duplicate:
+                self.duplicates += 1
+                self.redelivery_duplicates += redelivery
+        return duplicate
+
+    def release(self, event):
+        #* 事件沒有被處理 (例如佇列已滿被丟棄) 時移除紀錄，讓 LINE 重送的那一份可以正常處理
+        key = self.event_key(event)
+        if key is None:
+            return
+
+        with self._lock:
+            self.released += 1
+            self.memory.delete(key)
+            if self.path:
+                self._connect().execute("DELETE FROM webhook_events WHERE event_id=?", (key,))
+
+    def stats(self):
+        return {
+            "size": len(self.memory),
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "redeliveries": self.redeliveries,
+            "redelivery_duplicates": self.redelivery_duplicates,
+            "released": self.released
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None and self._conn_pid == os.getpid():
+                self._conn.close()
+            self._conn = None
@@ -0,0 +1,171 @@
+from collections import Counter
+from modules.cache import normalize_text
+from modules.query_filters import MetadataFilterIndex
+import json
+import math
+import os
+import re
+
+import numpy as np
+
+#* 中日韓文字連續片段切成單字 + 雙字 n-gram，英數字以單字為單位
+TOKEN_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+|[a-z0-9]+")
+FIELD_WEIGHTS = {"title": 3, "teacher": 3, "category": 2, "intro": 1}     #? 欄位權重 (以詞頻倍數計)
+
+
+# === 斷詞 ===
+def tokenize(text):
+    tokens = []
+    for run in TOKEN_PATTERN.findall(normalize_text(text)):
+        if run.isascii():
+            tokens.append(run)
+            continue
+
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def key_terms(text):
+    #* 判斷是否「完全命中」時使用的詞：中日韓片段取雙字 (單字片段取單字)，英數字取整個單字
+    terms = set()
+    for run in TOKEN_PATTERN.findall(normalize_text(text)):
+        if run.isascii() or len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+def lexical_index_path(chroma_dir, collection_name):
+    return os.path.join(chroma_dir, f"{collection_name}.lexical.json")
+
+
+# === 建庫：逐筆累積倒排索引 ===
+class LexicalIndexBuilder:
+    #* 建庫腳本串流讀取課程時逐筆 add()，只保留詞頻不保留原文
+
+    def __init__(self, field_weights=FIELD_WEIGHTS):
+        self.field_weights = field_weights
+        self.ids = []
+        self.metadatas = []
+        self.doc_len = []
+        self.postings = {}
+
+    def add(self, doc_id, fields, metadata):
+        counts = Counter()
+        for field, text in fields.items():
+            weight = self.field_weights.get(field, 1)
+            for token in tokenize(text or ""):
+                counts[token] += weight
+
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        self.metadatas.append(metadata)
+        self.doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            docs, tfs = self.postings.setdefault(term, ([], []))
+            docs.append(position)
+            tfs.append(tf)
+
+    def data(self):
+        return {"ids": self.ids, "metadatas": self.metadatas, "doc_len": self.doc_len, "postings": self.postings}
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data(), f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+# === 排名融合 ===
+def reciprocal_rank_fusion(rankings, k=60):
+    #* 每個排名清單貢獻 1 / (k + 名次)，不需把 BM25 分數與向量距離換算到同一尺度
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: -scores[doc_id])
+
+
+class LexicalIndex:
+    # === 課程文字的倒排索引 + BM25 ===
+    #* 建庫時產生並存成 JSON；載入時先算好每個 posting 的 BM25 權重，查詢只剩陣列累加
+
+    def __init__(self, ids, metadatas, doc_len, postings, k1=1.2, b=0.75):
+        self.ids = list(ids)
+        self.metadatas = list(metadatas)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.filter_index = MetadataFilterIndex(self.metadatas)
+        self.k1 = k1
+        self.b = b
+
+        doc_len = np.asarray(doc_len, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if len(doc_len) else 0.0
+        n = len(self.ids)
+
+        self.postings = {}
+        for term, (docs, tfs) in postings.items():
+            docs = np.asarray(docs, dtype=np.int32)
+            tfs = np.asarray(tfs, dtype=np.float32)
+            idf = math.log(1.0 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = k1 * (1.0 - b + b * doc_len[docs] / max(avgdl, 1e-6))
+            self.postings[term] = (docs, (idf * tfs * (k1 + 1.0) / (tfs + norm)).astype(np.float32))
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(data["ids"], data["metadatas"], data["doc_len"], data["postings"])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_data(json.load(f))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, text, k=20, filters=None):
+        #* 回傳 [(文件位置, BM25 分數)]，依分數由高到低，只含有命中且符合篩選條件的文件
+        terms = set(tokenize(text))
+        if not terms or not self.ids:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                scores[posting[0]] += posting[1]
+
+        mask = self.filter_index.mask(filters)
+        if mask is not None:
+            scores[~mask] = 0.0
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(i), float(scores[i])) for i in matched]
+
+    def coverage(self, text, position):
+        #* 查詢關鍵詞有多少比例出現在該文件中
+        terms = key_terms(text)
+        if not terms:
+            return 0.0
+
+        matched = 0
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs = posting[0]
+            i = np.searchsorted(docs, position)
+            if i < len(docs) and docs[i] == position:
+                matched += 1
+        return matched / len(terms)
+
+    def to_result(self, hits):
+        #* 轉成與 collection.query 相同的格式 (單一查詢)；詞彙檢索沒有向量距離
+        return {
+            "ids": [[self.ids[i] for i, _ in hits]],
+            "metadatas": [[self.metadatas[i] for i, _ in hits]],
+            "distances": [[None] * len(hits)]
+        }
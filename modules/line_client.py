@@ -0,0 +1,100 @@
+from linebot.v3.messaging import (
+    ApiClient,
+    AsyncApiClient,
+    AsyncMessagingApi,
+    Configuration,
+    MessagingApi,
+    ReplyMessageRequest
+)
+from urllib3.connection import HTTPConnection
+import os
+import socket
+import threading
+
+
+def build_configuration(access_token, host=None, pool_size=10, keepalive=True):
+    configuration = Configuration(access_token=access_token, host=host)
+    configuration.connection_pool_maxsize = pool_size     #? 同一 host 可同時保留的連線數
+    if keepalive:
+        #* 開啟 TCP keep-alive，閒置連線不會被中間設備默默切斷
+        configuration.socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+    return configuration
+
+
+class LineMessagingClient:
+    # === 長駐、執行緒安全的 LINE Messaging API client ===
+    #* 整個行程共用同一個 ApiClient (urllib3 連線池)，不再每則訊息重新建立連線與 TLS handshake
+
+    def __init__(self, access_token, host=None, pool_size=10, timeout=10, keepalive=True):
+        self.configuration = build_configuration(access_token, host=host, pool_size=pool_size, keepalive=keepalive)
+        self.timeout = timeout              #? 秒，或 (connect, read)
+
+        self._api_client = None
+        self._api = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def api(self):
+        #* fork 之後不沿用父行程的連線池
+        if self._api is not None and self._pid == os.getpid():
+            return self._api
+
+        with self._lock:
+            if self._api is None or self._pid != os.getpid():
+                self._api_client = ApiClient(self.configuration)
+                self._api = MessagingApi(self._api_client)
+                self._pid = os.getpid()
+        return self._api
+
+    def reply(self, reply_token, messages):
+        return self.api.reply_message_with_http_info(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=messages
+            ),
+            _request_timeout=self.timeout
+        )
+
+    def close(self):
+        with self._lock:
+            if self._api_client is not None and self._pid == os.getpid():
+                self._api_client.close()
+            self._api_client = None
+            self._api = None
+
+
+class AsyncLineMessagingClient:
+    # === asyncio 版本，給非同步 webhook 路徑使用 (aiohttp 連線池) ===
+    #* 需在同一個 event loop 內建立與使用
+
+    def __init__(self, access_token, host=None, pool_size=10, timeout=10):
+        self.configuration = build_configuration(access_token, host=host, pool_size=pool_size, keepalive=False)
+        self.timeout = timeout
+
+        self._api_client = None
+        self._api = None
+
+    @property
+    def api(self):
+        if self._api is None:
+            self._api_client = AsyncApiClient(self.configuration)
+            self._api = AsyncMessagingApi(self._api_client)
+        return self._api
+
+    async def reply(self, reply_token, messages):
+        return await self.api.reply_message_with_http_info(
+            ReplyMessageRequest(
+                reply_token=reply_token,
+                messages=messages
+            ),
+            _request_timeout=self.timeout
+        )
+
+    async def close(self):
+        if self._api_client is not None:
+            await self._api_client.close()
+        self._api_client = None
+        self._api = None
@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import threading
+
+import numpy as np
+
+#* 查詢都是短句，不需要 tokenizers 自己的平行處理；也避免 fork 之後的警告與死鎖
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+class LocalEncoder:
+    # === 本機查詢向量 (ONNX Runtime，不需要 torch) ===
+    #* 模型目錄由 modules.build.export_onnx 產生：model.onnx / model_int8.onnx、tokenizer.json、encoder.json
+    #* session 與 tokenizer 延遲到第一次編碼才載入，fork 之後依 pid 重新載入
+    #* 大批次切成 batch_size 的小塊，由執行緒池平行送進 session (ONNX Runtime 執行時會釋放 GIL)
+
+    def __init__(self, model_dir, threads=1, workers=2, batch_size=32, quantized=True):
+        settings_path = os.path.join(model_dir, "encoder.json")
+        if not os.path.exists(settings_path):
+            raise FileNotFoundError(f"找不到本機模型: {model_dir}，請先執行 python -m modules.build.export_onnx")
+
+        with open(settings_path, "r", encoding="utf-8") as f:
+            self.settings = json.load(f)
+
+        self.model_dir = model_dir
+        self.model = self.settings["model"]             #? 與建庫時的模型名稱相同，作為 embedding 快取的 key
+        self.dim = self.settings["dim"]
+        self.threads = threads                          #? 每個 session 的 intra-op 執行緒數
+        self.workers = workers
+        self.batch_size = batch_size
+
+        int8_path = os.path.join(model_dir, "model_int8.onnx")
+        self.model_path = int8_path if quantized and os.path.exists(int8_path) else os.path.join(model_dir, "model.onnx")
+
+        self.calls = 0
+        self.texts = 0
+
+        self._session = None
+        self._tokenizer = None
+        self._input_names = set()
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._session is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._session is not None and self._pid == os.getpid():
+                return
+
+            import onnxruntime
+            from tokenizers import Tokenizer
+
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = onnxruntime.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+
+            tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+            tokenizer.enable_truncation(max_length=self.settings.get("max_length", 256))
+            tokenizer.enable_padding(pad_id=self.settings.get("pad_id", 0), pad_token=self.settings.get("pad_token", "[PAD]"))
+
+            self._input_names = {i.name for i in session.get_inputs()}
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="local-encoder") \
+                if self.workers > 1 else None
+            self._tokenizer = tokenizer
+            self._session = session
+            self._pid = os.getpid()
+
+    def _encode_batch(self, texts):
+        encodings = self._tokenizer.encode_batch(texts)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                 "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        #* 輸出為每個 token 的向量 (batch, seq, dim)，依匯出時的設定做池化與正規化 (與 SentenceTransformer 相同)
+        hidden = self._session.run(None, feeds)[0]
+        if self.settings.get("pooling", "mean") == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = attention_mask[:, :, None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+        if self.settings.get("normalize", True):
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32)
+
+    def encode(self, texts):
+        #* 回傳順序與輸入相同 (list of list，與 OpenAI embedding 相同格式)
+        self._load()
+        self.calls += 1
+        self.texts += len(texts)
+
+        chunks = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if self._executor is None or len(chunks) == 1:
+            results = [self._encode_batch(chunk) for chunk in chunks]
+        else:
+            results = list(self._executor.map(self._encode_batch, chunks))
+        return np.vstack(results).tolist() if results else []
+
+    def stats(self):
+        return {"calls": self.calls, "texts": self.texts}
@@ -0,0 +1,120 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+PREFIX = "learning_bot"
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    # === 固定 bucket 的延遲直方圖 (秒) ===
+    #* 每次記錄只做一次 bisect + 累加，開銷低，可常駐在正式環境
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        #* 由 bucket 線性內插估計分位數 (與 Prometheus histogram_quantile 相同作法)
+        if self.count == 0:
+            return 0.0
+
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count > 0:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                if upper == float("inf"):
+                    return lower
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-2]
+
+
+class MetricsRegistry:
+    # === 各階段延遲與計數器，輸出 Prometheus 文字格式 ===
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.stats_sources = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def register_stats(self, name, stats_func):
+        #* stats_func() 回傳 dict，數值欄位會輸出成 learning_bot_<name>_<key>
+        self.stats_sources[name] = stats_func
+
+    def render_prometheus(self):
+        lines = []
+
+        if self.histograms:
+            lines.append(f"# TYPE {PREFIX}_stage_seconds histogram")
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(h.buckets, h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound}"
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+            lines.append(f"# TYPE {PREFIX}_stage_latency_seconds gauge")
+            for stage, h in sorted(self.histograms.items()):
+                for q in QUANTILES:
+                    lines.append(f'{PREFIX}_stage_latency_seconds{{stage="{stage}",quantile="{q}"}} {h.quantile(q)}')
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {PREFIX}_{name}_total counter")
+            lines.append(f"{PREFIX}_{name}_total {value}")
+
+        for source, stats_func in sorted(self.stats_sources.items()):
+            for key, value in stats_func().items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                lines.append(f"# TYPE {PREFIX}_{source}_{key} gauge")
+                lines.append(f"{PREFIX}_{source}_{key} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        #* 給建庫 / 爬蟲腳本印出的各階段耗時摘要
+        lines = [f"{'階段':<24}{'次數':>8}{'總耗時(s)':>12}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}"]
+        for stage, h in sorted(self.histograms.items()):
+            lines.append(f"{stage:<26}{h.count:>8}{h.sum:>12.2f}"
+                         f"{h.quantile(0.5) * 1000:>10.1f}{h.quantile(0.95) * 1000:>10.1f}{h.quantile(0.99) * 1000:>10.1f}")
+        return "\n".join(lines)
+
+
+metrics = MetricsRegistry()
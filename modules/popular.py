@@ -0,0 +1,56 @@
+from modules.query_filters import MetadataFilterIndex
+import json
+import os
+
+import numpy as np
+
+def popular_courses_path(chroma_dir, collection_name):
+    return os.path.join(chroma_dir, f"{collection_name}.popular.json")
+
+
+# === 建庫：依學員數、評分排序的熱門課程清單 ===
+class PopularCoursesBuilder:
+    #* 建庫腳本串流讀取課程時逐筆 add()，與詞彙索引一起寫出
+    #* 學員數不放進 collection metadata，避免改變 content_hash 造成全部課程重新 embedding
+
+    def __init__(self):
+        self.items = []
+
+    def add(self, metadata, member_count):
+        self.items.append((member_count or 0, metadata.get("rating") or 0, metadata))
+
+    def save(self, path):
+        ranked = sorted(self.items, key=lambda item: (-item[0], -item[1]))
+        data = {"member_counts": [item[0] for item in ranked], "metadatas": [item[2] for item in ranked]}
+
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+class PopularCourses:
+    # === 熱門課程 (降級回覆用) ===
+    #* 不依賴 OpenAI / Chroma，只讀本機 JSON；篩選條件沿用 metadata bitmap
+
+    def __init__(self, metadatas, member_counts):
+        self.metadatas = list(metadatas)
+        self.member_counts = list(member_counts)
+        self.filter_index = MetadataFilterIndex(self.metadatas)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["metadatas"], data["member_counts"])
+
+    def __len__(self):
+        return len(self.metadatas)
+
+    def top(self, n, filters=None):
+        #* 清單已依熱門程度排序，回傳符合篩選條件的前 n 筆，格式與 collection.query 相同 (單一查詢)
+        mask = self.filter_index.mask(filters)
+        positions = np.flatnonzero(mask)[:n] if mask is not None else range(min(n, len(self.metadatas)))
+        metadatas = [self.metadatas[i] for i in positions]
+        return {"ids": [[meta["id"] for meta in metadatas]], "metadatas": [metadatas], "distances": [[None] * len(metadatas)]}
@@ -0,0 +1,135 @@
+import re
+import unicodedata
+
+import numpy as np
+
+#* 問句中的篩選語法 (全形符號會先轉半形)：
+#*   價格  <1000元、<=1000元、>500元、500-1000元、1000元以下 / 以內、500元以上
+#*   評分  評分>4、評分>=4.5、4星以上
+#*   分類  分類:投資理財 (多個分類以逗號分隔)
+PRICE_RANGE_PATTERN = re.compile(r"(\d+)\s*[-~]\s*(\d+)\s*元")
+PRICE_COMPARE_PATTERN = re.compile(r"(<=|>=|≦|≧|<|>)\s*(\d+)\s*元")
+PRICE_SUFFIX_PATTERN = re.compile(r"(\d+)\s*元\s*(以下|以內|以上)")
+RATING_COMPARE_PATTERN = re.compile(r"評分\s*(<=|>=|≦|≧|<|>)\s*(\d+(?:\.\d+)?)")
+RATING_SUFFIX_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(?:星|分)以上")
+CATEGORY_PATTERN = re.compile(r"分類\s*:\s*([^\s]+)")
+
+OPERATORS = {"<": "$lt", "<=": "$lte", "≦": "$lte", ">": "$gt", ">=": "$gte", "≧": "$gte",
+             "以下": "$lte", "以內": "$lte", "以上": "$gte"}
+
+
+class QueryFilters:
+    # === 結構化篩選條件 ===
+    #* conditions 為 (欄位, 運算子, 值) 的 tuple，運算子沿用 Chroma where 語法；可作為快取 key
+
+    def __init__(self, conditions=()):
+        self.conditions = tuple(conditions)
+
+    def __bool__(self):
+        return bool(self.conditions)
+
+    def __eq__(self, other):
+        return isinstance(other, QueryFilters) and self.conditions == other.conditions
+
+    def __hash__(self):
+        return hash(self.conditions)
+
+    def __repr__(self):
+        return f"QueryFilters({list(self.conditions)})"
+
+    def where(self):
+        #* 轉成 Chroma collection.query 的 where 參數
+        clauses = [{field: {op: list(value) if op == "$in" else value}} for field, op, value in self.conditions]
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def parse_query(text):
+    #* 從問句中取出篩選條件，回傳 (去除條件後的問句, QueryFilters)
+    text = unicodedata.normalize("NFKC", text or "")
+    conditions = []
+
+    def take(pattern, build):
+        nonlocal text
+        for match in pattern.finditer(text):
+            conditions.extend(build(match))
+        text = pattern.sub(" ", text)
+
+    take(PRICE_RANGE_PATTERN, lambda m: [("price", "$gte", int(m.group(1))), ("price", "$lte", int(m.group(2)))])
+    take(PRICE_COMPARE_PATTERN, lambda m: [("price", OPERATORS[m.group(1)], int(m.group(2)))])
+    take(PRICE_SUFFIX_PATTERN, lambda m: [("price", OPERATORS[m.group(2)], int(m.group(1)))])
+    take(RATING_COMPARE_PATTERN, lambda m: [("rating", OPERATORS[m.group(1)], float(m.group(2)))])
+    take(RATING_SUFFIX_PATTERN, lambda m: [("rating", "$gte", float(m.group(1)))])
+    take(CATEGORY_PATTERN, lambda m: [("category", "$in", tuple(c for c in m.group(1).split(",") if c))])
+
+    question = " ".join(text.split())
+    return question, QueryFilters(conditions)
+
+
+class MetadataFilterIndex:
+    # === 預先建好的 metadata 篩選索引 ===
+    #* 分類：每個值一個布林 bitmap；數值欄位：排序後的值 + 對應位置，範圍查詢只需 searchsorted
+    #* 查詢時直接得到候選 bitmap，不需要多取結果再用 Python 逐筆過濾
+
+    def __init__(self, metadatas, categorical=("category",), numeric=("price", "rating")):
+        self.size = len(metadatas)
+        self.categories = {}
+        self.sorted_values = {}
+
+        for field in categorical:
+            bitmaps = {}
+            for position, meta in enumerate(metadatas):
+                value = (meta or {}).get(field)
+                bitmaps.setdefault(value, np.zeros(self.size, dtype=bool))[position] = True
+            self.categories[field] = bitmaps
+
+        for field in numeric:
+            values = np.array([self._to_float((meta or {}).get(field)) for meta in metadatas], dtype=np.float64)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind="stable")]
+            self.sorted_values[field] = (values[order], order)
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def _range(self, field, op, value):
+        values, order = self.sorted_values[field]
+        if op == "$lt":
+            selected = order[:np.searchsorted(values, value, side="left")]
+        elif op == "$lte":
+            selected = order[:np.searchsorted(values, value, side="right")]
+        elif op == "$gt":
+            selected = order[np.searchsorted(values, value, side="right"):]
+        elif op == "$gte":
+            selected = order[np.searchsorted(values, value, side="left"):]
+        else:
+            lo, hi = np.searchsorted(values, value, side="left"), np.searchsorted(values, value, side="right")
+            selected = order[lo:hi]
+
+        bitmap = np.zeros(self.size, dtype=bool)
+        bitmap[selected] = True
+        return bitmap
+
+    def mask(self, filters):
+        #* 回傳符合全部條件的布林 bitmap；沒有條件時回傳 None
+        if not filters:
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+        for field, op, value in filters.conditions:
+            if field in self.categories:
+                bitmaps = self.categories[field]
+                values = value if op == "$in" else (value,)
+                bitmap = np.zeros(self.size, dtype=bool)
+                for v in values:
+                    if v in bitmaps:
+                        bitmap |= bitmaps[v]
+            else:
+                bitmap = self._range(field, op, value)
+            mask &= bitmap
+        return mask
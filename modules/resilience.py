@@ -0,0 +1,185 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from modules.metrics import metrics
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REPLY_TOKEN_TTL = 60.0              #? 秒，LINE reply token 的有效時間；超過此值的時間差視為時鐘誤差
+
+
+class DependencyUnavailable(Exception):
+    #* 相依服務 (OpenAI / Chroma) 無法在期限內回應，呼叫端應改用降級結果
+    pass
+
+class CircuitOpenError(DependencyUnavailable):
+    pass
+
+class DeadlineExceeded(DependencyUnavailable):
+    pass
+
+
+class Deadline:
+    # === 請求的截止時間 (monotonic) ===
+
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    @classmethod
+    def from_event(cls, timestamp_ms, budget):
+        #* 以 webhook 事件時間扣掉已經花掉的時間 (含排隊)，剩下的才是這次請求可用的預算
+        elapsed = time.time() - timestamp_ms / 1000
+        if not 0 <= elapsed <= REPLY_TOKEN_TTL:
+            elapsed = 0.0
+        return cls(budget - elapsed)
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def timeout(self, limit=None):
+        remaining = self.remaining()
+        return remaining if limit is None else min(limit, remaining)
+
+
+_scope = threading.local()
+
+@contextmanager
+def deadline_scope(deadline):
+    #* 同一執行緒內的相依呼叫自動套用請求的截止時間 (批次執行緒由 Config._process_batch 套用同批最晚的截止時間)
+    previous = getattr(_scope, "deadline", None)
+    _scope.deadline = deadline or previous
+    try:
+        yield
+    finally:
+        _scope.deadline = previous
+
+def current_deadline():
+    return getattr(_scope, "deadline", None)
+
+
+class CircuitBreaker:
+    # === 斷路器 ===
+    #* closed：正常放行，連續失敗 failure_threshold 次後 open
+    #* open：直接拒絕，reset_timeout 秒後進入 half-open
+    #* half-open：只放行一個試探請求，成功即 closed，失敗重新 open
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half-open"
+                self._probing = False
+
+            if self.state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("%s 斷路器恢復 (closed)", self.name)
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                    logger.warning("%s 斷路器開啟 (連續失敗 %d 次)", self.name, self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self):
+        return {
+            "open": int(self.state != "closed"),
+            "failures": self.failures,
+            "opens": self.opens,
+            "rejected": self.rejected
+        }
+
+
+class Dependency:
+    # === 相依服務呼叫：斷路器 + 逾時 ===
+    #* 呼叫在背景執行緒執行，呼叫端最多等 min(timeout, 請求剩餘時間)；逾時的呼叫留在背景跑完後丟棄
+    #* 執行緒池延遲建立，fork 之後重建
+
+    def __init__(self, name, timeout, failure_threshold=5, reset_timeout=30.0, max_workers=8):
+        self.name = name
+        self.timeout = timeout              #? 秒，單次呼叫的上限
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+        self.max_workers = max_workers
+
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+                self._pid = os.getpid()
+        return self._executor
+
+    def call(self, func, *args, **kwargs):
+        #* 先檢查時間預算再詢問斷路器：half-open 時 allow() 會佔用唯一的試探名額，不能沒送出呼叫就離開
+        deadline = current_deadline()
+        timeout = deadline.timeout(self.timeout) if deadline is not None else self.timeout
+        if timeout <= 0:
+            raise DeadlineExceeded(f"{self.name} 請求時間預算已用完")
+
+        if not self.breaker.allow():
+            metrics.inc(f"{self.name}_rejected")
+            raise CircuitOpenError(f"{self.name} 斷路器開啟中")
+
+        self.calls += 1
+        future = self._pool().submit(func, *args, **kwargs)
+        try:
+            result = future.result(timeout=timeout)
+        except FutureTimeout:
+            self.timeouts += 1
+            self.breaker.record_failure()
+            metrics.inc(f"{self.name}_timeout")
+            raise DeadlineExceeded(f"{self.name} 逾時 ({timeout * 1000:.0f} ms)")
+        except Exception as e:
+            self.errors += 1
+            self.breaker.record_failure()
+            metrics.inc(f"{self.name}_error")
+            raise DependencyUnavailable(f"{self.name} 失敗: {e}") from e
+
+        self.breaker.record_success()
+        return result
+
+    def stats(self):
+        return dict(self.breaker.stats(), calls=self.calls, timeouts=self.timeouts, errors=self.errors)
@@ -0,0 +1,136 @@
+import random
+import threading
+
+import numpy as np
+
+
+class SemanticCache:
+    # === 語意相近問句快取 ===
+    #* 保存最近回答過的問句向量 (正規化後的 float32 環狀緩衝區)，新問句與其中某筆的 cosine 相似度
+    #* 超過 threshold 時直接沿用該筆的 top-k 結果，省下一次向量檢索
+
+    def __init__(self, capacity=512, threshold=0.92, audit_rate=0.0):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.audit_rate = audit_rate        #? 命中時抽樣重新檢索，檢查是否誤用
+
+        self.matrix = None
+        self.keys = [None] * capacity
+        self.results = [None] * capacity
+        self.count = 0
+        self.cursor = 0
+        self.version = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.audits = 0
+        self.false_reuse = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _reset(self, version):
+        self.matrix = None
+        self.keys = [None] * self.capacity
+        self.results = [None] * self.capacity
+        self.count = 0
+        self.cursor = 0
+        self.version = version
+
+    def lookup(self, embedding, key, version=None):
+        #* key 為需完全相同的條件 (例如 n_results、collection)；回傳 (結果, 相似度) 或 (None, 相似度)
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+
+            #* 先以 key 篩選，只在條件相同的問句中找最相近的一筆；否則最相近的若剛好是其他條件就會錯失命中
+            rows = [i for i in range(self.count) if self.keys[i] == key]
+            if not rows or self.matrix.shape[1] != vector.shape[0]:
+                self.misses += 1
+                return None, 0.0
+
+            sims = self.matrix[rows] @ vector
+            best = int(np.argmax(sims))
+            similarity = float(sims[best])
+
+            if similarity >= self.threshold:
+                self.hits += 1
+                return self.results[rows[best]], similarity
+
+            self.misses += 1
+            return None, similarity
+
+    def add(self, embedding, key, result, version=None):
+        vector = self._normalize(embedding)
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+
+            if self.matrix is None or self.matrix.shape[1] != vector.shape[0]:
+                self.matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self.count = 0
+                self.cursor = 0
+
+            if self.count == self.capacity:
+                self.evictions += 1
+            else:
+                self.count += 1
+
+            self.matrix[self.cursor] = vector
+            self.keys[self.cursor] = key
+            self.results[self.cursor] = result
+            self.cursor = (self.cursor + 1) % self.capacity
+
+    def should_audit(self):
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record_audit(self, reused, actual, same=None):
+        #* same(reused, actual) 判斷兩份結果是否一致，預設直接比較
+        self.audits += 1
+        if not (same(reused, actual) if same else reused == actual):
+            self.false_reuse += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": self.count,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "audits": self.audits,
+            "false_reuse": self.false_reuse,
+            "hit_ratio": self.hits / total if total else 0.0
+        }
+
+
+def replay(embeddings, answers, thresholds, capacity=512, same=None):
+    #* 離線重播記錄下來的問句：embeddings / answers 為依時間順序的問句向量與實際檢索結果
+    #* 回傳每個門檻的命中率與誤用率，用於調整 threshold
+    report = []
+    for threshold in thresholds:
+        cache = SemanticCache(capacity=capacity, threshold=threshold)
+        false_reuse = 0
+
+        for embedding, answer in zip(embeddings, answers):
+            reused, _ = cache.lookup(embedding, None)
+            if reused is None:
+                cache.add(embedding, None, answer)
+            elif not (same(reused, answer) if same else reused == answer):
+                false_reuse += 1
+
+        report.append({
+            "threshold": threshold,
+            "hit_ratio": cache.hits / len(answers) if answers else 0.0,
+            "false_reuse_ratio": false_reuse / cache.hits if cache.hits else 0.0,
+            "hits": cache.hits,
+            "false_reuse": false_reuse
+        })
+
+    return report
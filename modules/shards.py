@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from modules.metrics import metrics
+from modules.vector_index import NumpyIndex
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shards(spec, default_model):
+    #* "hahow_courses_openai,sat_courses_large@text-embedding-3-large" → 每個 collection 一個 Shard
+    shards = []
+    for item in (spec or "").split(","):
+        name, _, model = item.strip().partition("@")
+        if name:
+            shards.append(Shard(name, model or default_model))
+    return shards
+
+def collection_space(collection):
+    return (collection.metadata or {}).get("hnsw:space", "l2")
+
+def normalized_distances(distances, space):
+    #* 換算成 cosine 距離 (0 ~ 2)，不同 space / 不同 collection 的結果才能放在一起排序
+    #* l2 (平方距離) 與 ip 假設向量已正規化 (OpenAI embedding 皆為單位向量)
+    if space == "l2":
+        return [d / 2.0 for d in distances]
+    return list(distances)
+
+def denormalized_distance(distance, space):
+    #* normalized_distances 的反向換算：合併後的距離換回主 collection 的尺度，與沒有 shard 時顯示的距離一致
+    return distance * 2.0 if space == "l2" else distance
+
+def merge_results(results, n_results):
+    #* results: [(collection.query 結果, space)]，第一個為主 collection
+    #* 逐個查詢依正規化距離合併成 top-k，回傳的距離為主 collection 的尺度
+    rows = len(results[0][0]["ids"])
+    primary_space = results[0][1]
+    merged = {"ids": [], "metadatas": [], "distances": []}
+
+    for row in range(rows):
+        candidates = []
+        for result, space in results:
+            distances = normalized_distances(result["distances"][row], space)
+            candidates.extend(zip(distances, result["ids"][row], result["metadatas"][row]))
+
+        seen = set()
+        top = []
+        for dist, doc_id, meta in sorted(candidates, key=lambda c: c[0]):
+            if doc_id not in seen:
+                seen.add(doc_id)
+                top.append((dist, doc_id, meta))
+            if len(top) == n_results:
+                break
+
+        merged["ids"].append([doc_id for _, doc_id, _ in top])
+        merged["metadatas"].append([meta for _, _, meta in top])
+        merged["distances"].append([denormalized_distance(dist, primary_space) for dist, _, _ in top])
+
+    return merged
+
+
+class PartialResult(dict):
+    # === 有 shard 逾時或失敗時的推薦結果 ===
+    #* 內容與一般結果相同 (可直接回覆)，但只是部分課程來源的 top-k，不寫入推薦快取與語意快取
+    pass
+
+
+class Shard:
+    # === 額外的課程來源 collection (其他平台，或以其他 embedding 模型建立) ===
+
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.collection = None
+        self.index = None
+        self.space = "l2"
+
+        self.queries = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def connect(self, db_client, backend="chroma", index_options=None):
+        #* collection 不存在時不丟例外，查詢時略過這個 shard
+        if self.name not in [c.name for c in db_client.list_collections()]:
+            print(f"❌ 找不到 shard collection: {self.name}")
+            return False
+
+        self.collection = db_client.get_collection(name=self.name)
+        self.space = collection_space(self.collection)
+        #* numpy / snapshot 後端把 shard 也載入記憶體：gunicorn preload 時 worker 直接沿用，不必在 fork 後重開 Chroma
+        #? chromadb 的連線在 master 使用過後，fork 出的 worker 再開啟會卡住
+        if backend in ("numpy", "snapshot") and self.index is None:
+            self.index = NumpyIndex.from_collection(self.collection, **(index_options or {}))
+            print(f"✅ 已載入 shard NumPy 索引: {self.name} ({len(self.index)} 筆課程)")
+        return True
+
+    @property
+    def available(self):
+        return self.collection is not None or self.index is not None
+
+    def query(self, embeddings, n_results, filters=None):
+        with metrics.timer(f"shard_{self.name}"):
+            if self.index is not None:
+                return self.index.query(embeddings, n_results=n_results, filters=filters)
+
+            return self.collection.query(
+                query_embeddings=embeddings,
+                n_results=n_results,
+                where=filters.where() if filters else None
+            )
+
+
+class ShardFanOut:
+    # === 平行查詢多個 shard，逾時或失敗的 shard 直接略過 ===
+    #* 執行緒池延遲到第一次查詢才建立，fork 之後重建
+
+    def __init__(self, shards, timeout=1.0):
+        self.shards = shards
+        self.timeout = timeout              #? 秒，從送出查詢開始計算
+
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=max(len(self.shards), 1),
+                                                    thread_name_prefix="shard")
+                self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, calls):
+        #* calls: {shard: 無參數函式}；回傳 (futures, 截止時間)
+        pool = self._pool()
+        futures = {shard: pool.submit(call) for shard, call in calls.items()}
+        return futures, time.monotonic() + self.timeout
+
+    def collect(self, futures, deadline):
+        #* 等到截止時間為止，回傳已完成的 {shard: 結果}；未完成的查詢留在背景跑完後丟棄
+        wait(list(futures.values()), timeout=max(deadline - time.monotonic(), 0.0))
+
+        results = {}
+        for shard, future in futures.items():
+            shard.queries += 1
+            if not future.done():
+                shard.timeouts += 1
+                metrics.inc("shard_timeout")
+                logger.warning("shard %s 查詢逾時 (%.0f ms)", shard.name, self.timeout * 1000)
+            elif future.exception() is not None:
+                shard.errors += 1
+                metrics.inc("shard_error")
+                logger.warning("shard %s 查詢失敗: %s", shard.name, future.exception())
+            else:
+                results[shard] = future.result()
+        return results
+
+    def stats(self):
+        stats = {}
+        for shard in self.shards:
+            stats[f"{shard.name}_available"] = int(shard.available)
+            stats[f"{shard.name}_queries"] = shard.queries
+            stats[f"{shard.name}_timeouts"] = shard.timeouts
+            stats[f"{shard.name}_errors"] = shard.errors
+        return stats
@@ -0,0 +1,232 @@
+from contextlib import contextmanager
+from modules.lexical_index import LexicalIndex
+from modules.metrics import metrics
+from modules.vector_index import NumpyIndex
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# === 不可變的索引快照 ===
+#* 建庫腳本把向量 (.npy，可 memory-map) 與 metadata 寫進以版本命名的目錄，全部寫完才原子地替換 manifest
+#* 服務端在背景監看 manifest：新版本載入、預熱完成後才替換使用中的快照，不需重啟
+#* 進行中的請求固定 (pin) 在開始時的快照；舊快照沒有請求引用後即被回收，memory map 隨之釋放
+
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.json"
+LEXICAL_FILE = "lexical.json"
+
+
+def snapshot_root(chroma_dir, collection_name):
+    return os.path.join(chroma_dir, "snapshots", collection_name)
+
+def manifest_path(chroma_dir, collection_name):
+    return os.path.join(chroma_dir, f"{collection_name}.snapshot.json")
+
+def read_manifest(chroma_dir, collection_name):
+    try:
+        with open(manifest_path(chroma_dir, collection_name), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# === 建庫端：發佈快照 ===
+def publish_snapshot(collection, chroma_dir, version, lexical=None, keep=3):
+    #* 從 collection 匯出全部課程；lexical 為 LexicalIndexBuilder，一併放進同一版本讓兩種索引同時切換
+    data = collection.get(include=["embeddings", "documents", "metadatas"])
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+
+    matrix = np.asarray(data["embeddings"], dtype=np.float32)
+    matrix = matrix.reshape(len(data["ids"]), -1) if len(data["ids"]) else np.zeros((0, 0), dtype=np.float32)
+    if space == "cosine":
+        #? 先正規化，服務端載入時不用再複製一份矩陣
+        matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+    root = snapshot_root(chroma_dir, collection.name)
+    path = os.path.join(root, version)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    np.save(os.path.join(tmp_path, VECTORS_FILE), np.ascontiguousarray(matrix, dtype=np.float32))
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": data["ids"], "documents": data["documents"], "metadatas": data["metadatas"]},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    if lexical is not None:
+        lexical.save(os.path.join(tmp_path, LEXICAL_FILE))
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+    manifest = {
+        "version": version,
+        "path": os.path.relpath(path, chroma_dir),
+        "count": int(matrix.shape[0]),
+        "dim": int(matrix.shape[1]),
+        "space": space,
+        "normalized": space == "cosine",
+        "lexical": lexical is not None,
+        "created_at": time.time()
+    }
+    manifest_file = manifest_path(chroma_dir, collection.name)
+    with open(f"{manifest_file}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+
+    prune_snapshots(root, keep, current=version)
+    return manifest
+
+def prune_snapshots(root, keep, current):
+    #* 只保留最新的 keep 個版本；仍被服務端 map 住的舊檔刪除後，分頁在解除 map 前依然有效
+    versions = sorted((name for name in os.listdir(root)
+                       if name != current and not name.endswith(".tmp") and os.path.isdir(os.path.join(root, name))),
+                      key=lambda name: os.path.getmtime(os.path.join(root, name)), reverse=True)
+    for name in versions[max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+# === 服務端：載入與切換 ===
+class IndexSnapshot:
+    # === 同一版本的向量索引 + 詞彙索引，建立後不再修改 ===
+
+    def __init__(self, version="", index=None, lexical_index=None):
+        self.version = version
+        self.index = index
+        self.lexical_index = lexical_index
+
+    def replace(self, **changes):
+        fields = {"version": self.version, "index": self.index, "lexical_index": self.lexical_index}
+        fields.update(changes)
+        return IndexSnapshot(**fields)
+
+    @classmethod
+    def load(cls, chroma_dir, manifest, lexical=True, index_options=None):
+        path = os.path.join(chroma_dir, manifest["path"])
+        matrix = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+
+        index = NumpyIndex(meta["ids"], matrix, meta["documents"], meta["metadatas"],
+                           space=manifest["space"], normalized=manifest.get("normalized", False),
+                           **(index_options or {}))
+        lexical_index = None
+        if lexical and manifest.get("lexical"):
+            lexical_index = LexicalIndex.load(os.path.join(path, LEXICAL_FILE))
+        return cls(manifest["version"], index, lexical_index)
+
+    def warm(self, n_results):
+        #* 切換前先跑一次查詢，讓向量分頁進到 page cache，第一個請求不用等磁碟
+        if self.index is not None and len(self.index):
+            self.index.query(np.zeros((1, self.index.matrix.shape[1]), dtype=np.float32), n_results)
+
+
+class SnapshotManager:
+    # === 使用中的快照 (單一參考，替換即為原子操作) + 背景監看 manifest ===
+    #* get() 回傳使用中的版本，可直接作為推薦快取的目錄版本
+
+    def __init__(self, chroma_dir, collection_name, check_interval=2.0, lexical=True, n_results=3, index_options=None):
+        self.chroma_dir = chroma_dir
+        self.collection_name = collection_name
+        self.check_interval = check_interval
+        self.lexical = lexical
+        self.n_results = n_results
+        self.index_options = index_options or {}
+
+        self.active = IndexSnapshot()
+        self.loads = 0
+        self.failures = 0
+        self._failed_version = None
+        self._retired = weakref.WeakSet()   #? 已被替換、但仍有請求引用的舊快照
+
+        self._pinned = threading.local()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def get(self):
+        return self.active.version
+
+    def current(self):
+        return getattr(self._pinned, "snapshot", None) or self.active
+
+    @contextmanager
+    def pin(self):
+        #* 同一個請求 (批次) 內固定使用同一個快照，中途切換版本不影響進行中的查詢
+        if getattr(self._pinned, "snapshot", None) is not None:
+            yield self._pinned.snapshot
+            return
+
+        self._pinned.snapshot = self.active
+        try:
+            yield self._pinned.snapshot
+        finally:
+            self._pinned.snapshot = None
+
+    def swap(self, snapshot):
+        with self._lock:
+            previous, self.active = self.active, snapshot
+        if previous.index is not None or previous.lexical_index is not None:
+            self._retired.add(previous)
+
+    def refresh(self):
+        #* manifest 有新版本時載入、預熱後切換；失敗時保留目前的快照，同一版本不再重試
+        manifest = read_manifest(self.chroma_dir, self.collection_name)
+        if manifest is None or manifest["version"] in (self.active.version, self._failed_version):
+            return False
+
+        start = time.perf_counter()
+        try:
+            snapshot = IndexSnapshot.load(self.chroma_dir, manifest, lexical=self.lexical, index_options=self.index_options)
+            snapshot.warm(self.n_results)
+        except Exception as e:
+            self.failures += 1
+            self._failed_version = manifest["version"]
+            metrics.inc("snapshot_load_error")
+            logger.warning("索引快照 %s 載入失敗: %s", manifest["version"], e)
+            return False
+
+        self.swap(snapshot)
+        self.loads += 1
+        metrics.observe("snapshot_load", time.perf_counter() - start)
+        print(f"✅ 已切換索引快照: {snapshot.version} ({len(snapshot.index)} 筆課程)")
+        return True
+
+    def start(self):
+        #* 背景執行緒不會跟著 fork，依 pid 在每個 worker 重新啟動
+        #* (gunicorn preload 時 master 也會持續更新，之後重生的 worker 直接繼承最新快照)
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning("檢查索引快照失敗: %s", e)
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "loads": self.loads,
+            "load_failures": self.failures,
+            "retired_alive": len(self._retired),
+            "count": len(self.active.index) if self.active.index is not None else 0
+        }
@@ -0,0 +1,186 @@
+from modules.query_filters import MetadataFilterIndex
+
+import numpy as np
+
+QUANTIZED_DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+
+class QuantizedMatrix:
+    # === 第一階段掃描用的壓縮向量 ===
+    #* float16 每維 2 bytes；int8 每維 1 byte，每個向量另存一個 scale (max|x| / 127)
+    #* dimensions 只取前 N 維再正規化 (與 text-embedding-3 的 dimensions 參數相同作法)，不需重新呼叫 API
+    #* 距離只用於挑候選，最後由 NumpyIndex 以原始向量精確重排
+
+    def __init__(self, matrix, dtype="int8", dimensions=None, space="l2", sq_norms=None, block_size=1024):
+        self.dimensions = dimensions if dimensions and dimensions < matrix.shape[1] else None
+        self.space = space
+        self.sq_norms = sq_norms if space == "l2" and self.dimensions is None else None
+        self.block_size = block_size
+
+        #* 分塊轉換，memory-mapped 的原始向量不會整份複製成 float32
+        dim = self.dimensions or matrix.shape[1]
+        self.data = np.empty((len(matrix), dim), dtype=QUANTIZED_DTYPES[dtype])
+        self.scales = np.empty(len(matrix), dtype=np.float32) if dtype == "int8" else None
+        for start in range(0, len(matrix), block_size):
+            block = np.asarray(matrix[start:start + block_size, :dim], dtype=np.float32)
+            if self.dimensions:
+                block = block / np.maximum(np.linalg.norm(block, axis=1, keepdims=True), 1e-12)
+            if self.scales is not None:
+                scales = np.abs(block).max(axis=1) / 127.0
+                scales[scales == 0] = 1.0
+                block = np.round(block / scales[:, None])
+                self.scales[start:start + len(block)] = scales
+            self.data[start:start + len(block)] = block
+
+    @property
+    def nbytes(self):
+        return (self.data.nbytes
+                + (self.scales.nbytes if self.scales is not None else 0)
+                + (self.sq_norms.nbytes if self.sq_norms is not None else 0))
+
+    def _dots(self, queries, rows=None):
+        data = self.data if rows is None else self.data[rows]
+        out = np.empty((len(queries), len(data)), dtype=np.float32)
+        if data.dtype == np.float32:
+            np.matmul(queries, data.T, out=out)
+        else:
+            #* 逐塊轉回 float32 再做矩陣乘法，暫存區重複使用，不會配置整份 float32 矩陣
+            scratch = np.empty((min(self.block_size, len(data)), data.shape[1]), dtype=np.float32)
+            for start in range(0, len(data), self.block_size):
+                block = data[start:start + self.block_size]
+                np.copyto(scratch[:len(block)], block, casting="unsafe")
+                np.matmul(queries, scratch[:len(block)].T, out=out[:, start:start + len(block)])
+
+        if self.scales is not None:
+            out *= self.scales[None, :] if rows is None else self.scales[rows][None, :]
+        return out
+
+    def distances(self, queries, rows=None):
+        #* 近似距離，數值越小越相近
+        if self.dimensions:
+            queries = queries[:, :self.dimensions]
+        if self.dimensions or self.space == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        dots = self._dots(np.ascontiguousarray(queries, dtype=np.float32), rows)
+
+        if self.sq_norms is not None:
+            sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+            return sq_norms[None, :] - 2.0 * dots
+        return -dots
+
+
+class NumpyIndex:
+    # === 記憶體內 NumPy 向量索引 ===
+    #* 課程數量不大時，一次矩陣乘法 + argpartition 即可取得 top-k，省去 Chroma 的 SQLite / HNSW 開銷
+    #* 距離定義與 Chroma 相同 (l2 為平方距離、cosine / ip 為 1 - 相似度)，回傳格式也與 collection.query 相同
+    #* quantization / dimensions：先以壓縮向量掃描取 n_results * rerank 筆候選，再以原始向量精確重排
+
+    def __init__(self, ids, embeddings, documents, metadatas, space="l2", normalized=False,
+                 quantization=None, dimensions=None, rerank=4):
+        self.ids = list(ids)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self.space = space
+        self.filter_index = MetadataFilterIndex(self.metadatas)
+
+        #* 已是 float32 的 memory-mapped 陣列 (索引快照) 不會複製，直接使用檔案分頁
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(self.ids), -1)
+
+        if space == "cosine" and not normalized:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix = matrix / np.maximum(norms, 1e-12)
+
+        self.matrix = matrix
+        self.sq_norms = np.einsum("ij,ij->i", matrix, matrix)
+
+        self.rerank = max(int(rerank), 1)
+        self.quantized = None
+        if (quantization or dimensions) and len(self.ids):
+            self.quantized = QuantizedMatrix(matrix, quantization or "float32", dimensions,
+                                             space=space, sq_norms=self.sq_norms)
+
+    @classmethod
+    def from_collection(cls, collection, **options):
+        data = collection.get(include=["embeddings", "documents", "metadatas"])
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        return cls(data["ids"], data["embeddings"], data["documents"], data["metadatas"], space=space, **options)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def embeddings(self, ids):
+        return self.matrix[[self.positions[doc_id] for doc_id in ids]]
+
+    def _distances(self, queries, rows=None):
+        #* rows 為篩選後的候選位置，只對這些向量計算距離
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        sq_norms = self.sq_norms if rows is None else self.sq_norms[rows]
+
+        if self.space == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.maximum(norms, 1e-12)
+            return 1.0 - queries @ matrix.T
+
+        if self.space == "ip":
+            return 1.0 - queries @ matrix.T
+
+        #* ||q - x||^2 = ||x||^2 - 2 q·x + ||q||^2
+        q_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+        return np.maximum(sq_norms[None, :] - 2.0 * (queries @ matrix.T) + q_norms, 0.0)
+
+    def _top_k(self, distances, k):
+        if k >= distances.shape[1]:
+            return np.argsort(distances, axis=1)
+
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(distances, candidates, axis=1).argsort(axis=1)
+        return np.take_along_axis(candidates, order, axis=1)
+
+    def query(self, query_embeddings, n_results=3, filters=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+
+        #* 篩選條件先由 bitmap 取得候選位置，再只在候選中計算距離
+        mask = self.filter_index.mask(filters)
+        rows = None if mask is None else np.flatnonzero(mask)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if len(self.ids) == 0 or (rows is not None and len(rows) == 0):
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        if self.quantized is not None:
+            top_positions, top_distances = self._rerank(queries, rows, n_results)
+        else:
+            distances = self._distances(queries, rows)
+            top = self._top_k(distances, n_results)
+            top_positions = top if rows is None else rows[top]
+            top_distances = np.take_along_axis(distances, top, axis=1)
+
+        for positions, distances in zip(top_positions, top_distances):
+            result["ids"].append([self.ids[i] for i in positions])
+            result["documents"].append([self.documents[i] for i in positions])
+            result["metadatas"].append([self.metadatas[i] for i in positions])
+            result["distances"].append([float(d) for d in distances])
+
+        return result
+
+    def _rerank(self, queries, rows, n_results):
+        #* 壓縮向量取候選 → 只對候選讀取原始向量計算精確距離 (memory-mapped 時只會讀到候選的分頁)
+        approx = self.quantized.distances(queries, rows)
+        candidates = self._top_k(approx, min(n_results * self.rerank, approx.shape[1]))
+        if rows is not None:
+            candidates = rows[candidates]
+
+        top_positions, top_distances = [], []
+        for query, positions in zip(queries, candidates):
+            exact = self._distances(query[None, :], positions)[0]
+            order = np.argsort(exact, kind="stable")[:n_results]
+            top_positions.append(positions[order])
+            top_distances.append(exact[order])
+        return top_positions, top_distances
@@ -0,0 +1,86 @@
+from modules.metrics import metrics
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EventDispatcher:
+    # === Webhook 事件佇列 + 背景 worker ===
+    #* /callback 只負責驗簽與入列，embedding / 檢索 / 回覆交給 worker 執行
+
+    def __init__(self, handle_func, workers=4, max_queue_size=256):
+        self.handle_func = handle_func
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+        #* 背壓指標
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def start(self):
+        #* 延遲到第一次入列才啟動執行緒，避免 gunicorn preload 時在 fork 前建立 thread
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.workers):
+                t = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, event):
+        if len(self._threads) < self.workers:
+            self.start()
+
+        try:
+            self._queue.put_nowait((event, time.monotonic()))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning("Webhook 佇列已滿 (%d)，丟棄事件", self.max_queue_size)
+            return False
+
+        self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            event, enqueued_at = self._queue.get()
+            wait_time = time.monotonic() - enqueued_at
+            self.wait_time_total += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+            metrics.observe("webhook_queue_wait", wait_time)
+
+            try:
+                self.handle_func(event)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("處理 webhook 事件失敗")
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+    def stats(self):
+        started = self.processed + self.failed
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self.max_queue_size,
+            "workers": len(self._threads),
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_time_avg": self.wait_time_total / started if started else 0.0,
+            "wait_time_max": self.wait_time_max
+        }